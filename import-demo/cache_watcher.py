@@ -0,0 +1,377 @@
+"""
+查找缓存的主动失效 (Cache Watcher)
+================================
+
+`import_caches.DirectoryListingCache`默认每次查找都要`stat`一次目录，比较mtime判断缓存是否有效。
+这意味着每次导入、每个路径条目都要付出一次系统调用；而且mtime的精度有限，
+同一时间片内的两次修改可能被漏掉，在热重载的开发环境中尤其明显。
+
+本模块提供两种监视器，把"每次查找都去校验"改成"变化时主动推送失效":
+
+- `InotifyWatcher`: Linux上通过`ctypes`调用inotify。目录中有文件创建、删除、改名时
+  使目录列表缓存失效；文件被修改时使对应的编译结果缓存失效。事件几乎实时到达。
+- `PollingWatcher`: 非Linux平台或inotify不可用时的回退方案，后台线程定期比较目录的
+  mtime/inode/链接数。它只能发现目录内容的变化，因此编译结果缓存仍然逐次校验。
+
+缓存第一次列出某个目录时会自动请求监视它，所以`sys.path`中的目录和包的`__path__`目录
+都会被覆盖。之后对这些目录的查找只是一次字典读取，没有任何系统调用。
+目录开始被监视时，之前缓存的该目录列表和其中文件的编译结果都会被丢弃:
+在此之前的修改没有事件推送，只能重新校验一次。
+
+如何使用:
+    import cache_watcher
+    watcher = cache_watcher.install_cache_watcher()      # 自动选择inotify或轮询
+    watcher.watch_paths(sys.path)                        # 可选: 预先监视所有路径
+    ...
+    cache_watcher.uninstall_cache_watcher()
+
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+from fork_safety import register_after_fork
+from import_caches import SHARED_DIRECTORY_CACHE, SHARED_BYTECODE_CACHE
+
+# inotify事件位，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 改变目录列表的事件
+LISTING_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+# 改变文件内容的事件
+CONTENT_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB
+WATCH_MASK = LISTING_EVENTS | CONTENT_EVENTS | IN_ONLYDIR
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+_installed = {'watcher': None}
+
+
+def _load_libc():
+    """加载支持inotify的libc，不可用时返回None。"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class _BaseWatcher:
+    """监视器公共部分: 记录被监视的目录，并把失效通知推送给缓存。"""
+
+    # 能否推送文件内容的变化。为True时编译结果缓存命中也无需stat。
+    reports_file_changes = False
+
+    def __init__(self, directory_cache, bytecode_cache):
+        self.directory_cache = directory_cache
+        self.bytecode_cache = bytecode_cache
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'watched': 0, 'events': 0, 'invalidations': 0}
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        """子进程中没有监视线程，从缓存上卸下自己，缓存回到逐次stat校验(已缓存的内容保留)。"""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stop.set()
+        self._thread = None
+        if self.directory_cache.watcher is self:
+            self.directory_cache.watcher = None
+        if self.bytecode_cache.watcher is self:
+            self.bytecode_cache.watcher = None
+        if _installed['watcher'] is self:
+            _installed['watcher'] = None
+
+    def is_watching(self, path):
+        raise NotImplementedError
+
+    def watch(self, path):
+        raise NotImplementedError
+
+    def watch_paths(self, paths):
+        """预先监视一组目录，例如`sys.path`。"""
+        for path in paths:
+            self.watch(path or '.')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _invalidate_directory(self, path):
+        self.stats['invalidations'] += 1
+        self.directory_cache.invalidate(path)
+
+    def _invalidate_file(self, filepath):
+        self.stats['invalidations'] += 1
+        self.bytecode_cache.invalidate(filepath)
+
+    def _forget_unwatched_state(self, path):
+        """
+        目录刚开始被监视。之前缓存的列表和编译结果是在没有事件推送时校验的，
+        之间发生的修改不会再有通知，丢弃它们，下次查找重新校验一次。
+        """
+        self.directory_cache.invalidate(path)
+        self.bytecode_cache.invalidate_directory(path)
+
+    def _run(self):
+        raise NotImplementedError
+
+
+class InotifyWatcher(_BaseWatcher):
+    """基于Linux inotify的监视器，目录和文件的变化都会实时推送。"""
+
+    reports_file_changes = True
+
+    def __init__(self, directory_cache=SHARED_DIRECTORY_CACHE,
+                 bytecode_cache=SHARED_BYTECODE_CACHE, libc=None):
+        super().__init__(directory_cache, bytecode_cache)
+        self._libc = libc or _load_libc()
+        if self._libc is None:
+            raise OSError("当前平台不支持inotify")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        # 用一个管道唤醒阻塞在select上的后台线程
+        self._wake_r, self._wake_w = os.pipe()
+        self._paths = {}  # wd -> path
+        self._watched = {}  # path -> wd
+        # 监视失败的目录(例如超出max_user_watches)，它们继续使用stat校验
+        self._unwatchable = set()
+
+    def _reinit_after_fork(self):
+        super()._reinit_after_fork()
+        # inotify实例和唤醒管道与父进程共享，只关闭子进程中的这一份，不能读也不能写。
+        if self._fd >= 0:
+            for fd in (self._fd, self._wake_r, self._wake_w):
+                os.close(fd)
+            self._fd = self._wake_r = self._wake_w = -1
+
+    def is_watching(self, path):
+        return path in self._watched
+
+    def watch(self, path):
+        if path in self._watched or path in self._unwatchable:
+            return
+        with self._lock:
+            if path in self._watched:
+                return
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                self._unwatchable.add(path)
+                return
+            self._paths[wd] = path
+            self._watched[path] = wd
+            self.stats['watched'] = len(self._watched)
+        self._forget_unwatched_state(path)
+
+    def stop(self):
+        if self._fd < 0:
+            return  # 已经停止，或fork后在子进程中已经关闭
+        self._stop.set()
+        os.write(self._wake_w, b'x')
+        super().stop()
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            os.close(fd)
+        self._fd = self._wake_r = self._wake_w = -1
+
+    def _run(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd, self._wake_r], [], [])
+            if self._fd not in readable:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            self._dispatch(data)
+
+    def _dispatch(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            self.stats['events'] += 1
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，无法知道丢了哪些事件，只能全部失效。
+                self.directory_cache.invalidate()
+                self.bytecode_cache.invalidate()
+                continue
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                # 目录被删除或监视被移除，之后回到stat校验。
+                with self._lock:
+                    self._paths.pop(wd, None)
+                    self._watched.pop(path, None)
+                self._invalidate_directory(path)
+                continue
+            if mask & LISTING_EVENTS:
+                self._invalidate_directory(path)
+            if name:
+                # 文件被修改、替换或删除，对应的编译结果也要失效。
+                self._invalidate_file(os.path.join(path, os.fsdecode(name)))
+
+
+class PollingWatcher(_BaseWatcher):
+    """
+    定期检查目录状态的回退监视器。
+
+    比较的是目录的(mtime_ns, inode, 链接数)，任何一项变化都会使目录列表失效。
+    失效最多延迟`interval`秒；文件内容的变化仍由编译结果缓存自己的stat校验发现。
+    """
+
+    def __init__(self, directory_cache=SHARED_DIRECTORY_CACHE,
+                 bytecode_cache=SHARED_BYTECODE_CACHE, interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(directory_cache, bytecode_cache)
+        self.interval = interval
+        self._states = {}  # path -> 目录状态
+
+    @staticmethod
+    def _directory_state(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_ino, st.st_nlink
+
+    def is_watching(self, path):
+        return path in self._states
+
+    def watch(self, path):
+        if path in self._states:
+            return
+        with self._lock:
+            if path in self._states:
+                return
+            self._states[path] = self._directory_state(path)
+            self.stats['watched'] = len(self._states)
+        self._forget_unwatched_state(path)
+
+    def poll_once(self):
+        """检查一遍所有目录，返回发生变化的目录列表。"""
+        changed = []
+        for path, state in list(self._states.items()):
+            current = self._directory_state(path)
+            if current != state:
+                self._states[path] = current
+                self.stats['events'] += 1
+                self._invalidate_directory(path)
+                changed.append(path)
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll_once()
+
+
+def create_watcher(backend='auto', **options):
+    """
+    创建监视器。`backend`为`'inotify'`、`'polling'`或`'auto'`
+    (`'auto'`优先使用inotify，不可用时回退到轮询)。
+    """
+    if backend in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(**{k: v for k, v in options.items() if k != 'interval'})
+        except OSError:
+            if backend == 'inotify':
+                raise
+    return PollingWatcher(**options)
+
+
+def install_cache_watcher(backend='auto', **options):
+    """
+    创建并启动监视器，挂到它所服务的缓存上。已安装的监视器会先被卸载。
+
+    Returns:
+        监视器对象。
+    """
+    uninstall_cache_watcher()
+    watcher = create_watcher(backend, **options)
+    watcher.start()
+    watcher.directory_cache.watcher = watcher
+    watcher.bytecode_cache.watcher = watcher
+    _installed['watcher'] = watcher
+    print(f"   [WATCH] 已启用缓存监视器: {type(watcher).__name__}")
+    return watcher
+
+
+def uninstall_cache_watcher():
+    """卸载当前的监视器，缓存恢复为逐次stat校验。"""
+    watcher = _installed['watcher']
+    if watcher is None:
+        return
+    _installed['watcher'] = None
+    watcher.directory_cache.watcher = None
+    watcher.bytecode_cache.watcher = None
+    watcher.stop()
+
+
+def get_installed_watcher():
+    return _installed['watcher']
+
+
+# --- 演示区 ---
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        watcher = install_cache_watcher()
+        try:
+            print(f"初始目录列表: {sorted(SHARED_DIRECTORY_CACHE.listing(tmp))}")
+            stat_calls = SHARED_DIRECTORY_CACHE.stats['stat_calls']
+            for _ in range(1000):
+                SHARED_DIRECTORY_CACHE.listing(tmp)
+            print(f"1000次查找新增stat次数: {SHARED_DIRECTORY_CACHE.stats['stat_calls'] - stat_calls}")
+
+            with open(os.path.join(tmp, 'hot_reloaded.py'), 'w') as f:
+                f.write('VALUE = 1\n')
+            deadline = time.time() + 5
+            while 'hot_reloaded.py' not in SHARED_DIRECTORY_CACHE.listing(tmp):
+                if time.time() > deadline:
+                    break
+                time.sleep(0.01)
+            print(f"新增文件后的目录列表: {sorted(SHARED_DIRECTORY_CACHE.listing(tmp))}")
+            print(f"监视器统计: {watcher.stats}")
+        finally:
+            uninstall_cache_watcher()
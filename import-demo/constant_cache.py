@@ -0,0 +1,351 @@
+"""
+常量表缓存加载器 (Constant Cache Loader)
+======================================
+
+配置模块、查找表模块往往几乎全是大的字典/列表/元组字面量。
+模拟器的默认加载器每次导入都要解析整份源码，再执行字节码逐个构建这些常量，
+这一步在这类模块的导入时间中占了绝大部分。
+
+本模块提供`'constant_cache'`加载模式:
+1. 第一次导入时解析源码，统计顶层"常量表赋值"(`NAME = {...}` / `[...]` / `(...)`，
+   且内容全部是字面量)占源码的比例。
+2. 比例达到阈值的模块被视为"常量密集型"，其执行计划被缓存到模块旁边的
+   `<模块名>.constcache`文件中: 常量直接以`marshal`格式保存，其余语句保存为编译好的代码对象。
+3. 之后的导入直接读取缓存，按源码顺序绑定常量、执行其余代码，既不解析源码也不运行构建常量的字节码。
+   不是常量密集型的模块会记住这个结论(按源文件的mtime和大小)，之后与默认加载器一样
+   从共享的编译结果缓存中取代码对象，不再重复分析。
+   可选的`numeric_arrays=True`会把纯数值列表存成原始字节，加载为`array.array`。
+
+如何使用:
+    import constant_cache
+    from python_import_mechanism import set_loader_mode, python_import_simulation
+
+    set_loader_mode('constant_cache', ratio_threshold=0.5)
+    module = python_import_simulation('lookup_tables')
+
+直接运行本文件会在临时目录中生成合成的常量密集型模块，并对比各种加载方式的耗时。
+
+"""
+
+import array
+import ast
+import importlib.util
+import marshal
+import os
+import struct
+import sys
+import __future__
+
+from import_caches import SHARED_BYTECODE_CACHE
+from python_import_mechanism import register_loader_mode
+
+CACHE_SUFFIX = '.constcache'
+CACHE_MAGIC = b'PYCONST2'
+# 头部: 魔数 | 解释器字节码魔数 | 源文件mtime_ns | 源文件大小；
+# 之后是marshal格式的`(加载器选项, 执行计划)`，选项不同的加载器不会复用彼此的缓存。
+CACHE_HEADER = struct.Struct('<8s4sqq')
+
+# 所有`from __future__ import ...`对应的编译标志，分段编译时后面的代码对象需要继承它们。
+FUTURE_FLAGS_MASK = 0
+for _feature_name in __future__.all_feature_names:
+    FUTURE_FLAGS_MASK |= getattr(__future__, _feature_name).compiler_flag
+
+# 常量表赋值占源码的比例达到该值时，模块被视为常量密集型。
+DEFAULT_RATIO_THRESHOLD = 0.5
+# 常量表总大小低于该值时不值得缓存。
+DEFAULT_MIN_CONSTANT_BYTES = 4096
+
+CONTAINER_NODES = (ast.Dict, ast.List, ast.Tuple, ast.Set)
+
+# 分析后判定为不是常量密集型的模块: (源文件路径, 加载器选项) -> (mtime_ns, 大小)
+_plain_modules = {}
+
+
+def cache_path(filepath):
+    """缓存文件与模块放在同一目录: `tables.py` -> `tables.constcache`。"""
+    return os.path.splitext(filepath)[0] + CACHE_SUFFIX
+
+
+def _line_offsets(source):
+    """返回每一行起始位置的字节偏移，用于把AST位置换算成字节数。"""
+    offsets = [0]
+    position = source.find(b'\n')
+    while position != -1:
+        offsets.append(position + 1)
+        position = source.find(b'\n', position + 1)
+    return offsets
+
+
+def _constant_table(node):
+    """如果语句是`NAME = <容器字面量>`，返回`(name, value)`，否则返回None。"""
+    if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+        return None
+    if not isinstance(node.targets[0], ast.Name) or not isinstance(node.value, CONTAINER_NODES):
+        return None
+    try:
+        return node.targets[0].id, ast.literal_eval(node.value)
+    except (ValueError, TypeError, SyntaxError, RecursionError):
+        return None
+
+
+def analyze_constant_module(tree, source):
+    """
+    统计一个模块的顶层常量表。
+
+    Returns:
+        tuple: `(ratio, constant_bytes, tables)`。`ratio`是常量表语句占源码的比例，
+        `tables`把语句下标映射到`(name, value)`。
+    """
+    offsets = _line_offsets(source)
+    constant_bytes = 0
+    tables = {}
+    for index, node in enumerate(tree.body):
+        table = _constant_table(node)
+        if table is None:
+            continue
+        start = offsets[node.lineno - 1] + node.col_offset
+        end = offsets[node.end_lineno - 1] + node.end_col_offset
+        constant_bytes += end - start
+        tables[index] = table
+    ratio = constant_bytes / len(source) if source else 0.0
+    return ratio, constant_bytes, tables
+
+
+def _numeric_array(value):
+    """纯整数(64位以内)或纯浮点数的列表返回对应的`array.array`，否则返回None。"""
+    if not isinstance(value, list) or not value:
+        return None
+    if all(type(item) is int for item in value):
+        if all(-(1 << 63) <= item < (1 << 63) for item in value):
+            return array.array('q', value)
+    elif all(type(item) is float for item in value):
+        return array.array('d', value)
+    return None
+
+
+def build_plan(tree, tables, filepath, numeric_arrays=False):
+    """
+    按源码顺序生成执行计划:
+    - `('const', name, value)`: 直接绑定的常量。
+    - `('array', name, typecode, raw_bytes)`: 以`array.array`加载的数值列表。
+    - `('code', code_object)`: 相邻的非常量语句编译成的代码对象。
+    """
+    plan = []
+    pending = []
+    future_flags = 0
+
+    def flush():
+        nonlocal future_flags
+        if pending:
+            module = ast.Module(body=list(pending), type_ignores=[])
+            # `from __future__`只能出现在第一段里，后面各段沿用它打开的编译标志。
+            code = compile(module, filepath, 'exec', flags=future_flags, dont_inherit=True)
+            future_flags |= code.co_flags & FUTURE_FLAGS_MASK
+            plan.append(('code', code))
+            pending.clear()
+
+    for index, node in enumerate(tree.body):
+        if index not in tables:
+            pending.append(node)
+            continue
+        flush()
+        name, value = tables[index]
+        packed = _numeric_array(value) if numeric_arrays else None
+        if packed is not None:
+            plan.append(('array', name, packed.typecode, packed.tobytes()))
+        else:
+            plan.append(('const', name, value))
+    flush()
+    return plan
+
+
+def write_cache(filepath, stat_result, plan, options=()):
+    """原子地写出缓存文件。`options`是生成该计划的加载器选项。"""
+    target = cache_path(filepath)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, importlib.util.MAGIC_NUMBER,
+                                  stat_result.st_mtime_ns, stat_result.st_size))
+        marshal.dump((tuple(options), plan), f)
+    os.replace(tmp_path, target)
+    return target
+
+
+def load_cache(filepath, stat_result, options=()):
+    """读取并校验缓存；解释器版本、源文件mtime、大小或加载器选项不一致时返回None。"""
+    try:
+        with open(cache_path(filepath), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < CACHE_HEADER.size:
+        return None
+    magic, bytecode_magic, mtime_ns, size = CACHE_HEADER.unpack_from(data)
+    if (magic != CACHE_MAGIC or bytecode_magic != importlib.util.MAGIC_NUMBER
+            or mtime_ns != stat_result.st_mtime_ns or size != stat_result.st_size):
+        return None
+    recorded_options, plan = marshal.loads(memoryview(data)[CACHE_HEADER.size:])
+    if recorded_options != tuple(options):
+        return None
+    return plan
+
+
+def run_plan(plan, namespace):
+    """在模块命名空间中按顺序执行计划。"""
+    for step in plan:
+        kind = step[0]
+        if kind == 'code':
+            exec(step[1], namespace)
+        elif kind == 'const':
+            namespace[step[1]] = step[2]
+        else:
+            _, name, typecode, raw = step
+            values = array.array(typecode)
+            values.frombytes(raw)
+            namespace[name] = values
+
+
+class ConstantCacheLoader:
+    """
+    为常量密集型模块缓存常量的加载器。
+
+    Args:
+        filepath (str): 源文件路径。
+        ratio_threshold (float): 判定为常量密集型所需的常量表比例。
+        min_constant_bytes (int): 常量表总大小的下限。
+        numeric_arrays (bool): 把纯数值列表加载为`array.array`(会改变对象类型)。
+    """
+
+    def __init__(self, filepath, ratio_threshold=DEFAULT_RATIO_THRESHOLD,
+                 min_constant_bytes=DEFAULT_MIN_CONSTANT_BYTES, numeric_arrays=False):
+        self.filepath = filepath
+        self.ratio_threshold = ratio_threshold
+        self.min_constant_bytes = min_constant_bytes
+        self.numeric_arrays = numeric_arrays
+        self.last_status = None  # 'hit' / 'built' / 'plain'
+
+    @property
+    def options(self):
+        """影响缓存内容的选项，记录在缓存文件中。"""
+        return (float(self.ratio_threshold), self.min_constant_bytes, bool(self.numeric_arrays))
+
+    def create_module(self, spec):
+        return None  # 使用默认创建
+
+    def exec_module(self, module):
+        stat_result = os.stat(self.filepath)
+        verdict_key = (self.filepath, self.options)
+        if _plain_modules.get(verdict_key) == (stat_result.st_mtime_ns, stat_result.st_size):
+            # 已经分析过的普通模块，与默认加载器一样使用共享的编译结果缓存。
+            self.last_status = 'plain'
+            exec(SHARED_BYTECODE_CACHE.get_code(self.filepath), module.__dict__)
+            return
+
+        plan = load_cache(self.filepath, stat_result, self.options)
+        if plan is not None:
+            self.last_status = 'hit'
+            print(f"   [CONST] 从常量缓存加载: {cache_path(self.filepath)}")
+            run_plan(plan, module.__dict__)
+            return
+
+        with open(self.filepath, 'rb') as f:
+            source = f.read()
+        tree = ast.parse(source, self.filepath)
+        ratio, constant_bytes, tables = analyze_constant_module(tree, source)
+        if ratio < self.ratio_threshold or constant_bytes < self.min_constant_bytes:
+            # 不是常量密集型模块，记住结论，这次按普通方式执行(复用已经解析好的AST)。
+            _plain_modules[verdict_key] = (stat_result.st_mtime_ns, stat_result.st_size)
+            self.last_status = 'plain'
+            exec(compile(tree, self.filepath, 'exec', dont_inherit=True), module.__dict__)
+            return
+
+        plan = build_plan(tree, tables, self.filepath, self.numeric_arrays)
+        del tree, tables
+        try:
+            path = write_cache(self.filepath, stat_result, plan, self.options)
+            print(f"   [CONST] 常量表占比 {ratio:.0%}，已生成常量缓存: {path}")
+        except OSError as e:
+            print(f"   [WARN] 无法写入常量缓存: {e}")
+        self.last_status = 'built'
+        # 执行刚生成的计划，保证首次导入与之后的导入得到同样类型的对象。
+        run_plan(marshal.loads(marshal.dumps(plan)), module.__dict__)
+
+
+register_loader_mode('constant_cache', ConstantCacheLoader)
+
+
+# --- 基准测试区 ---
+
+def _write_synthetic_modules(directory, scale=1):
+    """生成几种典型的常量密集型模块，返回模块名列表。"""
+    modules = {
+        'synthetic_lookup_dict': (
+            'LOOKUP = {' + ', '.join(f"'key_{i}': {i}" for i in range(50000 * scale)) + '}\n'
+            'def get(key):\n    return LOOKUP.get(key)\n'
+        ),
+        'synthetic_int_table': (
+            'TABLE = [' + ', '.join(str(i * 7 % 1000003) for i in range(200000 * scale)) + ']\n'
+            'SIZE = len(TABLE)\n'
+        ),
+        'synthetic_config': (
+            'CONFIG = {' + ', '.join(
+                f"'service_{i}': {{'host': 'h{i}.internal', 'port': {8000 + i}, "
+                f"'tags': ('a', 'b', {i}), 'weights': [{i}.5, {i}.25]}}"
+                for i in range(10000 * scale)) + '}\n'
+            'ENABLED = tuple(sorted(CONFIG))\n'
+        ),
+    }
+    for name, source in modules.items():
+        with open(os.path.join(directory, name + '.py'), 'w', encoding='utf-8') as f:
+            f.write(source)
+    return list(modules)
+
+
+def run_benchmark(repeat=3):
+    """对比默认加载器、常量缓存(首次/之后)和数值数组模式的导入耗时。"""
+    import contextlib
+    import io
+    import tempfile
+    import time
+    from python_import_mechanism import set_loader_mode, python_import_simulation
+
+    def timed_import(name):
+        sys.modules.pop(name, None)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            python_import_simulation(name)
+        return time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = _write_synthetic_modules(tmp)
+        sys.path.insert(0, tmp)
+        previous = set_loader_mode('source')
+        try:
+            print(f"{'模块':<24}{'默认加载器':>12}{'缓存首次':>12}{'缓存命中':>12}{'数值数组':>12}")
+            for name in names:
+                set_loader_mode('source')
+                plain = min(timed_import(name) for _ in range(repeat))
+
+                set_loader_mode('constant_cache')
+                built = timed_import(name)
+                hit = min(timed_import(name) for _ in range(repeat))
+                os.remove(cache_path(os.path.join(tmp, name + '.py')))
+
+                set_loader_mode('constant_cache', numeric_arrays=True)
+                timed_import(name)
+                packed = min(timed_import(name) for _ in range(repeat))
+
+                print(f"{name:<24}{plain * 1000:>10.1f}ms{built * 1000:>10.1f}ms"
+                      f"{hit * 1000:>10.1f}ms{packed * 1000:>10.1f}ms")
+        finally:
+            set_loader_mode(previous['name'], **previous['options'])
+            sys.path.remove(tmp)
+            for name in names:
+                sys.modules.pop(name, None)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("常量缓存加载器基准测试")
+    print("=" * 60)
+    run_benchmark()
@@ -0,0 +1,213 @@
+"""
+代码对象常量去重 (Constant Deduplication)
+=======================================
+
+编译器只在同一个代码对象内部合并相同的常量。大量生成出来的模块各自编译后，
+同样的字符串、元组、文档字符串会在每个模块的代码对象中各有一份，并一直驻留在内存里。
+
+本模块提供`'dedup'`加载模式:
+- 编译后遍历模块的所有代码对象(包括嵌套的函数和类)，把`co_consts`中的常量换成
+  共享常量表中的同一个对象。元组和`frozenset`先对其元素去重，再整体去重。
+  去重后的代码对象直接存进共享的编译结果缓存，原始的重复常量随之释放。
+- `strip`选项按模块去掉文档字符串和`assert`语句(以`optimize=2`编译)，
+  效果相当于只对这些模块使用`-OO`。
+
+如何使用:
+    import constant_dedup
+    from python_import_mechanism import set_loader_mode
+
+    set_loader_mode('dedup')                                   # 只去重
+    set_loader_mode('dedup', strip={'generated.models'})      # 同时对指定模块去掉文档和断言
+    set_loader_mode('dedup', strip=True)                       # 对所有模块去掉文档和断言
+
+直接运行本文件会生成一批合成模块，对比各种方式导入后驻留的内存。
+
+"""
+
+import sys
+import threading
+import types
+
+from fork_safety import register_after_fork
+from import_caches import SHARED_BYTECODE_CACHE
+from python_import_mechanism import register_loader_mode
+
+# 按值去重的常量类型。容器类型(tuple/frozenset)在其元素去重后按元素身份去重。
+SCALAR_TYPES = (str, bytes, int)
+
+
+class ConstantTable:
+    """
+    跨代码对象共享的常量表。
+
+    键里带上类型，`1`、`1.0`和`True`不会被合并成同一个对象。
+    表持有所有常量的引用，所以元组可以用元素的`id`作为键。
+    """
+
+    def __init__(self):
+        self._constants = {}
+        self._lock = threading.Lock()
+        self.stats = {'code_objects': 0, 'constants': 0, 'duplicates': 0, 'bytes_saved': 0}
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._constants)
+
+    def _share(self, key, value):
+        self.stats['constants'] += 1
+        shared = self._constants.setdefault(key, value)
+        if shared is not value:
+            self.stats['duplicates'] += 1
+            self.stats['bytes_saved'] += sys.getsizeof(value)
+        return shared
+
+    def intern_constant(self, value):
+        """返回与`value`相等的共享常量；无法去重的对象原样返回。"""
+        kind = type(value)
+        if kind is float or kind is complex:
+            # `0.0 == -0.0`，用repr区分符号，和编译器的做法一致。
+            return self._share((kind, repr(value)), value)
+        if kind in SCALAR_TYPES:
+            return self._share((kind, value), value)
+        if kind is tuple or kind is frozenset:
+            items = [self.intern_constant(item) for item in value]
+            if kind is tuple and all(new is old for new, old in zip(items, value)):
+                rebuilt = value
+            else:
+                rebuilt = kind(items)
+            return self._share((kind, tuple(sorted(map(id, items))) if kind is frozenset
+                                else tuple(map(id, items))), rebuilt)
+        if kind is types.CodeType:
+            return self.dedup_code(value)
+        return value
+
+    def dedup_code(self, code):
+        """返回常量已去重的代码对象，嵌套的代码对象一并处理。"""
+        with self._lock:
+            return self._dedup_code(code)
+
+    def _dedup_code(self, code):
+        self.stats['code_objects'] += 1
+        consts = tuple(self._dedup_code(const) if type(const) is types.CodeType
+                       else self.intern_constant(const) for const in code.co_consts)
+        return code.replace(co_consts=consts)
+
+
+# 所有使用`'dedup'`模式的模块共享的常量表。
+SHARED_CONSTANT_TABLE = ConstantTable()
+
+
+class DedupLoader:
+    """
+    编译后对常量去重的加载器。
+
+    Args:
+        filepath (str): 源文件路径。
+        strip (bool | 集合): 为True时对所有模块去掉文档字符串和`assert`；
+            为模块名集合时只对其中的模块这样做。
+        table (ConstantTable): 使用的常量表，默认是共享表。
+    """
+
+    def __init__(self, filepath, strip=False, table=SHARED_CONSTANT_TABLE):
+        self.filepath = filepath
+        self.strip = strip
+        self.table = table
+
+    def _should_strip(self, module_name):
+        if isinstance(self.strip, bool):
+            return self.strip
+        return module_name in self.strip
+
+    def create_module(self, spec):
+        return None  # 使用默认创建
+
+    def exec_module(self, module):
+        optimize = 2 if self._should_strip(module.__name__) else -1
+        code = SHARED_BYTECODE_CACHE.get_code(self.filepath, optimize, transform=self.table.dedup_code)
+        exec(code, module.__dict__)
+
+
+register_loader_mode('dedup', DedupLoader)
+
+
+# --- 基准测试区 ---
+
+def _write_synthetic_corpus(directory, count=200):
+    """生成一批结构相同的"生成代码"模块，返回模块名列表。"""
+    fields = ', '.join(f"'field_{i}'" for i in range(40))
+    names = []
+    for index in range(count):
+        name = f"generated_model_{index}"
+        source = (
+            f'"""自动生成的数据模型 {index}。\n\n{"请勿手动修改此文件。" * 20}\n"""\n'
+            f"FIELDS = ({fields})\n"
+            f"CHOICES = (('draft', '草稿'), ('published', '已发布'), ('archived', '已归档'))\n"
+            f"class Model{index}:\n"
+            f'    """{"模型的字段说明。" * 30}"""\n'
+            f"    table = 'generated_model_table_prefix_{index}'\n"
+            f"    def validate(self, value):\n"
+            f'        """{"校验输入值是否合法。" * 20}"""\n'
+            f"        assert value in FIELDS, 'unknown field: expected one of the generated field names'\n"
+            f"        return {{'status': 'ok', 'message': 'validation passed for generated model'}}\n"
+        )
+        with open(f"{directory}/{name}.py", 'w', encoding='utf-8') as f:
+            f.write(source)
+        names.append(name)
+    return names
+
+
+def run_benchmark(count=200):
+    """对比默认加载器、常量去重、去重并去掉文档/断言三种方式导入后驻留的内存。"""
+    import contextlib
+    import gc
+    import io
+    import tempfile
+    import tracemalloc
+    from python_import_mechanism import set_loader_mode, python_import_simulation
+
+    def retained_memory(names):
+        for name in names:
+            sys.modules.pop(name, None)
+        SHARED_BYTECODE_CACHE.invalidate()
+        gc.collect()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in names:
+                python_import_simulation(name)
+        gc.collect()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return current
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = _write_synthetic_corpus(tmp, count)
+        sys.path.insert(0, tmp)
+        previous = set_loader_mode('source')
+        try:
+            results = []
+            for label, mode, options in (('默认加载器', 'source', {}),
+                                         ('常量去重', 'dedup', {'table': ConstantTable()}),
+                                         ('去重 + 去掉文档/断言', 'dedup',
+                                          {'table': ConstantTable(), 'strip': True})):
+                set_loader_mode(mode, **options)
+                results.append((label, retained_memory(names), options.get('table')))
+            baseline = results[0][1]
+            print(f"{count} 个合成模块导入后驻留的内存:")
+            for label, memory, table in results:
+                extra = f"  去重 {table.stats['duplicates']} 个常量" if table else ""
+                print(f"   {label:<16}{memory / 1024:>10.1f}KiB ({memory / baseline:.0%}){extra}")
+        finally:
+            set_loader_mode(previous['name'], **previous['options'])
+            sys.path.remove(tmp)
+            for name in names:
+                sys.modules.pop(name, None)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("常量去重加载器基准测试")
+    print("=" * 60)
+    run_benchmark()
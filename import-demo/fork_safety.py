@@ -0,0 +1,61 @@
+"""
+fork安全 (Fork Safety)
+=====================
+
+预fork的服务器(gunicorn风格的master)先在主进程中完成导入、预热缓存，再fork出工作进程。
+`fork()`只复制调用它的线程，其余线程在子进程中消失，但它们持有的锁仍然是"被持有"状态:
+
+- 模块导入锁(`_ModuleLock`)、缓存的锁被其他线程持有时，子进程第一次用到它们就会永远阻塞。
+- 后台线程(缓存监视器、指标端点)在子进程中不存在，对象却仍以为它们在运行；
+  inotify实例和监听套接字还与父进程共享。
+
+本模块在`os.register_at_fork`的`after_in_child`阶段统一处理这些对象。
+持有锁或线程的类在构造时调用`register_after_fork(self)`，并实现`_reinit_after_fork()`；
+模块级的状态直接登记一个函数:
+
+- 重建锁。锁保护的数据(目录列表、代码对象、常量表、内存映射)都是只读或已经完整写入的，
+  原样保留，子进程启动时缓存仍然是热的。
+- 停掉后台线程并释放子进程中的那份文件描述符，不影响父进程中仍在运行的线程。
+  缓存监视器被卸下后，缓存回到逐次`stat`校验。
+
+不支持`os.register_at_fork`的平台(Windows)没有fork，登记的对象不会被调用。
+
+"""
+
+import os
+import types
+import weakref
+
+# 子进程中需要重新初始化的对象(弱引用)和模块级函数；函数先于对象、按登记顺序调用
+_registered_objects = weakref.WeakSet()
+_registered_functions = []
+
+stats = {'forks': 0, 'reinitialized': 0}
+
+
+def register_after_fork(target):
+    """
+    登记fork后在子进程中执行的重新初始化。
+
+    `target`是函数时直接调用它；否则是对象，调用它的`_reinit_after_fork()`。
+    对象只被弱引用，被回收后自动注销。
+    """
+    if isinstance(target, types.FunctionType):
+        _registered_functions.append(target)
+    else:
+        _registered_objects.add(target)
+    return target
+
+
+def _reinit_in_child():
+    stats['forks'] += 1
+    for function in _registered_functions:
+        function()
+        stats['reinitialized'] += 1
+    for obj in list(_registered_objects):
+        obj._reinit_after_fork()
+        stats['reinitialized'] += 1
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reinit_in_child)
@@ -0,0 +1,256 @@
+"""
+导入查找缓存 (Import Lookup Caches)
+=================================
+
+真实的`importlib`会为每个路径条目缓存目录内容(`FileFinder`)，并把编译结果写进`.pyc`。
+本模块为模拟器提供两个对应的进程内缓存:
+
+- `DirectoryListingCache`: 目录列表缓存。每个目录只`listdir`一次，
+  之后每次查找只用一次`stat`比较目录的mtime来判断是否需要重新列出。
+- `BytecodeCache`: 编译结果缓存。按源文件路径缓存代码对象，用mtime和文件大小校验。
+  源文件以字节读取后直接交给`compile()`，不在Python中解码；
+  编码声明(PEP 263)和UTF-8 BOM由编译器按字节识别。
+  无源码部署的`.pyc`文件(见`sourceless_build.py`)直接反序列化，不经过编译。
+
+两个缓存中的值(目录内容的`frozenset`、代码对象)都是不可变的，
+因此可以被多个`ImportContext`安全地共享，见`python_import_mechanism.ImportContext`。
+
+挂上`cache_watcher.py`中的监视器后，被监视目录的缓存不再逐次`stat`校验，
+而是由监视器在目录或文件变化时主动推送失效通知。
+
+"""
+
+import marshal
+import os
+import threading
+from importlib.util import MAGIC_NUMBER
+
+from fork_safety import register_after_fork
+
+# .pyc文件头: 魔数、标志位、源文件mtime、源文件大小，各4字节(PEP 552)
+PYC_HEADER_SIZE = 16
+
+
+class DirectoryListingCache:
+    """目录列表缓存，值为目录中所有条目名的`frozenset`。"""
+
+    def __init__(self):
+        self._entries = {}  # path -> (mtime_ns, frozenset)
+        # path -> 失效次数。列目录前后比较它，避免把列目录期间失效的结果写回缓存。
+        self._generations = {}
+        self._lock = threading.Lock()
+        # 由`cache_watcher`设置；被它监视的目录命中缓存时无需`stat`。
+        self.watcher = None
+        # 目录缓存失效时的回调，参数是目录路径(全部失效时为None)。
+        self._listeners = []
+        self.stats = {'hits': 0, 'misses': 0, 'stat_calls': 0, 'listdir_calls': 0}
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        # 缓存的目录列表原样保留，子进程启动时仍是热的。
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """注册失效回调，例如`name_index.MergedNameIndex`用它做增量更新。"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, path):
+        for callback in list(self._listeners):
+            callback(path)
+
+    def listing(self, path):
+        """
+        返回目录`path`中的条目名集合。路径不存在或不是目录时返回空集合。
+        空字符串表示当前工作目录，与`sys.path`中的约定一致。
+        """
+        path = path or '.'
+        watcher = self.watcher
+        if watcher is not None and watcher.is_watching(path):
+            entry = self._entries.get(path)
+            if entry is not None:
+                self.stats['hits'] += 1
+                return entry[1]
+
+        if watcher is not None:
+            # 先开始监视再列目录，列目录之后发生的变化一定会推送过来。
+            # 第一次监视时会使该目录之前缓存的内容失效，所以之后才取世代号。
+            watcher.watch(path)
+        generation = self._generations.get(path, 0)
+        self.stats['stat_calls'] += 1
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return frozenset()
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == mtime_ns:
+            self.stats['hits'] += 1
+            return entry[1]
+
+        self.stats['misses'] += 1
+        self.stats['listdir_calls'] += 1
+        try:
+            names = frozenset(os.listdir(path))
+        except OSError:
+            names = frozenset()
+        with self._lock:
+            if self._generations.get(path, 0) == generation:
+                self._entries[path] = (mtime_ns, names)
+        if entry is not None and entry[1] != names:
+            # 通过mtime校验发现目录内容变了，同样通知监听者。
+            self._notify(path)
+        return names
+
+    def invalidate(self, path=None):
+        """使某个目录(或全部目录)的缓存失效。"""
+        with self._lock:
+            if path is None:
+                for key in self._entries:
+                    self._generations[key] = self._generations.get(key, 0) + 1
+                self._entries.clear()
+            else:
+                path = path or '.'
+                self._generations[path] = self._generations.get(path, 0) + 1
+                self._entries.pop(path, None)
+        self._notify(path)
+
+
+class BytecodeCache:
+    """按`(源文件路径, 优化级别, 变换)`缓存编译好的代码对象。"""
+
+    def __init__(self):
+        self._entries = {}  # (path, optimize, transform) -> ((mtime_ns, size), code)
+        # 每次失效加一。编译期间发生过失效时不写回缓存，避免缓存旧内容。
+        self._generation = 0
+        self._lock = threading.Lock()
+        # 由`cache_watcher`设置；它能推送文件修改事件时，命中缓存无需`stat`。
+        self.watcher = None
+        self.stats = {'hits': 0, 'misses': 0, 'stat_calls': 0, 'opens': 0}
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        # 代码对象是不可变的，原样保留。
+        self._lock = threading.Lock()
+
+    def get_code(self, filepath, optimize=-1, transform=None):
+        """
+        返回源文件对应的代码对象；源文件变化后会重新编译。
+
+        `transform`是可选的`code -> code`函数(例如`constant_dedup`的常量去重)，
+        在编译后执行一次，缓存的是变换后的代码对象。
+        """
+        key = (filepath, optimize, transform)
+        watcher = self.watcher
+        if (watcher is not None and watcher.reports_file_changes
+                and watcher.is_watching(os.path.dirname(filepath) or '.')):
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats['hits'] += 1
+                return entry[1]
+
+        generation = self._generation
+        self.stats['stat_calls'] += 1
+        st = os.stat(filepath)
+        validator = (st.st_mtime_ns, st.st_size)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == validator:
+            self.stats['hits'] += 1
+            return entry[1]
+
+        self.stats['misses'] += 1
+        self.stats['opens'] += 1
+        with open(filepath, 'rb') as f:
+            if filepath.endswith('.pyc'):
+                # 优化级别在构建时已经确定，`optimize`对无源码的模块不起作用。
+                code = load_sourceless(f.read(), filepath)
+            else:
+                # `compile()`按字节解析编码声明和BOM。它总会把源码复制成自己的以NUL结尾的bytes，
+                # 传入内存映射之类的缓冲区也省不下这次拷贝，所以直接读成bytes。
+                code = compile(f.read(), filepath, 'exec', dont_inherit=True, optimize=optimize)
+        if transform is not None:
+            code = transform(code)
+        with self._lock:
+            if self._generation == generation:
+                self._entries[key] = (validator, code)
+        return code
+
+    def invalidate(self, filepath=None):
+        """使某个源文件(或全部源文件)的编译结果失效。"""
+        with self._lock:
+            self._generation += 1
+            if filepath is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == filepath]:
+                    del self._entries[key]
+
+    def invalidate_directory(self, path):
+        """使目录`path`中所有源文件的编译结果失效。"""
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if (os.path.dirname(key[0]) or '.') == path]:
+                del self._entries[key]
+
+
+def load_sourceless(data, filepath):
+    """从`.pyc`文件的内容中取出代码对象。只校验魔数: 无源码部署没有可以比较的源文件。"""
+    if data[:4] != MAGIC_NUMBER:
+        raise ImportError(f"字节码文件的魔数不匹配(由其他版本的Python编译): {filepath}")
+    return marshal.loads(memoryview(data)[PYC_HEADER_SIZE:])
+
+
+# 所有导入上下文共享的缓存实例。
+SHARED_DIRECTORY_CACHE = DirectoryListingCache()
+SHARED_BYTECODE_CACHE = BytecodeCache()
+
+
+# --- 基准测试区 ---
+
+def _compile_text(filepath):
+    """旧的读取方式: 按UTF-8解码成`str`后再编译。"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return compile(f.read(), filepath, 'exec', dont_inherit=True)
+
+
+def run_benchmark(size_mb=4, repeat=3):
+    """
+    对比文本读取和字节读取两种方式编译大源文件的耗时和峰值内存。
+    峰值内存主要来自编译器自身的语法树；字节读取省下的是解码出来的那份`str`。
+    """
+    import tempfile
+    import time
+    import tracemalloc
+
+    line = "TABLE_{0} = ('中文字符串常量 {0}', {0}, {0}.5, b'bytes constant')\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = os.path.join(tmp, 'large_generated.py')
+        with open(filepath, 'w', encoding='utf-8') as f:
+            index = 0
+            while f.tell() < size_mb * 1024 * 1024:
+                f.write(line.format(index))
+                index += 1
+
+        print(f"源文件 {os.path.getsize(filepath) / 1024 / 1024:.1f}MiB，{index} 行:")
+        for label, compile_source in (('文本读取并解码', lambda: _compile_text(filepath)),
+                                      ('字节读取', lambda: BytecodeCache().get_code(filepath))):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                compile_source()
+                timings.append(time.perf_counter() - started)
+            tracemalloc.start()
+            compile_source()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"   {label:<10}{min(timings) * 1000:>10.1f}ms   峰值内存 {peak / 1024 / 1024:>8.1f}MiB")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("源文件读取方式基准测试")
+    print("=" * 60)
+    run_benchmark()
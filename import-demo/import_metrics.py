@@ -0,0 +1,287 @@
+"""
+导入指标导出 (Import Metrics)
+===========================
+
+模拟器在导入过程中维护一组开销很低的计数器和直方图，可以按Prometheus文本格式导出:
+
+- `simulator_imports_total{outcome}`: 按结果统计的导入次数。结果包括
+  `loaded`(执行了模块代码)、`cached`(命中模块表)、`shared`(与全局解释器共享)、
+  `builtin`、`not_found`、`error`(执行失败)和`budget_exceeded`。
+- `simulator_cache_lookups_total{level, result}`: 各级缓存的命中/未命中次数，
+  `level`为`module_table`、`spec_cache`或`bytecode_cache`。
+- `simulator_filesystem_calls_total{cache, call}`: 查找缓存发起的`stat`/`listdir`/`open`次数。
+- `simulator_import_phase_seconds{phase}`: 六个阶段各自耗时的直方图。阶段2不含父包的递归导入；
+  阶段5和阶段6包含其间触发的子导入。
+
+缓存相关的数字在导出时直接从共享缓存的`stats`中读取，导入路径上不增加任何开销。
+
+如何使用:
+    from import_metrics import render_prometheus, start_metrics_server
+
+    print(render_prometheus())
+    server = start_metrics_server(port=9464)      # 只监听127.0.0.1
+    # curl http://127.0.0.1:9464/metrics
+    stop_metrics_server()
+
+"""
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fork_safety import register_after_fork
+from import_caches import SHARED_DIRECTORY_CACHE, SHARED_BYTECODE_CACHE
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 阶段耗时的桶边界(秒)，从10微秒到5秒
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+_server = {'server': None, 'thread': None}
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join(f'{name}="{str(value)}"' for name, value in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数。"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """固定桶边界的直方图。"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [每个桶的计数..., +Inf桶的计数, 总和]
+        self._lock = threading.Lock()
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, *labels):
+        counts = self._values.get(labels)
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        for labels, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = (('le', _format_value(bound)),)
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, labels, le), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), counts[-1]
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), cumulative
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """指标集合。`collectors`在导出时调用，返回`(名称, 类型, 说明, 样本列表)`。"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self):
+        for metric in self.metrics:
+            metric.reset()
+
+    def render(self):
+        """返回Prometheus文本格式(0.0.4)的全部指标。收集器返回的同名指标并入已有的指标族。"""
+        families = {metric.name: (metric.kind, metric.documentation, list(metric.samples()))
+                    for metric in self.metrics}
+        for collector in self.collectors:
+            for name, kind, documentation, samples in collector():
+                families.setdefault(name, (kind, documentation, []))[2].extend(samples)
+        lines = []
+        for name, (kind, documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+IMPORT_METRICS = MetricsRegistry()
+
+IMPORTS_TOTAL = IMPORT_METRICS.counter(
+    'simulator_imports_total', '按结果统计的导入次数', ('outcome',))
+CACHE_LOOKUPS = IMPORT_METRICS.counter(
+    'simulator_cache_lookups_total', '各级缓存的查找次数', ('level', 'result'))
+PHASE_SECONDS = IMPORT_METRICS.histogram(
+    'simulator_import_phase_seconds', '各导入阶段的耗时(秒)', ('phase',))
+
+
+def _collect_cache_stats():
+    """从共享缓存的统计中读取编译结果缓存的命中情况和文件系统调用次数。"""
+    directory = SHARED_DIRECTORY_CACHE.stats
+    bytecode = SHARED_BYTECODE_CACHE.stats
+    lookups = [
+        ('bytecode_cache', 'hit', bytecode['hits']),
+        ('bytecode_cache', 'miss', bytecode['misses']),
+    ]
+    calls = [
+        ('directory', 'stat', directory['stat_calls']),
+        ('directory', 'listdir', directory['listdir_calls']),
+        ('bytecode', 'stat', bytecode['stat_calls']),
+        ('bytecode', 'open', bytecode['opens']),
+    ]
+    return [
+        (CACHE_LOOKUPS.name, 'counter', CACHE_LOOKUPS.documentation,
+         [(CACHE_LOOKUPS.name, _format_labels(CACHE_LOOKUPS.labelnames, labels[:2]), labels[2])
+          for labels in lookups]),
+        ('simulator_filesystem_calls_total', 'counter', '查找缓存发起的文件系统调用次数',
+         [('simulator_filesystem_calls_total', _format_labels(('cache', 'call'), labels[:2]), labels[2])
+          for labels in calls]),
+    ]
+
+
+IMPORT_METRICS.collectors.append(_collect_cache_stats)
+
+
+def render_prometheus():
+    return IMPORT_METRICS.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不在控制台打印每次抓取
+
+
+def start_metrics_server(port=0, host='127.0.0.1'):
+    """
+    在后台线程中启动`/metrics`端点。默认只监听本机回环地址；`port=0`时由系统分配端口。
+
+    Returns:
+        ThreadingHTTPServer: 实际端口见`server.server_address[1]`。
+    """
+    stop_metrics_server()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='import-metrics', daemon=True)
+    thread.start()
+    _server['server'], _server['thread'] = server, thread
+    print(f"   [METRICS] 指标端点: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+@register_after_fork
+def _forget_server_after_fork():
+    """子进程中没有服务线程，只关闭继承来的那份监听套接字，父进程的端点不受影响。"""
+    server = _server['server']
+    if server is not None:
+        _server['server'] = _server['thread'] = None
+        server.socket.close()
+
+
+def stop_metrics_server():
+    server, thread = _server['server'], _server['thread']
+    if server is None:
+        return
+    _server['server'] = _server['thread'] = None
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+# --- 演示区 ---
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import urllib.request
+    from python_import_mechanism import python_import_simulation
+    # 以脚本运行时本文件是`__main__`，模拟器更新的是`import_metrics`模块中的指标。
+    import import_metrics
+
+    print("=" * 60)
+    print("导入指标导出演示")
+    print("=" * 60)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in ('json', 'json', 'email.mime.text'):
+            python_import_simulation(name)
+    server = import_metrics.start_metrics_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    with urllib.request.urlopen(url) as response:
+        text = response.read().decode('utf-8')
+    import_metrics.stop_metrics_server()
+    for line in text.splitlines():
+        if not line.startswith('simulator_import_phase_seconds_bucket'):
+            print(line)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+导入开销回归对比 (Import Regression)
+===================================
+
+在两套代码(两个checkout，或两组`sys.path`配置)下分别冷启动同一个入口，
+对比模拟器记录的逐模块数据，用来在合并前拦住让启动变慢的改动:
+
+- 新增/移除的模块: 只在一边被导入的模块。
+- 逐模块的变化: 自身执行耗时(`IMPORT_TIMINGS`经`startup_optimizer.compute_times`去掉子导入后的耗时)
+  和执行期间新分配的内存。
+- 冷启动总耗时的变化: 在工作进程中导入全部入口模块的耗时，不含解释器自身的启动。
+
+每次运行都在全新的子进程中进行，两边交替运行`repeat`次，取中位数；
+噪声用中位数绝对偏差(MAD)估计，变化小于`noise`倍MAD或小于`min_change`的模块不报告。
+内存用`tracemalloc`测量，会拖慢执行，所以每边额外单独运行一次，不影响耗时数据。
+
+如何使用:
+    python import_regression.py --base ../main/src --head ./src --import myapp.main
+    python import_regression.py --base a --head b --import myapp.main --repeat 9 --fail-above 20
+
+`--base`/`--head`是用`os.pathsep`分隔的路径列表，排在工作进程搜索路径的最前面。
+指定`--fail-above N`时，冷启动总耗时的增加超过N毫秒且超出噪声范围则以退出码1结束，可直接用作CI的门禁。
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_REPEAT = 5
+DEFAULT_NOISE = 3.0
+DEFAULT_MIN_CHANGE = 0.5  # 毫秒
+
+
+# --- 工作进程 ---
+
+def run_worker(paths, module_names, measure_memory=False):
+    """
+    在当前进程中冷导入入口模块，返回本次运行的数据。只应在全新的子进程中调用。
+
+    Returns:
+        dict: `total`(秒)、`modules`(模块名 -> {`self_time`, `exec_time`, `memory`})。
+    """
+    from python_import_mechanism import IMPORT_TIMINGS, MODULE_ACCESS, ImportContext, set_access_tracking
+    from startup_optimizer import compute_times
+
+    # 独立上下文中，模块代码里的`import`语句同样经过模拟器，整棵导入树都有记录。
+    # 标准库与全局解释器共享，不计入对比。
+    context = ImportContext(path=paths + sys.path, name='import-regression')
+    if measure_memory:
+        set_access_tracking(True, measure_memory=True, report_at_exit=False)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in module_names:
+            context.import_module(name)
+    total = time.perf_counter() - started
+
+    _, nodes = compute_times(IMPORT_TIMINGS)
+    memory = {record['module']: record['memory'] for record in MODULE_ACCESS.values()}
+    return {
+        'total': total,
+        'modules': {node.module: {'self_time': node.self_time, 'exec_time': node.exec_time,
+                                  'memory': memory.get(node.module)}
+                    for node in nodes},
+    }
+
+
+def _spawn_worker(paths, module_names, measure_memory=False):
+    command = [sys.executable, os.path.abspath(__file__), '--worker',
+               '--path', os.pathsep.join(paths), '--import', *module_names]
+    if measure_memory:
+        command.append('--memory')
+    result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(f"工作进程失败 ({' '.join(command)}):\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# --- 统计 ---
+
+def _mad(values):
+    median = statistics.median(values)
+    return statistics.median(abs(value - median) for value in values)
+
+
+def _summarize(runs, memory_run):
+    """把多次运行合并成每个模块的中位数和MAD。"""
+    modules = {}
+    for name in set().union(*(run['modules'] for run in runs)):
+        times = [run['modules'][name]['self_time'] for run in runs if name in run['modules']]
+        modules[name] = {
+            'self_time': statistics.median(times),
+            'mad': _mad(times),
+            'memory': memory_run['modules'].get(name, {}).get('memory'),
+        }
+    totals = [run['total'] for run in runs]
+    return {'total': statistics.median(totals), 'total_mad': _mad(totals), 'modules': modules}
+
+
+def compare(base_paths, head_paths, module_names, repeat=DEFAULT_REPEAT,
+            noise=DEFAULT_NOISE, min_change=DEFAULT_MIN_CHANGE / 1000):
+    """
+    对比两套配置的导入开销。两边交替运行，机器负载的波动对两边的影响相同。
+
+    Returns:
+        dict: `base_total`/`head_total`/`total_delta`(秒)、`total_significant`、
+        `added`/`removed`(模块记录列表)、`changed`(按耗时变化从大到小排列)。
+    """
+    base_runs, head_runs = [], []
+    for _ in range(repeat):
+        base_runs.append(_spawn_worker(base_paths, module_names))
+        head_runs.append(_spawn_worker(head_paths, module_names))
+    base = _summarize(base_runs, _spawn_worker(base_paths, module_names, measure_memory=True))
+    head = _summarize(head_runs, _spawn_worker(head_paths, module_names, measure_memory=True))
+
+    def is_significant(delta, base_mad, head_mad):
+        return abs(delta) >= min_change and abs(delta) > noise * max(base_mad, head_mad)
+
+    changed = []
+    for name in sorted(base['modules'].keys() & head['modules'].keys()):
+        old, new = base['modules'][name], head['modules'][name]
+        delta = new['self_time'] - old['self_time']
+        if not is_significant(delta, old['mad'], new['mad']):
+            continue
+        memory_delta = (None if old['memory'] is None or new['memory'] is None
+                        else new['memory'] - old['memory'])
+        changed.append({'module': name, 'base': old['self_time'], 'head': new['self_time'],
+                        'delta': delta, 'memory_delta': memory_delta})
+    changed.sort(key=lambda item: -abs(item['delta']))
+
+    def only_in(summary, other):
+        return sorted(({'module': name, 'self_time': record['self_time'], 'memory': record['memory']}
+                       for name, record in summary['modules'].items() if name not in other['modules']),
+                      key=lambda item: -item['self_time'])
+
+    total_delta = head['total'] - base['total']
+    return {
+        'repeat': repeat,
+        'base_total': base['total'],
+        'head_total': head['total'],
+        'total_delta': total_delta,
+        'total_significant': is_significant(total_delta, base['total_mad'], head['total_mad']),
+        'added': only_in(head, base),
+        'removed': only_in(base, head),
+        'changed': changed,
+    }
+
+
+# --- 报告 ---
+
+def _format_memory(value):
+    return "-" if value is None else f"{value / 1024:+.1f}KiB"
+
+
+def format_report(report):
+    verdict = "" if report['total_significant'] else " (在噪声范围内)"
+    lines = [
+        f"冷启动耗时(中位数，{report['repeat']} 次): base {report['base_total'] * 1000:.2f}ms -> "
+        f"head {report['head_total'] * 1000:.2f}ms，变化 {report['total_delta'] * 1000:+.2f}ms{verdict}",
+        "",
+        f"[新增模块] {len(report['added'])} 个:",
+    ]
+    lines += [f"   {item['self_time'] * 1000:>+9.2f}ms {_format_memory(item['memory']):>12}  {item['module']}"
+              for item in report['added']]
+    lines.append(f"[移除模块] {len(report['removed'])} 个:")
+    lines += [f"   {-item['self_time'] * 1000:>+9.2f}ms {_format_memory(item['memory'] and -item['memory']):>12}"
+              f"  {item['module']}" for item in report['removed']]
+    lines.append(f"[耗时变化] {len(report['changed'])} 个(超出噪声的模块):")
+    lines += [f"   {item['delta'] * 1000:>+9.2f}ms {_format_memory(item['memory_delta']):>12}  {item['module']} "
+              f"({item['base'] * 1000:.2f}ms -> {item['head'] * 1000:.2f}ms)" for item in report['changed']]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比两套代码下同一入口的导入开销")
+    parser.add_argument('--base', help="基准配置的搜索路径(用os.pathsep分隔)")
+    parser.add_argument('--head', help="待比较配置的搜索路径(用os.pathsep分隔)")
+    parser.add_argument('--import', dest='modules', nargs='+', required=True, metavar='MODULE',
+                        help="入口模块")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="每边冷启动的次数")
+    parser.add_argument('--noise', type=float, default=DEFAULT_NOISE,
+                        help="变化需超过MAD的多少倍才报告")
+    parser.add_argument('--min-change', type=float, default=DEFAULT_MIN_CHANGE,
+                        help="低于该值(毫秒)的变化不报告")
+    parser.add_argument('--fail-above', type=float, default=None,
+                        help="冷启动总耗时增加超过该值(毫秒)且超出噪声时以退出码1结束")
+    parser.add_argument('--json', action='store_true', help="以JSON输出")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--path', default='', help=argparse.SUPPRESS)
+    parser.add_argument('--memory', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    def split(value):
+        return [path for path in (value or '').split(os.pathsep) if path]
+
+    if args.worker:
+        print(json.dumps(run_worker(split(args.path), args.modules, args.memory)))
+        return 0
+    if args.base is None or args.head is None:
+        parser.error("需要同时指定 --base 和 --head")
+
+    report = compare(split(args.base), split(args.head), args.modules, repeat=args.repeat,
+                     noise=args.noise, min_change=args.min_change / 1000)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    # 只有超出噪声的增加才让门禁失败，否则一次抖动就会挡住无关的改动。
+    if (args.fail_above is not None and report['total_significant']
+            and report['total_delta'] * 1000 > args.fail_above):
+        print(f"\n[FAIL] 冷启动耗时增加 {report['total_delta'] * 1000:.2f}ms，"
+              f"超过上限 {args.fail_above:.2f}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+GC感知的批量导入会话 (Import Session)
+===================================
+
+冷启动时成千上万次`exec_module`会创建大量函数、类和常量，它们几乎都活到进程结束。
+循环垃圾回收器却会在导入期间被反复触发，一遍遍扫描这些永远不会被回收的对象。
+
+`ImportSession`是一个包在批量导入外面的上下文管理器:
+- 会话期间暂停GC(`gc_mode='pause'`)，或把第0代阈值调高以减少回收次数(`gc_mode='tune'`)。
+- 会话结束时调用`gc.freeze()`，把此前创建的所有对象移入永久代，之后的回收不再扫描它们。
+  `fork`出来的子进程中，GC也不会再去写这些对象所在的内存页，写时复制的共享得以保留。
+- 通过`gc.callbacks`统计会话期间每一代运行了多少次回收、耗时多少。
+
+如何使用:
+    from import_session import ImportSession
+
+    with ImportSession() as session:
+        for name in startup_modules:
+            python_import_simulation(name)
+    print(session.report)
+
+"""
+
+import gc
+import time
+
+from python_import_mechanism import import_timings_mark
+
+GC_MODES = ('pause', 'tune', 'normal')
+
+# `gc_mode='tune'`时使用的阈值(第0代, 第1代, 第2代)。默认阈值是(700, 10, 10)。
+TUNED_THRESHOLDS = (50000, 20, 20)
+
+
+class GCReport:
+    """一次导入会话的统计结果。"""
+
+    def __init__(self):
+        self.collections = [0, 0, 0]       # 每一代的回收次数
+        self.collection_time = 0.0         # 回收总耗时(秒)
+        self.collected = 0                 # 回收掉的对象数
+        self.imports = 0                   # 会话期间执行的模块数
+        self.elapsed = 0.0                 # 会话总耗时(秒)
+        self.frozen = None                 # 结束时永久代中的对象数，未冻结时为None
+
+    def as_dict(self):
+        return dict(vars(self), collections=list(self.collections))
+
+    def __repr__(self):
+        frozen = f", 冻结 {self.frozen} 个对象" if self.frozen is not None else ""
+        return (f"<GCReport {self.imports} 个模块, 耗时 {self.elapsed * 1000:.1f}ms, "
+                f"GC {sum(self.collections)} 次 {self.collections} "
+                f"共 {self.collection_time * 1000:.2f}ms{frozen}>")
+
+
+class ImportSession:
+    """
+    批量导入会话。
+
+    Args:
+        gc_mode (str): `'pause'`在会话期间关闭GC；`'tune'`使用`thresholds`中更高的阈值；
+            `'normal'`不改变GC设置，只做统计。
+        thresholds (tuple): `'tune'`模式使用的阈值。
+        freeze (bool): 会话结束时调用`gc.freeze()`。
+        collect_before_freeze (bool): 冻结前先做一次完整回收，避免把导入期间产生的垃圾一起冻结。
+    """
+
+    def __init__(self, gc_mode='pause', thresholds=TUNED_THRESHOLDS, freeze=True,
+                 collect_before_freeze=True):
+        if gc_mode not in GC_MODES:
+            raise ValueError(f"未知的GC模式: '{gc_mode}'，可选: {GC_MODES}")
+        self.gc_mode = gc_mode
+        self.thresholds = thresholds
+        self.freeze = freeze
+        self.collect_before_freeze = collect_before_freeze
+        self.report = GCReport()
+        self._saved_state = None
+        self._collect_started = None
+        self._started = None
+        self._timings_start = None
+
+    def _on_gc(self, phase, info):
+        """`gc.callbacks`回调，统计回收次数和耗时。"""
+        if phase == 'start':
+            self._collect_started = time.perf_counter()
+        elif self._collect_started is not None:
+            self.report.collection_time += time.perf_counter() - self._collect_started
+            self.report.collections[info['generation']] += 1
+            self.report.collected += info['collected']
+            self._collect_started = None
+
+    def start(self):
+        self._saved_state = (gc.isenabled(), gc.get_threshold())
+        self._timings_start = import_timings_mark()
+        gc.callbacks.append(self._on_gc)
+        if self.gc_mode == 'pause':
+            gc.disable()
+        elif self.gc_mode == 'tune':
+            gc.set_threshold(*self.thresholds)
+        self._started = time.perf_counter()
+        print(f"   [GC] 导入会话开始 (gc_mode='{self.gc_mode}')")
+        return self
+
+    def close(self):
+        """结束会话: 恢复GC设置，按需冻结，返回统计结果。重复调用没有副作用。"""
+        if self._saved_state is None:
+            return self.report
+        enabled, threshold = self._saved_state
+        self._saved_state = None
+        self.report.imports = import_timings_mark() - self._timings_start
+        if self.freeze:
+            if self.collect_before_freeze:
+                gc.collect()
+            gc.freeze()
+            self.report.frozen = gc.get_freeze_count()
+        # 冻结前的那次回收也计入统计，之后再移除回调。
+        gc.callbacks.remove(self._on_gc)
+        gc.set_threshold(*threshold)
+        if enabled:
+            gc.enable()
+        self.report.elapsed = time.perf_counter() - self._started
+        print(f"   [GC] 导入会话结束: {self.report}")
+        return self.report
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# --- 演示区 ---
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import os
+    import sys
+    import tempfile
+    from python_import_mechanism import python_import_simulation
+
+    def synthetic_package(directory, count=300):
+        """生成一批会创建很多容器对象的模块。"""
+        for i in range(count):
+            with open(os.path.join(directory, f"gc_demo_{i}.py"), 'w') as f:
+                f.write(f"TABLE = [{{'id': n, 'tags': [n, n + 1]}} for n in range(2000)]\n"
+                        f"class Model{i}:\n    fields = {{'a': [], 'b': {{}}}}\n")
+        return [f"gc_demo_{i}" for i in range(count)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = synthetic_package(tmp)
+        sys.path.insert(0, tmp)
+        for mode in ('normal', 'tune', 'pause'):
+            for name in names:
+                sys.modules.pop(name, None)
+            with contextlib.redirect_stdout(io.StringIO()), \
+                    ImportSession(gc_mode=mode, freeze=False) as session:
+                for name in names:
+                    python_import_simulation(name)
+            print(f"{mode:<8} {session.report}")
+        sys.path.remove(tmp)
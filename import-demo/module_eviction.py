@@ -0,0 +1,289 @@
+"""
+内存感知的模块淘汰 (Module Eviction)
+==================================
+
+插件宿主通过`python_import_simulation`加载成千上万个很少用到的插件模块，
+它们一旦导入就永远留在模块表里。`ModuleEvictionManager`是一个可选的LRU管理器:
+
+- 跟踪: 模拟器每执行完一个模块就通知管理器(`add_import_listener`)。管理器估算模块的内存占用，
+  并把模块的类换成`ModuleType`的子类，记录每次属性读取的时间。
+- 淘汰: 被跟踪模块的估算总内存超出预算时，按最久未访问的顺序淘汰空闲的叶子模块
+  (没有已加载的子模块，且空闲超过`min_idle`秒):
+  1. 从模块表中移除；
+  2. 解除阶段6.2绑定在父包上的子模块属性，并给父包装上PEP 562的`__getattr__`，
+     它只负责被淘汰的那些子模块，包上的其他名称的行为不变；
+  3. 清空模块字典(只保留`__name__`、`__spec__`等元数据)。
+- 按需重新加载: 通过父包访问(`package.plugin`)，或者通过仍然持有旧模块对象的引用访问属性时，
+  模块都会经由模拟器重新导入。编译结果仍在共享缓存中，无需重新解析源码。
+
+注意: 清空字典后，仍被别处引用的函数会失去它们的全局命名空间。只应淘汰对象不会被长期持有的
+插件模块；其余模块可以放进`pinned`。
+
+如何使用:
+    from module_eviction import ModuleEvictionManager
+
+    manager = ModuleEvictionManager(memory_budget=64 * 1024 * 1024, min_idle=300,
+                                    pinned={'plugins'}).install()
+    ...
+    manager.stats   # tracked / resident_bytes / evictions / reloads
+
+"""
+
+import sys
+import threading
+import time
+import types
+import weakref
+
+from fork_safety import register_after_fork
+from python_import_mechanism import (GLOBAL_IMPORT_CONTEXT, add_access_listener, add_import_listener,
+                                     get_import_stack, python_import_simulation, remove_access_listener,
+                                     remove_import_listener)
+
+# 淘汰后保留在模块字典中的元数据
+KEPT_ATTRIBUTES = ('__name__', '__spec__', '__loader__', '__file__', '__package__', '__path__')
+
+# 被淘汰的模块对象 -> 它所在的导入上下文，供按需重新加载使用
+_evicted_contexts = weakref.WeakKeyDictionary()
+
+
+class _EvictedModule(types.ModuleType):
+    """已被淘汰的模块。通过旧引用读取任何属性时，重新导入模块并转发到新的模块对象。"""
+
+    def __getattr__(self, name):
+        context = _evicted_contexts.get(self)
+        module_name = self.__dict__.get('__name__')
+        if context is None or module_name is None:
+            raise AttributeError(name)
+        current = context.modules.get(module_name)
+        if current is None:
+            print(f"   [EVICT] 访问已淘汰的模块，重新加载: {module_name}")
+            python_import_simulation(module_name, context=context)
+            current = context.modules[module_name]
+        return getattr(current, name)
+
+
+def _install_reload_hook(package, child, context):
+    """
+    给父包装上模块级`__getattr__`(PEP 562)，访问被淘汰的子模块`child`时重新导入它。
+
+    只有被淘汰过的名称会触发导入，其余名称交给包原有的`__getattr__`(或直接AttributeError)，
+    `hasattr(package, 'x')`之类的探测不会导入别的子模块。
+    """
+    namespace = package.__dict__
+    hook = namespace.get('__getattr__')
+    if getattr(hook, '_evicted_children', None) is None:
+        previous = hook
+        evicted_children = set()
+
+        def __getattr__(name):
+            package_name = namespace['__name__']
+            if name in evicted_children:
+                full_name = f"{package_name}.{name}"
+                print(f"   [EVICT] 通过父包访问已淘汰的子模块，重新加载: {full_name}")
+                python_import_simulation(full_name, context=context)
+                evicted_children.discard(name)
+                return context.modules[full_name]
+            if previous is not None:
+                return previous(name)
+            raise AttributeError(f"module '{package_name}' has no attribute '{name}'")
+
+        __getattr__._evicted_children = evicted_children
+        namespace['__getattr__'] = hook = __getattr__
+    hook._evicted_children.add(child)
+
+
+def estimate_module_size(module):
+    """
+    粗略估算模块占用的内存: 模块字典、其中的值，以及函数的代码对象和类的字典。
+    只看一层，不追踪共享对象，用于比较和预算足够了。
+    """
+    namespace = module.__dict__
+    size = sys.getsizeof(namespace)
+    for value in namespace.values():
+        if isinstance(value, types.ModuleType):
+            continue
+        size += sys.getsizeof(value)
+        if isinstance(value, types.FunctionType):
+            code = value.__code__
+            size += sys.getsizeof(code) + sys.getsizeof(code.co_consts)
+        elif isinstance(value, type):
+            size += sys.getsizeof(value.__dict__)
+    return size
+
+
+class ModuleEvictionManager:
+    """
+    按LRU淘汰空闲叶子模块的管理器。
+
+    Args:
+        memory_budget (int): 被跟踪模块的估算总内存上限(字节)。
+        context (ImportContext, optional): 管理的导入上下文，默认是全局上下文。
+        min_idle (float): 模块至少空闲这么多秒才会被淘汰。
+        pinned (iterable): 永不淘汰的模块名；以`.`结尾的名称表示整个包下的模块。
+        clock (callable): 时间来源，默认是`time.monotonic`。
+    """
+
+    def __init__(self, memory_budget, context=None, min_idle=60.0, pinned=(), clock=time.monotonic):
+        self.memory_budget = memory_budget
+        self.context = context or GLOBAL_IMPORT_CONTEXT
+        self.min_idle = min_idle
+        self.pinned = frozenset(pinned)
+        self.clock = clock
+        self._sizes = weakref.WeakKeyDictionary()        # 模块 -> 估算大小
+        self._last_access = weakref.WeakKeyDictionary()  # 模块 -> 最近一次属性读取的时间
+        self._children = {}                              # 包名 -> 已加载的子模块名集合
+        self._evicted_names = set()
+        self._lock = threading.RLock()
+        self.stats = {'tracked': 0, 'resident_bytes': 0, 'evictions': 0, 'reloads': 0}
+
+        last_access = self._last_access
+        clock = self.clock
+
+        class _LRUModule(types.ModuleType):
+            """读取非双下划线属性时记录访问时间。"""
+
+            def __getattribute__(self, name):
+                if not (name.startswith('__') and name.endswith('__')):
+                    last_access[self] = clock()
+                return types.ModuleType.__getattribute__(self, name)
+
+        self._module_class = _LRUModule
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        self._lock = threading.RLock()
+
+    # --- 安装 ---
+
+    def install(self):
+        for name in list(self.context.modules):
+            self._add_child(name)
+        add_import_listener(self._on_import)
+        add_access_listener(self._on_first_access)
+        return self
+
+    def uninstall(self):
+        remove_import_listener(self._on_import)
+        remove_access_listener(self._on_first_access)
+
+    def _on_import(self, module, exec_time, context):
+        if context is not self.context:
+            return
+        self.track(module)
+        self.enforce_budget()
+
+    def _on_first_access(self, module):
+        # 访问跟踪(`set_access_tracking`)在第一次读取时把模块换回`ModuleType`，此时换成LRU类接着记录。
+        if module in self._sizes and type(module) is types.ModuleType:
+            self._last_access[module] = self.clock()
+            module.__class__ = self._module_class
+
+    # --- 跟踪 ---
+
+    def track(self, module):
+        """开始跟踪一个模块。"""
+        with self._lock:
+            name = module.__name__
+            if name in self._evicted_names:
+                self._evicted_names.discard(name)
+                self.stats['reloads'] += 1
+            size = estimate_module_size(module)
+            self.stats['resident_bytes'] += size - self._sizes.get(module, 0)
+            self._sizes[module] = size
+            self._last_access[module] = self.clock()
+            self._add_child(name)
+            # 访问跟踪已经换过类的模块先不替换，等它第一次被读取时由`_on_first_access`接手。
+            if type(module) is types.ModuleType:
+                module.__class__ = self._module_class
+            self.stats['tracked'] = len(self._sizes)
+
+    def _add_child(self, name):
+        parent_name, _, _ = name.rpartition('.')
+        if parent_name:
+            self._children.setdefault(parent_name, set()).add(name)
+
+    def _remove_child(self, name):
+        parent_name, _, _ = name.rpartition('.')
+        children = self._children.get(parent_name)
+        if children is not None:
+            children.discard(name)
+            if not children:
+                del self._children[parent_name]
+
+    def _is_pinned(self, name):
+        return name in self.pinned or any(name.startswith(prefix) for prefix in self.pinned
+                                          if prefix.endswith('.'))
+
+    def _is_leaf(self, name):
+        return not self._children.get(name)
+
+    def candidates(self):
+        """返回可以淘汰的模块，最久未访问的在前。"""
+        now = self.clock()
+        importing = set(get_import_stack())
+        modules = self.context.modules
+        result = []
+        for module, last in list(self._last_access.items()):
+            name = module.__name__
+            if (modules.get(name) is not module or name in importing or self._is_pinned(name)
+                    or now - last < self.min_idle or not self._is_leaf(name)):
+                continue
+            result.append((last, name, module))
+        result.sort(key=lambda item: item[0])
+        return [(name, module) for _, name, module in result]
+
+    # --- 淘汰 ---
+
+    def enforce_budget(self):
+        """淘汰模块直到估算总内存不超过预算，返回被淘汰的模块名列表。"""
+        evicted = []
+        with self._lock:
+            # 平时按增量维护总量；即将淘汰时重新求和，去掉已被回收的模块。
+            if self.stats['resident_bytes'] > self.memory_budget:
+                self.stats['resident_bytes'] = sum(self._sizes.values())
+            # 每轮只排序一次候选；淘汰叶子后父包可能成为新的叶子，仍超出预算时再来一轮。
+            while self.stats['resident_bytes'] > self.memory_budget:
+                progressed = False
+                for name, module in self.candidates():
+                    if self.stats['resident_bytes'] <= self.memory_budget:
+                        break
+                    if self.evict(name, module):
+                        evicted.append(name)
+                        progressed = True
+                if not progressed:
+                    break
+        return evicted
+
+    def evict(self, name, module=None):
+        """淘汰一个模块。模块不在模块表中或不是被跟踪的模块时返回False。"""
+        modules = self.context.modules
+        with self._lock:
+            module = module if module is not None else modules.get(name)
+            if module is None or modules.get(name) is not module or module not in self._sizes:
+                return False
+            del modules[name]
+            self._remove_child(name)
+
+            # 解除父包上的属性，并让父包能够在下次访问时重新导入它。
+            parent_name, _, child = name.rpartition('.')
+            parent = modules.get(parent_name) if parent_name else None
+            if parent is not None:
+                if parent.__dict__.get(child) is module:
+                    del parent.__dict__[child]
+                _install_reload_hook(parent, child, self.context)
+
+            namespace = module.__dict__
+            kept = {key: namespace[key] for key in KEPT_ATTRIBUTES if key in namespace}
+            namespace.clear()
+            namespace.update(kept)
+            module.__class__ = _EvictedModule
+            _evicted_contexts[module] = self.context
+
+            self.stats['resident_bytes'] -= self._sizes.pop(module)
+            self._last_access.pop(module, None)
+            self._evicted_names.add(name)
+            self.stats['evictions'] += 1
+            self.stats['tracked'] = len(self._sizes)
+        print(f"   [EVICT] 淘汰空闲模块: {name}")
+        return True
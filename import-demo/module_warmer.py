@@ -0,0 +1,205 @@
+"""
+空闲时预热模块 (Module Warmer)
+============================
+
+服务就绪时，它最终要用到的大部分模块还没有被导入，最初的几个请求要替它们付出导入耗时。
+`ModuleWarmer`在后台线程中按优先级顺序逐个导入这些模块，把导入耗时挪出请求路径:
+
+- 优先级列表可以直接给出，也可以用`load_priorities()`从上次运行的记录中读取:
+  `startup_optimizer.save_timings`保存的耗时记录(JSON Lines)，或每行一个模块名的访问日志。
+- 一次只导入一个模块，经由`python_import_simulation`完成，遵守模拟器的逐模块导入锁:
+  模块的锁正被其他线程(例如请求线程)持有时不去等待，先放到队尾，稍后再试。
+- 进程繁忙时暂停。请求处理代码用`with warmer.busy():`标记繁忙区间，
+  或者传入`busy_check`回调(例如检查队列长度)；空闲持续`idle_delay`秒后才继续。
+- 后台线程尽量降低优先级: Linux上把线程的nice值调到`nice`；其他平台只依靠繁忙时暂停。
+
+如何使用:
+    from module_warmer import ModuleWarmer, load_priorities
+
+    warmer = ModuleWarmer(load_priorities('timings.jsonl')).start()
+
+    def handle_request(request):
+        with warmer.busy():
+            ...
+
+"""
+
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+from fork_safety import register_after_fork
+from python_import_mechanism import GLOBAL_IMPORT_CONTEXT, python_import_simulation
+
+DEFAULT_IDLE_DELAY = 0.2   # 秒
+DEFAULT_POLL_INTERVAL = 0.05
+DEFAULT_NICE = 19
+
+
+def load_priorities(path):
+    """
+    从文件中读取按优先级排列的模块名，重复的模块只保留第一次出现的位置。
+
+    每行可以是一条JSON记录(取其`module`字段，例如`IMPORT_TIMINGS`的记录)，也可以是一个模块名。
+    """
+    names = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name = json.loads(line)['module'] if line.startswith('{') else line
+            names.setdefault(name, None)
+    return list(names)
+
+
+class ModuleWarmer:
+    """
+    在后台线程中按优先级预热模块。
+
+    Args:
+        modules (iterable): 按优先级排列的模块名。
+        context (ImportContext, optional): 在哪个导入上下文中预热，默认是全局上下文。
+        busy_check (callable, optional): 返回True表示进程繁忙，预热暂停。
+        idle_delay (float): 空闲持续多少秒后才继续导入下一个模块。
+        poll_interval (float): 繁忙或等待模块锁时的检查间隔(秒)。
+        nice (int): Linux上后台线程的nice值，为None时不调整。
+    """
+
+    def __init__(self, modules, context=None, busy_check=None, idle_delay=DEFAULT_IDLE_DELAY,
+                 poll_interval=DEFAULT_POLL_INTERVAL, nice=DEFAULT_NICE):
+        self.context = context or GLOBAL_IMPORT_CONTEXT
+        self.busy_check = busy_check
+        self.idle_delay = idle_delay
+        self.poll_interval = poll_interval
+        self.nice = nice
+        self._queue = collections.deque(dict.fromkeys(modules))
+        self._in_flight = 0
+        self._last_busy = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+        self.stats = {'warmed': 0, 'already_loaded': 0, 'failed': 0, 'deferred': 0,
+                      'pauses': 0, 'warm_time': 0.0}
+        self.failures = {}  # 模块名 -> 错误信息
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        # 子进程中没有预热线程；剩余的模块不再预热，需要时在子进程中重新创建预热器。
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stop.set()
+        self._done = threading.Event()
+        self._done.set()
+        self._thread = None
+        self._in_flight = 0
+
+    # --- 繁忙标记 ---
+
+    @contextlib.contextmanager
+    def busy(self):
+        """标记一段繁忙区间(例如处理一个请求)，期间预热暂停。可以嵌套和并发使用。"""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._last_busy = time.monotonic()
+
+    def is_busy(self):
+        if self._in_flight > 0 or (self.busy_check is not None and self.busy_check()):
+            self._last_busy = time.monotonic()
+            return True
+        return time.monotonic() - self._last_busy < self.idle_delay
+
+    # --- 线程 ---
+
+    def start(self):
+        self._stop.clear()
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, name='module-warmer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """停止预热。正在进行的那次导入会先完成。"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wait(self, timeout=None):
+        """等待预热线程结束(列表处理完或被停止)，超时返回False。"""
+        return self._done.wait(timeout)
+
+    @property
+    def pending(self):
+        return list(self._queue)
+
+    def _lower_priority(self):
+        if self.nice is None or not hasattr(os, 'setpriority'):
+            return
+        try:
+            # Linux上nice值是按线程设置的，用线程的原生id即可只影响预热线程。
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except OSError:
+            pass
+
+    def _wait_until_idle(self):
+        """等到进程空闲，返回False表示预热已被停止。"""
+        paused = False
+        while self.is_busy():
+            if not paused:
+                paused = True
+                self.stats['pauses'] += 1
+            if self._stop.wait(self.poll_interval):
+                return False
+        return not self._stop.is_set()
+
+    def _locked_by_other_thread(self, module_name):
+        """模块或它的某个父包正被其他线程导入。"""
+        me = threading.get_ident()
+        parts = module_name.split('.')
+        for i in range(len(parts)):
+            lock = self.context.module_lock('.'.join(parts[:i + 1]))
+            if lock.owner not in (None, me):
+                return True
+        return False
+
+    def _run(self):
+        self._lower_priority()
+        print(f"   [WARM] 开始预热 {len(self._queue)} 个模块")
+        deferred_round = 0
+        while self._queue and self._wait_until_idle():
+            module_name = self._queue.popleft()
+            if module_name in self.context.modules:
+                self.stats['already_loaded'] += 1
+                deferred_round = 0
+                continue
+            if self._locked_by_other_thread(module_name):
+                # 不和请求线程抢锁，放到队尾；整轮都在等锁时稍等一会儿。
+                self._queue.append(module_name)
+                self.stats['deferred'] += 1
+                deferred_round += 1
+                if deferred_round >= len(self._queue) and self._stop.wait(self.poll_interval):
+                    break
+                continue
+            deferred_round = 0
+            started = time.perf_counter()
+            try:
+                python_import_simulation(module_name, context=self.context)
+            except Exception as e:
+                self.stats['failed'] += 1
+                self.failures[module_name] = str(e)
+                print(f"   [WARM] 预热失败: {module_name}: {e}")
+            else:
+                self.stats['warmed'] += 1
+            self.stats['warm_time'] += time.perf_counter() - started
+        print(f"   [WARM] 预热结束: {self.stats}")
+        self._done.set()
@@ -0,0 +1,316 @@
+"""
+合并名称索引 (Merged Name Index)
+==============================
+
+即使有目录列表缓存，`find_in_paths`解析一个顶层名称时仍要按顺序检查`sys.path`中的
+每个条目。路径条目有几十个时，一次未命中的查找就要遍历全部条目。
+
+`MergedNameIndex`把所有路径条目的内容合并成一张表: 顶层名称 -> 第一个提供它的位置，
+并遵循`sys.path`的先后顺序(和`find_in_paths`一样，同一条目中`.py`文件优先于包目录)。
+之后任何顶层查找都只是一次字典读取，与路径条目的数量无关。
+
+- 增量更新: 索引监听目录列表缓存的失效通知(配合`cache_watcher`可实时收到)，
+  只重新扫描变化的那个路径条目，并只重新计算受影响名称的归属。
+  没有被监视器覆盖的条目用mtime校验，每个最外层导入(及其触发的全部嵌套导入)只校验一次，
+  之后的查找仍然只是一次字典读取；不在导入过程中的直接查找每次都校验。
+  在同一次导入中新写出的模块需要先调用`context.invalidate_caches()`，与`importlib`的约定相同。
+  搜索路径列表本身被修改(增删、调整顺序)时，只扫描新加入的条目。
+- 持久化: `save()`把每个条目的名称表和目录mtime写入文件；下次进程启动时`load()`
+  只需对每个条目做一次`stat`，mtime未变的条目无需再列目录。
+
+如何使用:
+    import name_index
+    index = name_index.install_name_index(persist_path='/var/cache/app/name_index.json')
+    python_import_simulation('some_top_level_module')   # 顶层查找走索引
+
+"""
+
+import atexit
+import json
+import os
+import threading
+
+from fork_safety import register_after_fork
+from import_caches import SHARED_DIRECTORY_CACHE
+
+PACKAGE_INIT_FILES = ('__init__.py', '__init__.pyc')
+
+INDEX_FORMAT_VERSION = 1
+
+
+class MergedNameIndex:
+    """
+    路径列表上所有顶层名称的合并索引。
+
+    Args:
+        path_list (list): 被索引的搜索路径。保存的是列表本身的引用，
+            之后对它的修改会在下次查找时被发现。
+        directory_cache: 目录列表缓存，默认是共享缓存。
+    """
+
+    def __init__(self, path_list, directory_cache=SHARED_DIRECTORY_CACHE):
+        self.path_list = path_list
+        self.directory_cache = directory_cache
+        self._paths = []          # 已同步的路径列表快照
+        self._entries = {}        # 路径条目 -> {名称: 'module' / 'package'}
+        self._mtimes = {}         # 路径条目 -> 扫描时的目录mtime_ns
+        self._index = {}          # 名称 -> (路径条目, 类型)
+        self._dirty = set()       # 收到失效通知、等待重新扫描的条目
+        self._validated_generation = None  # 上次用mtime校验条目时所在的导入编号
+        self._lock = threading.RLock()
+        self.stats = {'lookups': 0, 'entry_scans': 0, 'path_syncs': 0, 'mtime_checks': 0}
+        directory_cache.add_listener(self._on_invalidate)
+        from python_import_mechanism import current_import_generation
+        self._current_generation = current_import_generation
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        self._lock = threading.RLock()
+
+    # --- 查找 ---
+
+    def lookup(self, name):
+        """返回`(路径条目, 'module'或'package')`，名称不存在时返回None。"""
+        self.stats['lookups'] += 1
+        if self._dirty or self.path_list != self._paths:
+            self._refresh()
+        generation = self._current_generation()
+        if generation is None or generation != self._validated_generation:
+            if self._find_stale_entries():
+                self._refresh()
+            self._validated_generation = generation
+        return self._index.get(name)
+
+    def invalidate(self):
+        """下次查找时重新校验没有被监视器覆盖的条目。"""
+        self._validated_generation = None
+
+    def _find_stale_entries(self):
+        """用mtime校验没有被监视器覆盖的条目，变化的条目标记为待重新扫描。"""
+        watcher = self.directory_cache.watcher
+        stale = False
+        for path in self._paths:
+            if watcher is None or not watcher.is_watching(path or '.'):
+                self.stats['mtime_checks'] += 1
+                try:
+                    mtime_ns = os.stat(path or '.').st_mtime_ns
+                except OSError:
+                    mtime_ns = None
+                if mtime_ns != self._mtimes.get(path):
+                    self._dirty.add(path)
+                    stale = True
+        return stale
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def __len__(self):
+        return len(self._index)
+
+    # --- 构建与增量更新 ---
+
+    def _scan_entry(self, path):
+        """扫描一个路径条目，返回`{名称: 类型}`。"""
+        self.stats['entry_scans'] += 1
+        # 先记录mtime再列目录: 两者之间发生的变化会让下次校验时mtime不一致，而不会被漏掉。
+        try:
+            self._mtimes[path] = os.stat(path or '.').st_mtime_ns
+        except OSError:
+            self._mtimes[path] = None
+        listing = self.directory_cache.listing(path)
+        names = {}
+        for entry in listing:
+            # 无源码部署中模块只有`.pyc`文件(见`sourceless_build.py`)
+            if entry.endswith('.py'):
+                names[entry[:-3]] = 'module'
+            elif entry.endswith('.pyc'):
+                names[entry[:-4]] = 'module'
+        for entry in listing:
+            if '.' in entry or entry in names:
+                continue
+            if any(os.path.isfile(os.path.join(path, entry, init)) for init in PACKAGE_INIT_FILES):
+                names[entry] = 'package'
+        return names
+
+    def _owner(self, name):
+        """按路径顺序找出第一个提供`name`的条目。"""
+        for path in self._paths:
+            kind = self._entries[path].get(name)
+            if kind is not None:
+                return path, kind
+        return None
+
+    def _refresh(self):
+        with self._lock:
+            if self.path_list != self._paths:
+                self._sync_paths()
+            while self._dirty:
+                path = self._dirty.pop()
+                if path in self._entries:
+                    self._rescan_entry(path)
+
+    def _rescan_entry(self, path):
+        """重新扫描一个条目，只更新名称集合发生变化的那些名称。"""
+        old = self._entries.get(path, {})
+        new = self._scan_entry(path)
+        self._entries[path] = new
+        for name in old.keys() | new.keys():
+            if old.get(name) == new.get(name):
+                continue
+            owner = self._owner(name)
+            if owner is None:
+                self._index.pop(name, None)
+            else:
+                self._index[name] = owner
+
+    def _sync_paths(self):
+        """搜索路径列表变化后重新合并。只有新加入的条目需要扫描。"""
+        self.stats['path_syncs'] += 1
+        paths = []
+        for path in self.path_list:
+            if path not in paths:
+                paths.append(path)
+        for path in paths:
+            if path not in self._entries:
+                self._entries[path] = self._scan_entry(path)
+        for path in list(self._entries):
+            if path not in paths:
+                del self._entries[path]
+                self._mtimes.pop(path, None)
+        self._paths = list(self.path_list)
+
+        # 逆序合并，靠前的条目覆盖靠后的条目，正好符合`sys.path`的优先级。
+        index = {}
+        for path in reversed(paths):
+            kinds = self._entries[path]
+            index.update((name, (path, kind)) for name, kind in kinds.items())
+        self._index = index
+
+    def _on_invalidate(self, path):
+        """目录列表缓存的失效回调。"""
+        if path is None:
+            self._dirty.update(self._entries)
+            return
+        if path in self._entries:
+            self._dirty.add(path)
+        if path == '.' and '' in self._entries:
+            self._dirty.add('')  # 目录缓存用'.'表示`sys.path`中的空字符串
+        # 包目录变化可能让它不再是包(或变成包)，所在的路径条目也要重新扫描。
+        parent = os.path.dirname(path)
+        if parent in self._entries:
+            self._dirty.add(parent)
+
+    def close(self):
+        """停止接收失效通知。"""
+        self.directory_cache.remove_listener(self._on_invalidate)
+
+    # --- 持久化 ---
+
+    def save(self, filepath):
+        """把索引写入文件(先写临时文件再原子替换)。"""
+        with self._lock:
+            self._refresh()
+            data = {
+                'version': INDEX_FORMAT_VERSION,
+                'paths': self._paths,
+                'entries': {path: {'mtime_ns': self._mtimes.get(path), 'names': names}
+                            for path, names in self._entries.items()},
+            }
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath, path_list, directory_cache=SHARED_DIRECTORY_CACHE):
+        """
+        从文件恢复索引。每个条目用一次`stat`校验mtime，只有变化了的条目需要重新扫描；
+        文件不存在或格式不符时返回一个新建的索引。
+        """
+        index = cls(path_list, directory_cache)
+        try:
+            with open(filepath, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            return index
+        for path, entry in data['entries'].items():
+            try:
+                mtime_ns = os.stat(path or '.').st_mtime_ns
+            except OSError:
+                continue
+            if mtime_ns == entry['mtime_ns']:
+                index._entries[path] = entry['names']
+                index._mtimes[path] = mtime_ns
+        return index
+
+
+def install_name_index(context=None, persist_path=None, save_at_exit=True):
+    """
+    为导入上下文启用合并名称索引，之后该上下文的顶层查找都走索引。
+
+    Args:
+        context (ImportContext, optional): 默认是全局上下文。
+        persist_path (str, optional): 索引文件路径。存在时从中恢复，
+            `save_at_exit=True`时在进程退出前写回。
+    """
+    from python_import_mechanism import GLOBAL_IMPORT_CONTEXT
+    context = context or GLOBAL_IMPORT_CONTEXT
+    uninstall_name_index(context)
+    if persist_path:
+        index = MergedNameIndex.load(persist_path, context.path, context.directory_cache)
+        if save_at_exit:
+            atexit.register(index.save, persist_path)
+    else:
+        index = MergedNameIndex(context.path, context.directory_cache)
+    context.name_index = index
+    return index
+
+
+def uninstall_name_index(context=None):
+    from python_import_mechanism import GLOBAL_IMPORT_CONTEXT
+    context = context or GLOBAL_IMPORT_CONTEXT
+    index = context.name_index
+    if index is not None:
+        index.close()
+        context.name_index = None
+
+
+# --- 演示区 ---
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 模拟一个很长的sys.path: 40个目录，目标模块在最后一个目录中
+        entries = []
+        for i in range(40):
+            entry = os.path.join(tmp, f"entry_{i:02d}")
+            os.makedirs(entry)
+            for j in range(50):
+                open(os.path.join(entry, f"mod_{i}_{j}.py"), 'w').close()
+            entries.append(entry)
+        index = MergedNameIndex(entries)
+
+        def linear_lookup(name):
+            for entry in entries:
+                if name + '.py' in SHARED_DIRECTORY_CACHE.listing(entry):
+                    return entry
+            return None
+
+        for label, func in (('逐条目查找', linear_lookup), ('合并索引', index.lookup)):
+            started = time.perf_counter()
+            for _ in range(2000):
+                func('mod_39_7')
+                func('no_such_module')
+            print(f"{label}: {(time.perf_counter() - started) / 4000 * 1e6:.2f}us/次")
+
+        path_file = os.path.join(tmp, 'index.json')
+        index.save(path_file)
+        restored = MergedNameIndex.load(path_file, entries)
+        print(f"mod_39_7 -> {restored.lookup('mod_39_7')}")
+        print(f"从文件恢复: {len(restored)} 个名称, 重新扫描了 {restored.stats['entry_scans']} 个条目")
+        sys.exit(0)
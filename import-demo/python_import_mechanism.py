@@ -18,12 +18,26 @@ Python Import机制详细模拟实现
 
 import sys
 import os
+import atexit
+import builtins
+import collections
+import itertools
+import json
+import threading
+import time
+import tracemalloc
+import warnings
+import weakref
 from types import ModuleType
 import importlib.machinery
 
+from fork_safety import register_after_fork
+from import_caches import SHARED_DIRECTORY_CACHE, SHARED_BYTECODE_CACHE
+from import_metrics import IMPORTS_TOTAL, CACHE_LOOKUPS, PHASE_SECONDS
+
 # --- 模拟实现区 ---
 
-def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=None):
+def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=None, context=None):
     """
     模拟Python内建的`__import__`函数的行为，逐步展示模块导入的全过程。
 
@@ -50,6 +64,10 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
             调用`__import__`处的模块的全局命名空间。
             主要用于相对导入，以确定当前模块所在的包。
 
+        context (ImportContext, optional):
+            在哪个导入上下文中导入。默认是直接使用`sys.modules`/`sys.path`的全局上下文；
+            传入独立的`ImportContext`时，模块表、搜索路径和Spec缓存都只属于该上下文。
+
     ---
     ### 参数映射关系表
 
@@ -100,8 +118,15 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
         ImportError: 当模块找不到、加载失败或发生其他导入相关的错误时抛出。
     """
 
+    if context is None:
+        context = GLOBAL_IMPORT_CONTEXT
+    modules = context.modules
+    phase_started = time.perf_counter()
+
     print(f"\n[->] 开始导入: '{module_name}'")
     print(f"   参数: fromlist={fromlist}, level={level}")
+    if context is not GLOBAL_IMPORT_CONTEXT:
+        print(f"   导入上下文: {context}")
 
     # ========================================================================
     # 阶段1: 模块名解析和规范化 (Parsing and Normalization)
@@ -115,11 +140,13 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
         # 相对导入必须在包内进行，因此需要知道当前模块属于哪个包。
         current_package = get_current_package(globals_dict)
         if not current_package:
+            IMPORTS_TOTAL.inc('error')
             raise ImportError("相对导入只能在包内使用，因为需要知道当前包的上下文。")
 
         # 根据level计算基础包路径
         package_parts = current_package.split('.')
         if level > len(package_parts):
+            IMPORTS_TOTAL.inc('error')
             raise ImportError("相对导入级别超出包层次结构。" )
 
         # level=1 ('.') -> 当前包; level=2 ('..') -> 父包
@@ -138,6 +165,7 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
     # 1.2 分解模块名为层次结构，便于后续逐级导入
     name_parts = module_name.split('.')
     print(f"   模块绝对名称: '{module_name}', 层次: {name_parts}")
+    phase_started = _phase_done('1', phase_started)
 
     # ========================================================================
     # 阶段2: 缓存检查 (Cache Check)
@@ -147,34 +175,99 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
 
     # 2.1 `sys.modules`是所有已加载模块的“花名册”(一个字典)。
     # 如果模块名已在缓存中，直接返回缓存的模块对象。
-    if module_name in sys.modules:
-        cached_module = sys.modules[module_name]
-        print(f"   [OK] 在缓存中找到: '{module_name}'")
-        print(f"   缓存对象: {cached_module}")
+    if module_name in modules:
+        _phase_done('2', phase_started)
+        return _return_cached(module_name, name_parts, fromlist, globals_dict, context)
+
+    # 2.2 独立上下文与全局解释器共享标准库: 标准库模块只在进程中加载一份，
+    # 这既节省内存，也避免了标准库内部直接访问`sys.modules`时看到不一致的模块表。
+    if context.isolated and context.shares(module_name):
+        _phase_done('2', phase_started)
+        return _import_shared_module(module_name, name_parts, fromlist, globals_dict, context)
+
+    # 2.3 缓存未命中，进入真正的导入流程。
+    # 在导入栈中记录当前模块，这样它触发的父包/子模块导入就能知道是谁触发了自己。
+    # 同时持有该模块的导入锁，防止多个线程同时执行同一个模块。
+    _push_import(module_name)
+    try:
+        with context.module_lock(module_name):
+            # 等锁期间，其他线程可能已经完成了这个模块的导入。
+            if module_name in modules:
+                _phase_done('2', phase_started)
+                return _return_cached(module_name, name_parts, fromlist, globals_dict, context)
+            CACHE_LOOKUPS.inc('module_table', 'miss')
+            _phase_done('2', phase_started)
+            return _import_uncached(module_name, name_parts, fromlist, globals_dict, context)
+    finally:
+        _pop_import()
+
+def _return_cached(module_name, name_parts, fromlist, globals_dict, context):
+    """缓存命中时的返回逻辑，与阶段6的返回值规则一致。"""
+    cached_module = context.modules[module_name]
+    CACHE_LOOKUPS.inc('module_table', 'hit')
+    IMPORTS_TOTAL.inc('cached')
+    print(f"   [OK] 在缓存中找到: '{module_name}'")
+    print(f"   缓存对象: {cached_module}")
+
+    # 如果是`from import`，还需要进一步处理fromlist
+    if fromlist:
+        return handle_fromlist(cached_module, fromlist, globals_dict=globals_dict, context=context)
+    # `import a.b.c`即使命中缓存，返回的也是顶层包`a`。
+    if len(name_parts) > 1:
+        return context.modules[name_parts[0]]
+    return cached_module
+
+def _import_shared_module(module_name, name_parts, fromlist, globals_dict, context):
+    """通过全局导入系统加载共享模块，并把它及其父包登记到上下文的模块表中。"""
+    import importlib
+    print(f"   [SHARED] 与全局解释器共享模块: '{module_name}'")
+    if context.time_shared_modules:
+        # 共享模块不在上下文中执行，记下全局导入的耗时，作为导入树中的一个叶子。
+        _push_import(module_name)
+        try:
+            started = time.perf_counter()
+            importlib.import_module(module_name)
+            _record_exec_time(module_name, started, time.perf_counter() - started, context)
+        finally:
+            _pop_import()
+    else:
+        importlib.import_module(module_name)
+    IMPORTS_TOTAL.inc('shared')
+    for i in range(len(name_parts)):
+        name = '.'.join(name_parts[:i + 1])
+        context.modules.setdefault(name, sys.modules[name])
+    cached_module = context.modules[module_name]
+    if fromlist:
+        return handle_fromlist(cached_module, fromlist, globals_dict=globals_dict, context=context)
+    return context.modules[name_parts[0]] if len(name_parts) > 1 else cached_module
 
-        # 如果是`from import`，还需要进一步处理fromlist
-        if fromlist:
-            return handle_fromlist(cached_module, fromlist, globals_dict=globals_dict)
-        return cached_module
+def _import_uncached(module_name, name_parts, fromlist, globals_dict, context):
+    """
+    阶段2.4到阶段6: 缓存未命中时查找、加载并执行模块。
+    从`python_import_simulation`中拆分出来，便于在外层统一维护导入栈和模块锁。
+    """
+    modules = context.modules
 
-    # 2.2 对于嵌套模块 (如 a.b.c)，必须先确保其父包 (a, a.b) 已被导入。
+    # 2.4 对于嵌套模块 (如 a.b.c)，必须先确保其父包 (a, a.b) 已被导入。
     parent_modules = []
     # 遍历除最后一节外的所有部分 (e.g., for 'a.b.c', process 'a' and 'a.b')
     for i in range(len(name_parts) - 1):
         parent_name = '.'.join(name_parts[:i + 1])
-        if parent_name in sys.modules:
-            parent_modules.append((parent_name, sys.modules[parent_name]))
+        if parent_name in modules:
+            parent_modules.append((parent_name, modules[parent_name]))
             print(f"   [PKG] 父包已缓存: '{parent_name}'")
         else:
             # 如果父包不在缓存中，递归调用本函数来导入它。
             print(f"   [CACHE] 需要先导入父包: '{parent_name}'")
             try:
-                python_import_simulation(parent_name)  # 导入父包
+                python_import_simulation(parent_name, context=context)  # 导入父包
                 # 检查递归调用是否真的成功了
-                parent_module = sys.modules.get(parent_name)
+                parent_module = modules.get(parent_name)
                 if parent_module is None:
                     raise ImportError(f"递归导入父包 '{parent_name}' 失败：模块未在缓存中")
                 parent_modules.append((parent_name, parent_module))
+            except ImportBudgetExceeded:
+                raise
             except ImportError:
                 # 递归导入失败，重新抛出更有意义的错误
                 raise ImportError(f"无法导入 '{module_name}'：父包 '{parent_name}' 导入失败")
@@ -185,6 +278,8 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
     # ========================================================================
     print("\n[3] 阶段3: 模块查找")
 
+    # 阶段2.4中递归导入父包的耗时已计入父包自己的各个阶段，不计入本模块。
+    phase_started = time.perf_counter()
     module_spec = None
 
     # 3.1 模拟Python的`sys.meta_path`机制。
@@ -194,15 +289,16 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
     # 首先检查是否是内置模块
     if module_name in sys.builtin_module_names:
         print(f"   [OK] 找到内置模块: '{module_name}'")
+        IMPORTS_TOTAL.inc('builtin')
         # 内置模块的处理需要特殊逻辑
-        return _handle_builtin_module(module_name)
+        return _handle_builtin_module(module_name, context)
 
     # 对于子模块，优先使用父包的搜索路径
     if len(name_parts) > 1 and parent_modules:
         print(f"   [SUBMODULE] 优先在父包路径中查找子模块")
-        search_paths = determine_search_paths(name_parts, parent_modules)
+        search_paths = determine_search_paths(name_parts, parent_modules, context)
         print(f"   在父包路径中搜索: {search_paths[:3]}...")
-        module_spec = find_in_paths(module_name, search_paths)
+        module_spec = find_in_paths(module_name, search_paths, context)
 
         if module_spec:
             print(f"   [OK] 在父包路径中找到: '{module_spec.name}' at {module_spec.origin}")
@@ -211,31 +307,35 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
 
     # 如果在父包路径中没找到，或者不是子模块，则使用系统查找器
     if not module_spec:
-        # 模拟遍历`sys.meta_path`中的查找器
-        for finder in sys.meta_path:
-            finder_name = finder.__class__.__name__
-            # print(f"   尝试查找器: {finder_name}") # 此处输出过于冗长，故注释
-            try:
-                # 每个查找器都有`find_spec`方法，尝试查找模块规范
-                spec = finder.find_spec(module_name)
-                if spec:
-                    module_spec = spec
-                    print(f"   [OK] 找到模块规范(Spec): '{spec.name}' at {spec.origin}")
-                    break # 找到即停止
-            except Exception as e:
-                print(f"   [FAIL] 查找器 {finder_name} 失败: {e}")
-                continue
+        # 按协议，顶层模块传入的路径是None(由查找器自己使用`sys.path`)，子模块传入父包的`__path__`。
+        # 独立上下文没有共享`sys.path`，顶层模块改为传入上下文自己的路径列表。
+        if parent_modules:
+            finder_path = getattr(parent_modules[-1][1], '__path__', None)
+        else:
+            finder_path = context.path if context.isolated else None
+
+        # 模拟遍历`sys.meta_path`中的查找器，每个查找器的调用都计入`FINDER_STATS`
+        module_spec = _find_spec_in_meta_path(module_name, name_parts, finder_path, context)
+        if module_spec:
+            print(f"   [OK] 找到模块规范(Spec): '{module_spec.name}' at {module_spec.origin}")
+
+        # 如果启用了自定义加载模式，用模拟器自己的加载器替换标准的源码加载器，
+        # 这样由`sys.meta_path`找到的源文件也会走所选的加载模式。
+        if module_spec and _active_loader_mode['name'] != 'source':
+            module_spec = _respec_source_module(module_spec)
 
     # 3.2 如果所有`meta_path`查找器都失败了，则回退到我们简化的路径查找。
     # 真实的Python在这里会由`PathFinder`处理`sys.path`。
     if not module_spec:
         # 确定搜索路径：优先用父包的`__path__`，否则用`sys.path`
-        search_paths = determine_search_paths(name_parts, parent_modules)
+        search_paths = determine_search_paths(name_parts, parent_modules, context)
         print(f"   在以下路径中搜索: {search_paths[:3]}...")
-        module_spec = find_in_paths(module_name, search_paths)
+        module_spec = find_in_paths(module_name, search_paths, context)
 
     # 3.3 如果最终还是没找到，导入失败。
+    phase_started = _phase_done('3', phase_started)
     if not module_spec:
+        IMPORTS_TOTAL.inc('not_found')
         raise ImportError(f"No module named '{module_name}'")
 
     # ========================================================================
@@ -259,6 +359,10 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
     # 4.2 设置模块的基本属性，如__name__, __file__, __package__等。
     # 这一步在模块代码执行前完成，至关重要。
     setup_module_attributes(module, module_spec)
+    # 独立上下文中，模块代码里的`import`语句也要在同一个上下文中完成，
+    # 因此给模块一份专属的`__builtins__`，其中的`__import__`指向该上下文。
+    if context.isolated:
+        module.__dict__['__builtins__'] = context.builtins
     print(f"   创建模块对象: {module}")
     print(f"   模块属性: __name__='{getattr(module, '__name__', None)}'")
     print(f"            __file__='{getattr(module, '__file__', None)}'")
@@ -268,8 +372,9 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
     # 这是Python解决循环导入问题的关键！
     # 如果在执行本模块代码时，有其他模块反过来导入本模块，
     # 它们将从`sys.modules`中获取到这个“不完整”的模块对象，而不是无限递归。
-    sys.modules[module_name] = module
+    modules[module_name] = module
     print(f"   [CACHE] 提前缓存模块 (防止循环导入)")
+    _phase_done('4', phase_started)
 
     # ========================================================================
     # 阶段5: 模块执行 (Execution)
@@ -283,56 +388,88 @@ def python_import_simulation(module_name, fromlist=None, level=0, globals_dict=N
             print(f"   开始执行模块代码...")
             # `exec_module`会读取`.py`文件内容，并在`module`的`__dict__`中执行。
             # 所有顶层代码（变量赋值、函数/类定义、其他import语句）都在此发生。
+            memory_before = _traced_memory()
+            exec_started = time.perf_counter()
             module_spec.loader.exec_module(module)
-            print(f"   [OK] 模块执行完成")
+            exec_time = time.perf_counter() - exec_started
+            PHASE_SECONDS.observe(exec_time, '5')
+            print(f"   [OK] 模块执行完成 ({exec_time * 1000:.2f}ms)")
+            # 5.2 记录执行耗时，并检查是否超出导入耗时预算。
+            _record_exec_time(module_name, exec_started, exec_time, context)
+            # 5.3 启用了访问跟踪时，开始记录模块的属性是否被读取过。
+            if _access_tracking['enabled']:
+                _track_module_access(module, exec_time, memory_before, context)
+            # 5.4 通知导入监听者(例如`module_eviction`的LRU管理器)。
+            _notify_import_listeners(module, exec_time, context)
         else:
             print(f"   [WARN] 无加载器或无执行方法，跳过执行。")
 
+    except ImportBudgetExceeded:
+        # 超出预算按导入失败处理，同样要移除已缓存的模块。
+        IMPORTS_TOTAL.inc('budget_exceeded')
+        modules.pop(module_name, None)
+        raise
     except Exception as e:
-        # 5.2 如果执行失败，必须将之前放入缓存的“损坏”模块移除。
+        # 5.5 如果执行失败，必须将之前放入缓存的“损坏”模块移除。
+        IMPORTS_TOTAL.inc('error')
         print(f"   [FAIL] 模块执行失败: {e}")
-        if module_name in sys.modules:
-            del sys.modules[module_name]
+        if module_name in modules:
+            del modules[module_name]
         raise ImportError(f"执行模块 '{module_name}' 时出错: {e}")
+    IMPORTS_TOTAL.inc('loaded')
 
     # ========================================================================
     # 阶段6: 后处理和返回 (Post-processing)
     # 目标: 处理`fromlist`，并返回正确的对象给调用者。
     # ========================================================================
     print("\n[6] 阶段6: 后处理和返回")
-
-    # 6.1 对于子模块导入(a.b.c)，需要将子模块(c)绑定为父包(b)的属性。
-    if '.' in module_name:
-        parent_name, _, submodule_name = module_name.rpartition('.')
-        parent_module = sys.modules.get(parent_name)
-        if parent_module:
-            setattr(parent_module, submodule_name, module)
-            print(f"   设置父包属性: {parent_name}.{submodule_name}")
-        else:
-            # 这种情况不应该发生，如果发生说明有bug
-            raise ImportError(f"无法绑定子模块 '{submodule_name}' 到父包 '{parent_name}'：父包不在缓存中")
-
-    # 6.2 处理`from module import item`语句
-    if fromlist:
-        print(f"   处理from import: {fromlist}")
-        # `handle_fromlist`会确保`fromlist`中的每一项都存在，
-        # 如果某项是子模块，会触发对该子模块的导入。
-        return handle_fromlist(module, fromlist, globals_dict=globals_dict)
-
-    # 6.3 对于`import a.b.c`，返回的是顶层包`a`。
-    # 这是`import`语句的一个重要特性。
-    if '.' in module_name:
-        top_level_name = name_parts[0]
-        result_module = sys.modules[top_level_name]
-        print(f"   返回顶层包: '{top_level_name}'")
-        return result_module
-
-    # 6.4 对于`import a`，直接返回模块`a`。
-    print(f"   [OK] 导入完成，返回模块: {module}")
-    return module
+    phase_started = time.perf_counter()
+    try:
+        # 6.1 启用了子模块延迟导入时，给包装上PEP 562的`__getattr__`/`__dir__`。
+        if module_spec.submodule_search_locations is not None and _wants_lazy_submodules(module_name):
+            install_lazy_submodules(module, context)
+            print(f"   [LAZY] 子模块将在首次访问时导入")
+
+        # 6.2 对于子模块导入(a.b.c)，需要将子模块(c)绑定为父包(b)的属性。
+        if '.' in module_name:
+            parent_name, _, submodule_name = module_name.rpartition('.')
+            parent_module = modules.get(parent_name)
+            if parent_module:
+                setattr(parent_module, submodule_name, module)
+                print(f"   设置父包属性: {parent_name}.{submodule_name}")
+            else:
+                # 这种情况不应该发生，如果发生说明有bug
+                raise ImportError(f"无法绑定子模块 '{submodule_name}' 到父包 '{parent_name}'：父包不在缓存中")
+
+        # 6.3 处理`from module import item`语句
+        if fromlist:
+            print(f"   处理from import: {fromlist}")
+            # `handle_fromlist`会确保`fromlist`中的每一项都存在，
+            # 如果某项是子模块，会触发对该子模块的导入。
+            return handle_fromlist(module, fromlist, globals_dict=globals_dict, context=context)
+
+        # 6.4 对于`import a.b.c`，返回的是顶层包`a`。
+        # 这是`import`语句的一个重要特性。
+        if '.' in module_name:
+            top_level_name = name_parts[0]
+            result_module = modules[top_level_name]
+            print(f"   返回顶层包: '{top_level_name}'")
+            return result_module
+
+        # 6.5 对于`import a`，直接返回模块`a`。
+        print(f"   [OK] 导入完成，返回模块: {module}")
+        return module
+    finally:
+        _phase_done('6', phase_started)
 
 # --- 辅助函数区 ---
 
+def _phase_done(phase, started):
+    """把从`started`到现在的耗时计入阶段耗时直方图，返回当前时间作为下一阶段的起点。"""
+    now = time.perf_counter()
+    PHASE_SECONDS.observe(now - started, phase)
+    return now
+
 def setup_module_attributes(module, spec):
     """
     根据模块规范(Spec)为新创建的模块对象设置标准属性。
@@ -362,74 +499,161 @@ def setup_module_attributes(module, spec):
             # 顶层模块不属于任何包。
             module.__package__ = None
 
-def _handle_builtin_module(module_name):
+def _handle_builtin_module(module_name, context=None):
     """
     处理内置模块的特殊逻辑。
     内置模块不需要经过完整的导入流程，直接使用系统的导入机制。
+    内置模块在整个进程中只有一份，独立上下文中登记的也是同一个对象。
     """
+    if context is None:
+        context = GLOBAL_IMPORT_CONTEXT
     print(f"   [BUILTIN] 使用系统机制导入内置模块: {module_name}")
 
     # 检查是否已经在缓存中
-    if module_name in sys.modules:
+    if module_name in context.modules:
         print(f"   [CACHE] 内置模块已在缓存中: {module_name}")
-        return sys.modules[module_name]
+        return context.modules[module_name]
 
     # 使用系统的内置导入器
     try:
         import importlib
         module = importlib.import_module(module_name)
+        context.modules[module_name] = module
         print(f"   [OK] 内置模块导入成功: {module}")
         return module
     except ImportError as e:
         raise ImportError(f"Failed to import builtin module '{module_name}': {e}")
 
 
-def determine_search_paths(name_parts, parent_modules):
+def determine_search_paths(name_parts, parent_modules, context=None):
     """
     确定用于查找模块的路径列表。
     - 如果是子模块，优先使用其父包的`__path__`属性。
-    - 否则，使用全局的`sys.path`。
+    - 否则，使用导入上下文的搜索路径(全局上下文中就是`sys.path`)。
     """
     if parent_modules:
         parent_name, parent_module = parent_modules[-1]
         if hasattr(parent_module, '__path__') and parent_module.__path__:
             print(f"   使用父包 '{parent_name}' 的搜索路径")
             return parent_module.__path__
-    return sys.path
+    return (context or GLOBAL_IMPORT_CONTEXT).path
 
-def find_in_paths(module_name, search_paths):
+def find_in_paths(module_name, search_paths, context=None):
     """
     一个简化的`PathFinder`，在指定路径中查找模块并创建Spec。
+
+    目录内容来自共享的目录列表缓存，每个目录只需一次`stat`即可确认缓存仍然有效；
+    查找结果记录在上下文的Spec缓存中，再次查找同一模块时直接复用。
     """
+    if context is None:
+        context = GLOBAL_IMPORT_CONTEXT
+    directory_cache = context.directory_cache
+
     name_parts = module_name.split('.')
     module_basename = name_parts[-1]
-    
-    for path in search_paths:
-        # 1. 尝试作为普通模块文件查找 (.py)
-        py_file = os.path.join(path, module_basename + '.py')
-        if os.path.isfile(py_file):
-            print(f"   在路径中找到文件: {py_file}")
-            return create_file_spec(module_name, py_file)
-        
-        # 2. 尝试作为包目录查找 (包含__init__.py)
+    name_index = context.name_index
+    use_index = name_index is not None and search_paths is name_index.path_list and len(name_parts) == 1
+
+    cache_key = (module_name, tuple(search_paths), _active_loader_mode['generation'])
+    cached = context.spec_cache.get(cache_key)
+    if cached is not None:
+        cached_spec, cached_path = cached
+        if _cached_spec_is_current(cached_spec, cached_path, search_paths,
+                                   name_index if use_index else None, directory_cache):
+            CACHE_LOOKUPS.inc('spec_cache', 'hit')
+            print(f"   [SPEC-CACHE] 复用已缓存的Spec: {cached_spec.origin}")
+            return cached_spec
+        del context.spec_cache[cache_key]
+    CACHE_LOOKUPS.inc('spec_cache', 'miss')
+
+    if use_index:
+        # 合并名称索引覆盖了整个搜索路径，一次字典读取即可得到结果，无需逐个条目查找。
+        found = name_index.lookup(module_name)
+        if found is None:
+            return None
+        path, kind = found
+        print(f"   [NAME-INDEX] 在索引中找到{'文件' if kind == 'module' else '包'}: "
+              f"{os.path.join(path, module_basename)}")
+        spec = _find_in_directory(module_name, path, directory_cache.listing(path), directory_cache)
+    else:
+        for path in search_paths:
+            entries = directory_cache.listing(path)
+            if entries:
+                spec = _find_in_directory(module_name, path, entries, directory_cache)
+                if spec is not None:
+                    break
+        else:
+            return None
+
+    if spec is not None:
+        context.spec_cache[cache_key] = (spec, path)
+    return spec
+
+def _cached_spec_is_current(spec, found_path, search_paths, name_index, directory_cache):
+    """
+    缓存的Spec仍然是重新查找会得到的结果: 它所在的条目仍然解析到同一个文件，
+    并且排在前面的条目中没有新出现同名的模块(否则新模块会遮住它)。
+
+    使用名称索引时由索引负责路径顺序，只需确认索引仍指向同一个条目。
+    """
+    module_basename = spec.name.rpartition('.')[2]
+    if name_index is not None:
+        found = name_index.lookup(spec.name)
+        earlier = ()
+        if found is None or found[0] != found_path:
+            return False
+    else:
+        earlier = search_paths[:search_paths.index(found_path)] if found_path in search_paths else ()
+    for path in earlier:
+        if _locate_in_directory(module_basename, path, directory_cache.listing(path), directory_cache):
+            return False
+    located = _locate_in_directory(module_basename, found_path,
+                                   directory_cache.listing(found_path), directory_cache)
+    return located is not None and located[0] == spec.origin
+
+def _locate_in_directory(module_basename, path, entries, directory_cache):
+    """
+    按查找顺序确定一个路径条目中提供该模块的文件。
+
+    Returns:
+        tuple: 普通模块返回`(文件, None)`，包返回`(__init__文件, 包目录)`；找不到时返回None。
+    """
+    # 1. 普通模块文件: 源码(.py)优先，其次是无源码部署的字节码(.pyc)
+    for suffix in ('.py', '.pyc'):
+        if module_basename + suffix in entries:
+            return os.path.join(path, module_basename + suffix), None
+
+    # 2. 包目录 (包含__init__.py或__init__.pyc)
+    if module_basename in entries:
         pkg_dir = os.path.join(path, module_basename)
-        init_file = os.path.join(pkg_dir, '__init__.py')
-        if os.path.isdir(pkg_dir) and os.path.isfile(init_file):
-            print(f"   在路径中找到包: {pkg_dir}")
-            return create_package_spec(module_name, init_file, [pkg_dir])
-    
+        pkg_entries = directory_cache.listing(pkg_dir)
+        for init_name in ('__init__.py', '__init__.pyc'):
+            if init_name in pkg_entries:
+                return os.path.join(pkg_dir, init_name), pkg_dir
     return None
 
-def handle_fromlist(module, fromlist, globals_dict=None):
+def _find_in_directory(module_name, path, entries, directory_cache):
+    """在一个路径条目中查找模块，`entries`是该目录的列表。找不到时返回None。"""
+    located = _locate_in_directory(module_name.rpartition('.')[2], path, entries, directory_cache)
+    if located is None:
+        return None
+    origin, pkg_dir = located
+    if pkg_dir is None:
+        print(f"   在路径中找到文件: {origin}")
+        return create_file_spec(module_name, origin)
+    print(f"   在路径中找到包: {pkg_dir}")
+    return create_package_spec(module_name, origin, [pkg_dir])
+
+def handle_fromlist(module, fromlist, globals_dict=None, context=None):
     """
     处理`from module import item1, item2`中的`fromlist`。
     """
     # 遍历`fromlist`中的每一项
     for item in fromlist:
         if item == '*':
-            # 对于`from module import *`，导入`__all__`中定义的或所有非下划线开头的属性。
-            # 注意：这并不会真的在当前命名空间创建变量，只是一个模拟过程。
-            handle_star_import(module)
+            # 对于`from module import *`，把`__all__`中定义的或所有非下划线开头的名称
+            # 绑定到调用方的全局命名空间中。
+            handle_star_import(module, globals_dict=globals_dict, context=context)
         else:
             # 检查`item`是否是`module`的一个属性。
             if not hasattr(module, item):
@@ -439,20 +663,89 @@ def handle_fromlist(module, fromlist, globals_dict=None):
                     submodule_name = f"{module.__name__}.{item}"
                     try:
                         # 递归导入这个子模块
-                        python_import_simulation(submodule_name, globals_dict=globals_dict)
+                        python_import_simulation(submodule_name, globals_dict=globals_dict, context=context)
+                    except ImportBudgetExceeded:
+                        raise
                     except ImportError:
                         # 如果导入失败，说明它确实只是一个不存在的属性，而不是子模块。
                         # Python的真实行为会在这里抛出ImportError，但为了模拟简化，我们忽略。
                         pass
     return module
 
-def handle_star_import(module):
-    """处理`from module import *`"""
-    if hasattr(module, '__all__'):
-        items = module.__all__
-    else:
-        items = [name for name in dir(module) if not name.startswith('_')]
-    print(f"   [*] 星号导入项目: {items}")
+# 模块 -> (指纹, 导出名称元组)。模块被回收后条目自动消失。
+_EXPORT_TABLES = weakref.WeakKeyDictionary()
+
+def _export_fingerprint(module):
+    """
+    模块命名空间的廉价指纹: 字典大小、最后插入的键以及`__all__`的内容。
+    增删名称、替换`__all__`或原地修改它都会改变指纹。没有`__all__`时计算代价是O(1)，
+    有`__all__`时与它的长度成正比(远小于扫描整个模块字典)。
+    """
+    namespace = module.__dict__
+    exports = namespace.get('__all__')
+    last_key = next(reversed(namespace), None)
+    return len(namespace), last_key, None if exports is None else tuple(exports)
+
+def get_export_table(module):
+    """
+    返回`from module import *`会导出的名称元组。
+
+    结果按模块缓存，只有模块命名空间的指纹变化时才重新计算，
+    避免每次星号导入都扫描整个模块字典。
+    """
+    fingerprint = _export_fingerprint(module)
+    cached = _EXPORT_TABLES.get(module)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    names = fingerprint[2]  # 指纹中已经是`__all__`的元组
+    if names is None:
+        names = tuple(name for name in module.__dict__ if not name.startswith('_'))
+    _EXPORT_TABLES[module] = (fingerprint, names)
+    return names
+
+def _import_listed_submodules(package, names, context=None):
+    """
+    `__all__`中列出、但包里还没有的名称通常是子模块，一次性批量导入它们。
+    包目录只列一次，不存在对应文件的名称直接跳过。
+    """
+    if context is None:
+        context = GLOBAL_IMPORT_CONTEXT
+    missing = [name for name in names if name not in package.__dict__]
+    if not missing:
+        return
+    available = set()
+    for path in package.__path__:
+        entries = context.directory_cache.listing(path)
+        for name in missing:
+            # 与`find_in_paths`的判断相同: .py/.pyc模块，或含`__init__`的包目录
+            if _locate_in_directory(name, path, entries, context.directory_cache) is not None:
+                available.add(name)
+    batch = [name for name in missing if name in available]
+    if batch:
+        print(f"   [*] 批量导入`__all__`中的子模块: {batch}")
+    for name in batch:
+        python_import_simulation(f"{package.__name__}.{name}", context=context)
+
+def handle_star_import(module, globals_dict=None, context=None):
+    """
+    处理`from module import *`: 计算导出名称，并把它们绑定到调用方的`globals_dict`中。
+
+    Returns:
+        tuple: 导出的名称。
+    """
+    items = get_export_table(module)
+    # 星号导入直接读取模块字典，不经过属性访问，需要单独记为一次使用。
+    _note_module_access(module)
+    if hasattr(module, '__path__') and '__all__' in module.__dict__:
+        _import_listed_submodules(module, items, context)
+    print(f"   [*] 星号导入项目: {list(items)}")
+    if globals_dict is not None:
+        namespace = module.__dict__
+        try:
+            globals_dict.update({name: namespace[name] for name in items})
+        except KeyError as e:
+            # 与真实解释器一致: `__all__`中列出了不存在的名称时报AttributeError。
+            raise AttributeError(f"module '{module.__name__}' has no attribute {e}") from None
     return items
 
 def get_current_package(globals_dict=None):
@@ -470,6 +763,710 @@ def get_current_package(globals_dict=None):
             return name.rpartition('.')[0]
     return None
 
+# --- 子模块延迟导入区 (PEP 562) ---
+
+# `enabled`为True时，模拟器导入的包会获得模块级`__getattr__`/`__dir__`:
+# 第一次访问`package.submodule`时才导入子模块。`packages`为None表示所有包，否则只限这些包。
+_lazy_submodule_config = {'enabled': False, 'packages': None}
+
+def set_lazy_submodules(enabled=True, packages=None):
+    """
+    开关子模块延迟导入。只影响之后导入的包。
+
+    Args:
+        enabled (bool): 是否为包安装延迟导入的`__getattr__`/`__dir__`。
+        packages (iterable, optional): 只对这些包名启用，默认对所有包启用。
+
+    Returns:
+        dict: 之前的设置，可用于恢复: `set_lazy_submodules(**old)`。
+    """
+    previous = dict(_lazy_submodule_config)
+    _lazy_submodule_config['enabled'] = bool(enabled)
+    _lazy_submodule_config['packages'] = None if packages is None else frozenset(packages)
+    return previous
+
+def list_submodules(package, context=None):
+    """
+    列出包的`__path__`中所有可导入的子模块名，目录内容来自共享的目录列表缓存。
+    判断规则与查找器相同(`_locate_in_directory`): `.py`/`.pyc`文件，
+    以及含有`__init__.py`或`__init__.pyc`的子目录。
+    """
+    directory_cache = (context or GLOBAL_IMPORT_CONTEXT).directory_cache
+    names = set()
+    for path in package.__path__:
+        entries = directory_cache.listing(path)
+        for entry in entries:
+            name, suffix = os.path.splitext(entry)
+            if suffix in ('.py', '.pyc'):
+                if name != '__init__':
+                    names.add(name)
+            elif not suffix and _locate_in_directory(entry, path, entries, directory_cache) is not None:
+                names.add(entry)
+    return names
+
+def _has_submodule(package, name, context):
+    """只检查一个名称: 包的某个`__path__`条目中是否有可导入的`name`子模块。"""
+    directory_cache = context.directory_cache
+    return any(_locate_in_directory(name, path, directory_cache.listing(path), directory_cache) is not None
+               for path in package.__path__)
+
+def install_lazy_submodules(package, context=None):
+    """
+    为包安装模块级`__getattr__`和`__dir__`(PEP 562)。
+    包自己定义的`__getattr__`/`__dir__`会被保留，非子模块的名称交给它们处理。
+    已经安装过时什么也不做。
+    """
+    if context is None:
+        context = GLOBAL_IMPORT_CONTEXT
+    namespace = package.__dict__
+    if getattr(namespace.get('__getattr__'), '_lazy_submodules', False):
+        return
+    own_getattr = namespace.get('__getattr__')
+    own_dir = namespace.get('__dir__')
+
+    def __getattr__(name):
+        # 只有包目录中确实存在的子模块才会被导入，`hasattr`之类的探测不会触发导入。
+        # 每次只检查被访问的名称，不列出整个包。
+        if not name.startswith('__') and _has_submodule(package, name, context):
+            full_name = f"{package.__name__}.{name}"
+            print(f"   [LAZY] 首次访问，导入子模块: {full_name}")
+            python_import_simulation(full_name, context=context)
+            submodule = namespace[name] = context.modules[full_name]
+            return submodule
+        if own_getattr is not None:
+            return own_getattr(name)
+        raise AttributeError(f"module '{package.__name__}' has no attribute '{name}'")
+
+    def __dir__():
+        names = set(own_dir() if own_dir is not None else namespace)
+        return sorted(names | list_submodules(package, context))
+
+    __getattr__._lazy_submodules = True
+    namespace['__getattr__'] = __getattr__
+    namespace['__dir__'] = __dir__
+
+def _wants_lazy_submodules(module_name):
+    packages = _lazy_submodule_config['packages']
+    return _lazy_submodule_config['enabled'] and (packages is None or module_name in packages)
+
+# --- 导入上下文区 ---
+
+class _DeadlockError(ImportError):
+    """两个线程互相等待对方持有的模块锁。"""
+
+class _ModuleLock:
+    """
+    可重入的模块导入锁，带简单的死锁检测。
+    同一线程可以重复获取(循环导入)，不同线程之间互斥。
+    """
+
+    # 线程id -> 该线程正在等待的锁，用于死锁检测
+    _waiting_for = {}
+
+    def __init__(self, name):
+        self.name = name
+        self.condition = threading.Condition(threading.Lock())
+        self.owner = None
+        self.count = 0
+
+    def _has_deadlock(self, me):
+        # 沿着"锁的持有者正在等待的锁"一路追下去，如果回到自己就是死锁。
+        lock = self
+        seen = set()
+        while lock is not None and lock.owner is not None and lock.owner not in seen:
+            if lock.owner == me:
+                return True
+            seen.add(lock.owner)
+            lock = _ModuleLock._waiting_for.get(lock.owner)
+        return False
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self.condition:
+            while self.owner not in (None, me):
+                if self._has_deadlock(me):
+                    raise _DeadlockError(f"导入 '{self.name}' 时检测到死锁")
+                _ModuleLock._waiting_for[me] = self
+                try:
+                    self.condition.wait()
+                finally:
+                    _ModuleLock._waiting_for.pop(me, None)
+            self.owner = me
+            self.count += 1
+
+    def release(self):
+        with self.condition:
+            self.count -= 1
+            if self.count == 0:
+                self.owner = None
+                self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+@register_after_fork
+def _forget_waiters_after_fork():
+    # 等待中的线程在子进程中都不存在了。
+    _ModuleLock._waiting_for = {}
+
+class ImportContext:
+    """
+    一套独立的导入状态，相当于一个"迷你解释器"的导入系统:
+
+    - `modules`: 模块表，作用同`sys.modules`。
+    - `path`: 顶层模块的搜索路径，作用同`sys.path`。
+    - `meta_path`: 查找器列表，作用同`sys.meta_path`。
+    - `spec_cache`: 该上下文自己的Spec缓存。
+    - 每个模块一把导入锁，保证同一模块在同一上下文中只被执行一次。
+
+    多个上下文之间只共享只读的目录列表缓存和编译结果缓存(见`import_caches.py`)，
+    因此可以在同一进程中为不同租户加载互相隔离的插件集合:
+
+        tenant = ImportContext(path=['/plugins/tenant_a'] + sys.path)
+        plugin = tenant.import_module('plugin_main')
+
+    独立上下文中执行的模块拥有专属的`__builtins__`，模块代码里的`import`语句
+    也会在同一上下文中完成。标准库模块(`shared_modules`，默认是`sys.stdlib_module_names`)
+    与全局解释器共享同一份对象，不会在每个上下文中重复执行。`time_shared_modules`为True时，
+    共享模块的全局导入耗时也记入`IMPORT_TIMINGS`(进程中已加载的模块耗时接近0)。
+    """
+
+    def __init__(self, path=None, modules=None, meta_path=None, name=None, shared_modules=None,
+                 time_shared_modules=False):
+        self.name = name or f"context-{id(self):x}"
+        self.isolated = True
+        # 这些顶层名称下的模块与全局解释器共享，默认是全部标准库。
+        self.shared_modules = frozenset(sys.stdlib_module_names if shared_modules is None
+                                        else shared_modules)
+        self.time_shared_modules = time_shared_modules
+        self._modules = {} if modules is None else modules
+        self._path = list(sys.path if path is None else path)
+        if meta_path is None:
+            # 模拟器自己的路径查找器优先，使用共享缓存；真实的PathFinder放在最后，
+            # 只用来找扩展模块等模拟器不支持的文件类型。
+            meta_path = [importlib.machinery.BuiltinImporter,
+                         importlib.machinery.FrozenImporter,
+                         SimulatorPathFinder(self),
+                         importlib.machinery.PathFinder]
+        self._meta_path = list(meta_path)
+        self.spec_cache = {}
+        self.directory_cache = SHARED_DIRECTORY_CACHE
+        self.bytecode_cache = SHARED_BYTECODE_CACHE
+        # 由`name_index.install_name_index`设置，启用后顶层名称的查找走合并索引。
+        self.name_index = None
+        # 顶层包名 -> 解析它的`meta_path`查找器，供自适应查找顺序使用。
+        self.finder_memory = {}
+        self._module_locks = weakref.WeakValueDictionary()
+        self._locks_guard = threading.Lock()
+        self._builtins = None
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        """
+        fork后只有调用fork的线程还在。其他线程持有的模块锁永远不会被释放，直接丢弃；
+        当前线程自己持有的锁(在模块代码中fork)保留所有权，只重建内部的条件变量。
+        """
+        me = threading.get_ident()
+        kept = weakref.WeakValueDictionary()
+        for name, lock in list(self._module_locks.items()):
+            if lock.owner == me:
+                lock.condition = threading.Condition(threading.Lock())
+                kept[name] = lock
+        self._module_locks = kept
+        self._locks_guard = threading.Lock()
+
+    @property
+    def modules(self):
+        return self._modules
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def meta_path(self):
+        return self._meta_path
+
+    @property
+    def builtins(self):
+        """该上下文中模块使用的`__builtins__`，其中`__import__`指向本上下文。"""
+        if self._builtins is None:
+            namespace = dict(builtins.__dict__)
+            namespace['__import__'] = self.__import__
+            self._builtins = namespace
+        return self._builtins
+
+    def shares(self, module_name):
+        """模块是否与全局解释器共享(按顶层名称判断)。"""
+        return module_name.partition('.')[0] in self.shared_modules
+
+    def module_lock(self, module_name):
+        """返回某个模块的导入锁；没有线程使用时锁会被自动回收。"""
+        with self._locks_guard:
+            lock = self._module_locks.get(module_name)
+            if lock is None:
+                lock = self._module_locks[module_name] = _ModuleLock(module_name)
+            return lock
+
+    def import_module(self, module_name, fromlist=None, level=0, globals_dict=None):
+        """在本上下文中导入模块，参数同`python_import_simulation`。"""
+        return python_import_simulation(module_name, fromlist, level, globals_dict, context=self)
+
+    def __import__(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """与内建`__import__`签名一致，供模块代码中的`import`语句使用。"""
+        return python_import_simulation(name, list(fromlist) if fromlist else None,
+                                        level, globals, context=self)
+
+    def invalidate_caches(self):
+        """
+        清空本上下文的Spec缓存和查找器记忆(共享缓存会自行按mtime校验)，
+        并让名称索引在下次查找时重新校验没有被监视的条目。
+        """
+        self.spec_cache.clear()
+        self.finder_memory.clear()
+        if self.name_index is not None:
+            self.name_index.invalidate()
+
+    def __repr__(self):
+        return f"<ImportContext {self.name!r}: {len(self.modules)} modules>"
+
+class _GlobalImportContext(ImportContext):
+    """
+    默认的全局上下文，直接使用`sys.modules`、`sys.path`和`sys.meta_path`。
+    用属性每次读取，即使它们被整体替换(例如`sys.path = [...]`)也能跟上。
+    """
+
+    def __init__(self):
+        super().__init__(path=(), modules={}, meta_path=(), name='global')
+        self.isolated = False
+
+    @property
+    def modules(self):
+        return sys.modules
+
+    @property
+    def path(self):
+        return sys.path
+
+    @property
+    def meta_path(self):
+        return sys.meta_path
+
+class SimulatorPathFinder:
+    """把模拟器的`find_in_paths`包装成`sys.meta_path`风格的查找器。"""
+
+    def __init__(self, context):
+        self.context = context
+
+    def find_spec(self, fullname, path=None, target=None):
+        return find_in_paths(fullname, path or self.context.path, self.context)
+
+GLOBAL_IMPORT_CONTEXT = _GlobalImportContext()
+
+# --- 导入栈与耗时预算区 ---
+
+# 每个线程各自的导入栈，栈中是正在导入(尚未完成)的模块名。
+# 某个模块开始导入时，栈顶就是触发它的那个导入。
+_import_state = threading.local()
+# 每个最外层导入(导入栈从空变为非空)取一个新编号，由它触发的嵌套导入共用这个编号。
+_import_generations = itertools.count(1)
+
+# 阶段5的执行耗时记录，每次执行模块代码追加一条。字段:
+# module / context / parent / chain(完整导入链) / start / exec_time(秒) / budget / over_budget
+# 长时间运行的进程会不断导入(例如淘汰后重新加载)，只保留最近的`MAX_IMPORT_TIMINGS`条。
+MAX_IMPORT_TIMINGS = 10000
+IMPORT_TIMINGS = collections.deque(maxlen=MAX_IMPORT_TIMINGS)
+# 累计追加过的记录数，记录被挤出后仍然单调递增，用来截取某一时刻之后的记录
+_timings_recorded = {'count': 0}
+
+_budget_config = {'default': None, 'per_module': {}, 'action': 'warn', 'report_file': None}
+
+BUDGET_ACTIONS = ('warn', 'record', 'raise')
+
+class SlowImportWarning(RuntimeWarning):
+    """模块执行耗时超出预算时发出的警告。"""
+
+class ImportBudgetExceeded(ImportError):
+    """预算动作为`'raise'`时，模块执行耗时超出预算会抛出此异常。"""
+
+def _current_import_stack():
+    stack = getattr(_import_state, 'stack', None)
+    if stack is None:
+        stack = _import_state.stack = []
+    return stack
+
+def _push_import(module_name):
+    stack = _current_import_stack()
+    if not stack:
+        _import_state.generation = next(_import_generations)
+    stack.append(module_name)
+
+def _pop_import():
+    _current_import_stack().pop()
+
+def get_import_stack():
+    """返回当前线程中正在导入(尚未完成)的模块名列表，最外层在前。"""
+    return list(_current_import_stack())
+
+def current_import_generation():
+    """当前线程中正在进行的最外层导入的编号；没有进行中的导入时返回None。"""
+    return _import_state.generation if _current_import_stack() else None
+
+def set_import_budget(default=None, per_module=None, action='warn', report_file=None):
+    """
+    设置阶段5(模块执行)的耗时预算。
+
+    Args:
+        default (float, optional): 全局预算(秒)，`None`表示不限制。
+        per_module (dict, optional): 按模块名单独设置的预算，优先于全局预算。
+        action (str): 超出预算时的动作:
+            - `'warn'`: 打印提示并发出`SlowImportWarning`。
+            - `'record'`: 把超时模块追加到`report_file`(JSON Lines格式)。
+            - `'raise'`: 抛出`ImportBudgetExceeded`，模块按导入失败处理。
+        report_file (str, optional): `'record'`动作使用的报告文件路径。
+    """
+    if action not in BUDGET_ACTIONS:
+        raise ValueError(f"未知的预算动作: '{action}'，可选: {BUDGET_ACTIONS}")
+    if action == 'record' and not report_file:
+        raise ValueError("预算动作为'record'时必须指定report_file")
+    _budget_config['default'] = default
+    _budget_config['per_module'] = dict(per_module or {})
+    _budget_config['action'] = action
+    _budget_config['report_file'] = report_file
+
+def get_import_budget(module_name):
+    """返回模块适用的耗时预算(秒)，没有预算时返回None。"""
+    return _budget_config['per_module'].get(module_name, _budget_config['default'])
+
+def clear_import_timings():
+    """清空`IMPORT_TIMINGS`中的执行耗时记录。"""
+    IMPORT_TIMINGS.clear()
+
+def import_timings_mark():
+    """返回当前位置的标记，配合`import_timings_since`取出之后新增的记录。"""
+    return _timings_recorded['count']
+
+def import_timings_since(mark):
+    """返回标记之后追加的耗时记录(仍保留在`IMPORT_TIMINGS`中的那部分)。"""
+    count = min(_timings_recorded['count'] - mark, len(IMPORT_TIMINGS))
+    return list(itertools.islice(IMPORT_TIMINGS, len(IMPORT_TIMINGS) - count, None))
+
+def _caller_stacklevel():
+    """
+    调用方`warnings.warn`使用的stacklevel: 跳过模拟器自己的所有帧，
+    让警告指向触发这次导入的代码(调用`python_import_simulation`的地方或模块里的`import`语句)。
+    """
+    frame = sys._getframe(1)
+    level = 1
+    while frame is not None and frame.f_globals is globals():
+        frame = frame.f_back
+        level += 1
+    return level
+
+def _record_exec_time(module_name, started, exec_time, context=None):
+    """记录一次模块执行耗时，超出预算时按配置的动作处理。"""
+    # 栈顶是当前模块自己，下面一层才是触发它的导入。
+    chain = list(_current_import_stack())
+    parent = chain[-2] if len(chain) > 1 else None
+    budget = get_import_budget(module_name)
+    over_budget = budget is not None and exec_time > budget
+    record = {
+        'module': module_name,
+        'context': (context or GLOBAL_IMPORT_CONTEXT).name,
+        'parent': parent,
+        'chain': chain,
+        'start': started,
+        'exec_time': exec_time,
+        'budget': budget,
+        'over_budget': over_budget,
+    }
+    IMPORT_TIMINGS.append(record)
+    _timings_recorded['count'] += 1
+    if not over_budget:
+        return
+
+    trigger = f"，由 '{parent}' 触发" if parent else ""
+    message = (f"模块 '{module_name}' 执行耗时 {exec_time * 1000:.2f}ms，"
+               f"超出预算 {budget * 1000:.2f}ms{trigger}")
+    print(f"   [SLOW] {message}")
+    action = _budget_config['action']
+    if action == 'warn':
+        warnings.warn(message, SlowImportWarning, stacklevel=_caller_stacklevel())
+    elif action == 'record':
+        with open(_budget_config['report_file'], 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    else:
+        raise ImportBudgetExceeded(message)
+
+# --- 未使用导入检测区 ---
+
+# 启用后，模拟器执行过的每个模块都被换成`_AccessTrackingModule`，记录它的属性是否被读取过。
+# 第一次被读取后模块立即换回普通的`ModuleType`，之后的属性访问没有额外开销。
+_access_tracking = {'enabled': False, 'atexit_registered': False}
+
+# (上下文名, 模块名) -> 跟踪记录。字段:
+# module / context / exec_time(秒) / memory(执行期间新分配的字节数，未测量时为None) / accessed
+MODULE_ACCESS = {}
+# 仍在跟踪中的模块对象 -> 它的跟踪记录
+_tracked_modules = weakref.WeakKeyDictionary()
+
+class _AccessTrackingModule(ModuleType):
+    """读取任何非双下划线属性时把模块标记为已使用，并换回`ModuleType`。"""
+
+    def __getattribute__(self, name):
+        # 导入系统自己会读取`__path__`、`__spec__`等属性，这些不算使用。
+        if not (name.startswith('__') and name.endswith('__')):
+            _note_module_access(self)
+        return ModuleType.__getattribute__(self, name)
+
+def set_access_tracking(enabled=True, measure_memory=False, report_at_exit=True):
+    """
+    开关未使用导入检测。只跟踪开启之后由模拟器执行的模块。
+
+    Args:
+        enabled (bool): 是否跟踪模块的属性访问。
+        measure_memory (bool): 用`tracemalloc`测量每个模块执行期间分配的内存。
+            测量会明显拖慢导入，只在排查时使用。
+        report_at_exit (bool): 进程退出时打印未使用模块的报告。
+    """
+    _access_tracking['enabled'] = bool(enabled)
+    if enabled and measure_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if enabled and report_at_exit and not _access_tracking['atexit_registered']:
+        _access_tracking['atexit_registered'] = True
+        atexit.register(report_unused_imports)
+
+def _traced_memory():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+def _track_module_access(module, exec_time, memory_before, context):
+    memory_after = _traced_memory()
+    memory = None if memory_before is None or memory_after is None else memory_after - memory_before
+    if type(module) is not ModuleType:
+        return  # 加载器创建了自定义的模块类型，不替换它
+    record = MODULE_ACCESS[(context.name, module.__name__)] = {
+        'module': module.__name__,
+        'context': context.name,
+        'exec_time': exec_time,
+        'memory': memory,
+        'accessed': False,
+    }
+    _tracked_modules[module] = record
+    module.__class__ = _AccessTrackingModule
+
+def _note_module_access(module):
+    """把模块标记为已使用，停止跟踪它，并通知访问监听者。"""
+    if type(module) is not _AccessTrackingModule:
+        return
+    module.__class__ = ModuleType
+    record = _tracked_modules.pop(module, None)
+    if record is not None:
+        record['accessed'] = True
+    for callback in list(_access_listeners):
+        callback(module)
+
+# 访问跟踪的模块第一次被读取、换回`ModuleType`之后调用的回调，签名: callback(module)。
+# 其他同样需要替换模块类的功能(例如`module_eviction`)在此时接手这个模块。
+_access_listeners = []
+
+def add_access_listener(callback):
+    _access_listeners.append(callback)
+
+def remove_access_listener(callback):
+    if callback in _access_listeners:
+        _access_listeners.remove(callback)
+
+def get_unused_imports():
+    """返回导入后从未被访问过的模块记录，按执行耗时从高到低排列。"""
+    unused = [record for record in MODULE_ACCESS.values() if not record['accessed']]
+    return sorted(unused, key=lambda record: record['exec_time'], reverse=True)
+
+def report_unused_imports(file=None):
+    """
+    打印未使用模块的报告，每个模块一行: 执行耗时、内存和所在上下文。
+
+    Returns:
+        list: 同`get_unused_imports()`。
+    """
+    unused = get_unused_imports()
+    if not unused:
+        return unused
+    print(f"\n[UNUSED] 导入后从未被访问的模块 ({len(unused)} 个):", file=file)
+    for record in unused:
+        memory = record['memory']
+        memory = f"{memory / 1024:.1f}KiB" if memory is not None else "-"
+        print(f"   {record['module']:<40} {record['exec_time'] * 1000:>8.2f}ms {memory:>10}"
+              f"  [{record['context']}]", file=file)
+    total = sum(record['exec_time'] for record in unused)
+    print(f"   合计执行耗时: {total * 1000:.2f}ms", file=file)
+    return unused
+
+# --- 导入监听区 ---
+
+# 每个模块执行完成后调用的回调，签名: callback(module, exec_time, context)。
+_import_listeners = []
+
+def add_import_listener(callback):
+    """注册导入监听者，例如`module_eviction.ModuleEvictionManager`用它跟踪新导入的模块。"""
+    _import_listeners.append(callback)
+
+def remove_import_listener(callback):
+    if callback in _import_listeners:
+        _import_listeners.remove(callback)
+
+def _notify_import_listeners(module, exec_time, context):
+    for callback in list(_import_listeners):
+        callback(module, exec_time, context)
+
+# --- 查找器统计区 ---
+
+# 阶段3中每个`meta_path`查找器的调用统计，键是查找器的名称。
+# 字段: calls / hits / errors(抛出异常的次数) / time(累计耗时，秒)
+FINDER_STATS = {}
+
+# `adaptive`为True时，记住解析每个顶层包的查找器，之后先问它。
+_finder_config = {'adaptive': False}
+
+def finder_label(finder):
+    """查找器在统计中的名称: 类本身用类名，实例用其类名。"""
+    return getattr(finder, '__name__', None) or type(finder).__name__
+
+def get_finder_stats():
+    """
+    返回每个查找器的统计副本，附带命中率`hit_rate`和平均耗时`avg_time`(秒)。
+    """
+    stats = {}
+    for label, entry in FINDER_STATS.items():
+        calls = entry['calls']
+        stats[label] = dict(entry,
+                            hit_rate=entry['hits'] / calls if calls else 0.0,
+                            avg_time=entry['time'] / calls if calls else 0.0)
+    return stats
+
+def reset_finder_stats():
+    FINDER_STATS.clear()
+
+def set_adaptive_finder_order(enabled=True):
+    """
+    开关自适应查找顺序。
+
+    开启后，每个导入上下文记住解析过各顶层包的查找器(`context.finder_memory`)，
+    之后查找该包下的模块时先问这个查找器。它没有找到时，再按`meta_path`的顺序依次询问
+    其余查找器，结果与标准流程一致。
+
+    代价是: 之后插到它前面、本来会抢先匹配的查找器会被绕过。
+    修改`meta_path`后可调用`context.invalidate_caches()`清空记忆。
+
+    Returns:
+        bool: 之前的设置。
+    """
+    previous = _finder_config['adaptive']
+    _finder_config['adaptive'] = bool(enabled)
+    return previous
+
+def _call_finder(finder, module_name, finder_path):
+    """调用一个查找器并记录统计。查找器抛出的异常按未找到处理。"""
+    label = finder_label(finder)
+    entry = FINDER_STATS.get(label)
+    if entry is None:
+        entry = FINDER_STATS.setdefault(label, {'calls': 0, 'hits': 0, 'errors': 0, 'time': 0.0})
+    started = time.perf_counter()
+    try:
+        # 每个查找器都有`find_spec`方法，尝试查找模块规范
+        spec = finder.find_spec(module_name, finder_path)
+    except Exception as e:
+        print(f"   [FAIL] 查找器 {label} 失败: {e}")
+        entry['errors'] += 1
+        spec = None
+    entry['time'] += time.perf_counter() - started
+    entry['calls'] += 1
+    if spec:
+        entry['hits'] += 1
+    return spec
+
+def _find_spec_in_meta_path(module_name, name_parts, finder_path, context):
+    """依次询问`context.meta_path`中的查找器；自适应模式下先问记住的那个。"""
+    meta_path = context.meta_path
+    adaptive = _finder_config['adaptive']
+    remembered = None
+    if adaptive:
+        remembered = context.finder_memory.get(name_parts[0])
+        # 记住的查找器已被移出`meta_path`时不再使用。
+        if remembered is not None and any(finder is remembered for finder in meta_path):
+            spec = _call_finder(remembered, module_name, finder_path)
+            if spec:
+                print(f"   [ADAPTIVE] 由记住的查找器 {finder_label(remembered)} 直接找到")
+                return spec
+        else:
+            remembered = None
+
+    for finder in meta_path:
+        if finder is remembered:
+            continue  # 刚刚问过，没有找到
+        spec = _call_finder(finder, module_name, finder_path)
+        if spec:
+            if adaptive:
+                context.finder_memory[name_parts[0]] = finder
+            return spec
+    return None
+
+# --- 加载模式注册区 ---
+
+# 模拟器默认用`create_file_spec`/`create_package_spec`中内联的简化加载器执行源码。
+# 其他加载模式(例如`streaming_loader.py`中的流式加载)通过`register_loader_mode`
+# 注册一个工厂函数，再用`set_loader_mode`启用。
+# 工厂签名: factory(filepath, **options) -> loader 或 None(None表示回退到默认加载器)。
+_LOADER_MODES = {}
+# `generation`在每次切换模式时加一，Spec缓存据此丢弃按旧模式创建的Spec。
+_active_loader_mode = {'name': 'source', 'options': {}, 'generation': 0}
+
+def register_loader_mode(name, factory):
+    """注册一个加载模式。`name`为模式名，`factory`负责为源文件创建加载器。"""
+    _LOADER_MODES[name] = factory
+
+def set_loader_mode(name='source', **options):
+    """
+    切换模拟器使用的加载模式。
+
+    Args:
+        name (str): 模式名。`'source'`为默认的整文件读取加载器。
+        **options: 透传给该模式工厂函数的参数。
+
+    Returns:
+        dict: 切换前的模式设置，可用于恢复: `set_loader_mode(old['name'], **old['options'])`。
+    """
+    if name != 'source' and name not in _LOADER_MODES:
+        raise ValueError(f"未注册的加载模式: '{name}'")
+    previous = {'name': _active_loader_mode['name'], 'options': _active_loader_mode['options']}
+    _active_loader_mode['name'] = name
+    _active_loader_mode['options'] = options
+    _active_loader_mode['generation'] += 1
+    return previous
+
+def _create_mode_loader(filepath):
+    """按当前加载模式为`filepath`创建加载器；默认模式返回None。"""
+    name = _active_loader_mode['name']
+    if name == 'source' or filepath.endswith('.pyc'):
+        # 加载模式都从源码出发；无源码的模块总是由默认加载器直接读取字节码。
+        return None
+    return _LOADER_MODES[name](filepath, **_active_loader_mode['options'])
+
+def _respec_source_module(spec):
+    """把`sys.meta_path`返回的源码Spec换成使用当前加载模式的Spec。"""
+    if not isinstance(spec.loader, importlib.machinery.SourceFileLoader):
+        return spec
+    if spec.submodule_search_locations is not None:
+        new_spec = create_package_spec(spec.name, spec.origin, list(spec.submodule_search_locations))
+    else:
+        new_spec = create_file_spec(spec.name, spec.origin)
+    print(f"   [MODE] 使用加载模式 '{_active_loader_mode['name']}' 加载 '{spec.name}'")
+    return new_spec
+
 # --- 模拟加载器和Spec创建函数 ---
 
 def create_file_spec(name, filepath):
@@ -477,14 +1474,14 @@ def create_file_spec(name, filepath):
     class FileLoader:
         def create_module(self, spec): return None # 使用默认创建
         def exec_module(self, module):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                code = f.read()
+            # 从共享的编译结果缓存中取代码对象，源文件未变化时无需重新解析
+            code = SHARED_BYTECODE_CACHE.get_code(filepath)
             # 在模块的命名空间中执行代码
             exec(code, module.__dict__)
 
     return importlib.machinery.ModuleSpec(
         name=name,
-        loader=FileLoader(),
+        loader=_create_mode_loader(filepath) or FileLoader(),
         origin=filepath
     )
 
@@ -495,13 +1492,16 @@ def create_package_spec(name, init_file, search_locations):
             # spec 参数在这里不需要使用，返回 None 表示使用默认创建
             return None
         def exec_module(self, module):
-            with open(init_file, 'r', encoding='utf-8') as f:
-                code = f.read()
+            code = SHARED_BYTECODE_CACHE.get_code(init_file)
             exec(code, module.__dict__)
+        def get_resource_reader(self, fullname):
+            # 包内数据文件的零拷贝读取，见`resource_reader.py`
+            from resource_reader import PackageResourceReader
+            return PackageResourceReader(search_locations)
 
     spec = importlib.machinery.ModuleSpec(
         name=name,
-        loader=PackageLoader(),
+        loader=_create_mode_loader(init_file) or PackageLoader(),
         origin=init_file,
         is_package=True # 标记这是一个包
     )
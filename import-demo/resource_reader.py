@@ -0,0 +1,336 @@
+"""
+零拷贝的包资源读取 (Resource Reader)
+==================================
+
+模拟器加载的包有`__path__`和`__file__`，但读取包内附带的数据文件(模型、查找表)时，
+代码只能自己拼路径、`open()`，再把整个文件读进内存。
+
+`PackageResourceReader`按包的Spec找到资源所在的位置，支持三种来源:
+- 目录: 包的`__path__`中的普通目录。文件以只读方式`mmap`，返回其上的`memoryview`，
+  没有任何拷贝；多个进程映射同一个文件时共享页缓存。
+- zip条目: `__path__`指向zip文件内部(如`/opt/app.zip/plugins`)。未压缩(`ZIP_STORED`)的条目
+  直接返回zip文件映射上的切片；压缩条目只能解压，返回解压后数据的`memoryview`。
+- 打包快照: `build_snapshot()`把包目录中的资源合并成一个`__resources__.snapshot`文件
+  (每个资源按64字节对齐)。存在快照时优先使用，大量小文件只需映射一次。
+  快照记录了每个文件的mtime和大小；目录中的文件被修改过时，改由目录读取该文件。
+
+打开的映射缓存在`MappingCache`中，按LRU淘汰。淘汰只是丢掉缓存的引用，
+仍在使用的`memoryview`不受影响，映射在最后一个视图释放后才真正关闭。
+
+如何使用:
+    from resource_reader import get_resource_reader
+
+    reader = get_resource_reader(python_import_simulation('my_package'))
+    table = reader.read_resource('lookup.bin')          # memoryview，零拷贝
+    numpy.frombuffer(table, dtype='<u4')                 # 同样零拷贝
+
+模拟器的包加载器也提供`get_resource_reader(fullname)`，与`importlib`的协议一致。
+
+"""
+
+import io
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zipfile
+from collections import OrderedDict
+
+from fork_safety import register_after_fork
+
+SNAPSHOT_NAME = '__resources__.snapshot'
+SNAPSHOT_MAGIC = b'PYRSNAP2'
+# 头部: 魔数 | 索引长度。之后是JSON索引 {名称: [偏移, 大小, 源文件mtime_ns]}，偏移相对于文件开头。
+SNAPSHOT_HEADER = struct.Struct('<8sQ')
+SNAPSHOT_ALIGNMENT = 64
+
+# zip本地文件头的固定部分，见APPNOTE 4.3.7
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+DEFAULT_MAX_MAPPINGS = 128
+
+
+class MappingCache:
+    """
+    按文件路径缓存只读内存映射，超出`max_mappings`时淘汰最久未使用的映射。
+    文件的mtime或大小变化后会重新映射。
+    """
+
+    def __init__(self, max_mappings=DEFAULT_MAX_MAPPINGS):
+        self.max_mappings = max_mappings
+        self._mappings = OrderedDict()  # path -> ((mtime_ns, size), mmap或b'')
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        register_after_fork(self)
+
+    def _reinit_after_fork(self):
+        # 只读映射在fork后仍然有效，并与父进程共享页缓存。
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """返回整个文件的`memoryview`。"""
+        st = os.stat(path)
+        validator = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._mappings.get(path)
+            if entry is not None and entry[0] == validator:
+                self._mappings.move_to_end(path)
+                self.stats['hits'] += 1
+                return memoryview(entry[1])
+
+        self.stats['misses'] += 1
+        if st.st_size == 0:
+            mapping = b''  # 空文件无法映射
+        else:
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            self._mappings[path] = (validator, mapping)
+            self._mappings.move_to_end(path)
+            while len(self._mappings) > self.max_mappings:
+                # 只丢掉引用；仍被memoryview使用的映射会在视图释放后关闭。
+                self._mappings.popitem(last=False)
+                self.stats['evictions'] += 1
+        return memoryview(mapping)
+
+    def clear(self):
+        with self._lock:
+            self._mappings.clear()
+
+
+SHARED_MAPPING_CACHE = MappingCache()
+
+
+# --- 资源来源 ---
+
+class _DirectorySource:
+    """普通目录。"""
+
+    def __init__(self, directory, mappings):
+        self.directory = directory
+        self.mappings = mappings
+
+    def names(self):
+        try:
+            return {name for name in os.listdir(self.directory)
+                    if os.path.isfile(os.path.join(self.directory, name))}
+        except OSError:
+            return set()
+
+    def read(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.isfile(path):
+            return None
+        return self.mappings.get(path)
+
+    def path(self, name):
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+class _SnapshotSource:
+    """`build_snapshot`生成的快照文件。"""
+
+    def __init__(self, snapshot_path, mappings):
+        self.snapshot_path = snapshot_path
+        self.directory = os.path.dirname(snapshot_path)
+        self.mappings = mappings
+        self._index = (None, None)  # (文件校验值, 索引)
+
+    def _load(self):
+        view = self.mappings.get(self.snapshot_path)
+        validator = _file_validator(self.snapshot_path)
+        if self._index[0] != validator:
+            magic, index_size = SNAPSHOT_HEADER.unpack_from(view)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"不是资源快照文件: {self.snapshot_path}")
+            start = SNAPSHOT_HEADER.size
+            self._index = (validator, json.loads(bytes(view[start:start + index_size])))
+        return view, self._index[1]
+
+    def names(self):
+        return set(self._load()[1])
+
+    def read(self, name):
+        view, index = self._load()
+        if name not in index:
+            return None
+        offset, size, mtime_ns = index[name]
+        # 目录中仍有这个文件、且在生成快照后被修改过时，快照中的副本已过期，交给目录读取。
+        # 文件不存在时快照是唯一的来源(部署时可以只保留快照)。
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            pass
+        else:
+            if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+                return None
+        return view[offset:offset + size]
+
+    def path(self, name):
+        return None  # 快照中的资源没有独立的文件路径
+
+
+class _ZipSource:
+    """zip文件中的一个目录(`prefix`以`/`结尾，根目录为空字符串)。"""
+
+    def __init__(self, zip_path, prefix, mappings):
+        self.zip_path = zip_path
+        self.prefix = prefix
+        self.mappings = mappings
+        self._entries_cache = (None, None)  # (文件校验值, 条目表)
+
+    def _entries(self):
+        validator = _file_validator(self.zip_path)
+        if self._entries_cache[0] != validator:
+            with zipfile.ZipFile(self.zip_path) as archive:
+                entries = {info.filename[len(self.prefix):]: info for info in archive.infolist()
+                           if info.filename.startswith(self.prefix) and not info.is_dir()
+                           and '/' not in info.filename[len(self.prefix):]}
+            self._entries_cache = (validator, entries)
+        return self._entries_cache[1]
+
+    def names(self):
+        return set(self._entries())
+
+    def read(self, name):
+        info = self._entries().get(name)
+        if info is None:
+            return None
+        if info.compress_type != zipfile.ZIP_STORED:
+            # 压缩的条目无法零拷贝，只能解压。
+            with zipfile.ZipFile(self.zip_path) as archive:
+                return memoryview(archive.read(info))
+        view = self.mappings.get(self.zip_path)
+        fields = ZIP_LOCAL_HEADER.unpack_from(view, info.header_offset)
+        name_length, extra_length = fields[-2], fields[-1]
+        start = info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+        return view[start:start + info.file_size]
+
+    def path(self, name):
+        return None
+
+
+def _file_validator(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _split_zip_path(path):
+    """`/opt/app.zip/plugins/x` -> (`/opt/app.zip`, `plugins/x/`)；不在zip内时返回None。"""
+    head, tail = path, ''
+    while head and not os.path.isfile(head):
+        head, component = os.path.split(head)
+        if not component:
+            return None
+        tail = f"{component}/{tail}" if tail else f"{component}/"
+    if head and zipfile.is_zipfile(head):
+        return head, tail
+    return None
+
+
+def _sources_for(locations, mappings):
+    sources = []
+    for location in locations:
+        if os.path.isdir(location):
+            snapshot = os.path.join(location, SNAPSHOT_NAME)
+            if os.path.isfile(snapshot):
+                sources.append(_SnapshotSource(snapshot, mappings))
+            sources.append(_DirectorySource(location, mappings))
+            continue
+        split = _split_zip_path(location)
+        if split is not None:
+            sources.append(_ZipSource(split[0], split[1], mappings))
+    return sources
+
+
+# --- 读取器 ---
+
+class PackageResourceReader:
+    """
+    包资源读取器，接口与`importlib.abc.ResourceReader`一致，另外提供零拷贝的`read_resource`。
+
+    Args:
+        locations (list): 资源所在的位置，通常是包的`__path__`。
+        mappings (MappingCache): 使用的映射缓存，默认是共享缓存。
+    """
+
+    def __init__(self, locations, mappings=SHARED_MAPPING_CACHE):
+        self.locations = list(locations)
+        self._sources = _sources_for(self.locations, mappings)
+
+    def read_resource(self, name):
+        """返回资源内容的`memoryview`。资源不存在时抛出FileNotFoundError。"""
+        for source in self._sources:
+            view = source.read(name)
+            if view is not None:
+                return view
+        raise FileNotFoundError(f"包资源不存在: {name}")
+
+    def open_resource(self, resource):
+        return io.BytesIO(self.read_resource(resource))
+
+    def resource_path(self, resource):
+        for source in self._sources:
+            path = source.path(resource)
+            if path is not None:
+                return path
+        raise FileNotFoundError(f"包资源不在文件系统上: {resource}")
+
+    def is_resource(self, name):
+        return any(name in source.names() for source in self._sources)
+
+    def contents(self):
+        names = set()
+        for source in self._sources:
+            names |= source.names()
+        names.discard(SNAPSHOT_NAME)
+        return sorted(names)
+
+
+def get_resource_reader(package):
+    """按包(模块对象)的Spec创建资源读取器。"""
+    spec = package.__spec__
+    if spec is None or spec.submodule_search_locations is None:
+        raise TypeError(f"'{package.__name__}' 不是包，没有资源")
+    return PackageResourceReader(spec.submodule_search_locations)
+
+
+def build_snapshot(directory, exclude_suffixes=('.py', '.pyc')):
+    """
+    把目录中的资源文件(默认排除源码和字节码)合并成`__resources__.snapshot`。
+
+    Returns:
+        str: 快照文件路径。
+    """
+    names = sorted(name for name in os.listdir(directory)
+                   if os.path.isfile(os.path.join(directory, name))
+                   and name != SNAPSHOT_NAME and not name.endswith(exclude_suffixes))
+    stats = {name: os.stat(os.path.join(directory, name)) for name in names}
+
+    def align(offset):
+        return (offset + SNAPSHOT_ALIGNMENT - 1) // SNAPSHOT_ALIGNMENT * SNAPSHOT_ALIGNMENT
+
+    # 索引长度决定数据起点，而偏移又写在索引中；偏移的位数用一个足够大的占位数估算。
+    placeholder = json.dumps({name: [10 ** 15, st.st_size, st.st_mtime_ns]
+                              for name, st in stats.items()}).encode()
+    offset = align(SNAPSHOT_HEADER.size + len(placeholder))
+    index = {}
+    for name in names:
+        index[name] = [offset, stats[name].st_size, stats[name].st_mtime_ns]
+        offset = align(offset + stats[name].st_size)
+    encoded = json.dumps(index).encode().ljust(len(placeholder))
+
+    target = os.path.join(directory, SNAPSHOT_NAME)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as out:
+        out.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(encoded)))
+        out.write(encoded)
+        for name in names:
+            out.seek(index[name][0])
+            with open(os.path.join(directory, name), 'rb') as f:
+                shutil.copyfileobj(f, out)
+    os.replace(tmp_path, target)
+    return target
@@ -3,11 +3,31 @@
 测试 `python_import_mechanism.py` 的模拟实现。
 该文件采用数据驱动的方式，定义了一系列的测试用例，
 然后通过一个统一的运行器来执行和验证。
+
+运行器默认把每个用例放进进程池中一个全新的工作进程里执行，
+并分别记录冷运行和热运行的耗时。`--serial`可在当前进程中依次运行，`-v`打印完整日志。
 """
 
 import sys
 import os
+import io
+import array
+import gc
+import json
+import mmap
+import time
+import argparse
+import shutil
+import tempfile
+import threading
+import contextlib
 import traceback
+import tracemalloc
+import warnings
+import urllib.request
+import zipfile
+import py_compile
+from concurrent.futures import ProcessPoolExecutor
 
 # --- 准备工作 ---
 
@@ -17,7 +37,28 @@ if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
 # 从我们的模拟器文件中导入核心模拟函数。
-from python_import_mechanism import python_import_simulation
+from python_import_mechanism import (python_import_simulation, set_loader_mode, set_import_budget,
+                                     ImportContext, GLOBAL_IMPORT_CONTEXT, set_adaptive_finder_order,
+                                     get_finder_stats, reset_finder_stats, set_lazy_submodules,
+                                     set_access_tracking, get_unused_imports, MODULE_ACCESS,
+                                     IMPORT_TIMINGS, MAX_IMPORT_TIMINGS, import_timings_mark,
+                                     import_timings_since)
+import python_import_mechanism
+import streaming_loader
+import constant_dedup
+import constant_cache
+import cache_watcher
+import name_index
+import startup_optimizer
+from module_eviction import ModuleEvictionManager
+import resource_reader
+from import_session import ImportSession
+import import_metrics
+import import_regression
+import fork_safety
+from module_warmer import ModuleWarmer, load_priorities
+from sourceless_build import build_sourceless
+from import_caches import SHARED_DIRECTORY_CACHE, SHARED_BYTECODE_CACHE
 
 # --- 测试用例定义 ---
 
@@ -52,6 +93,816 @@ def validate_json_module(module):
 def validate_relative_import(module):
     assert module.__name__ == 'test_package'
 
+def use_streaming_loader():
+    # 块大小为1字节时每条顶层语句单独成块，最大限度地检验切块逻辑。
+    previous = set_loader_mode('streaming', chunk_bytes=1, measure_memory=True)
+    return lambda: set_loader_mode(previous['name'], **previous['options'])
+
+def validate_streaming_submodule(top_package):
+    submodule = sys.modules['test_package.submodule']
+    assert submodule.submodule_function() == "这是子模块的函数"
+    assert submodule.SubmoduleClass().method()
+    report = streaming_loader.MEMORY_REPORTS[-1]
+    assert report.module_name == 'test_package.submodule'
+    assert report.chunks > 1 and report.peak_bytes is not None
+    # 别处已经开启了tracemalloc时，统计峰值不能重置它记录的全局峰值。
+    tracemalloc.start()
+    try:
+        buffer = bytearray(8 * 1024 * 1024)
+        del buffer, sys.modules['test_package.submodule']
+        python_import_simulation('test_package.submodule')
+        outer_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert outer_peak >= 8 * 1024 * 1024
+    assert streaming_loader.MEMORY_REPORTS[-1].peak_bytes < 8 * 1024 * 1024
+    print(f"  流式加载报告: {report}")
+
+SIDECAR_CONTEXT = ImportContext(name='run_tests-sidecar')
+
+def use_literal_sidecar():
+    # 阈值很小，三个字面量都进入旁路文件；只有RAW要求零拷贝。
+    directory = tempfile.mkdtemp(prefix='run_tests-sidecar-')
+    with open(os.path.join(directory, 'sidecar_table_module.py'), 'w', encoding='utf-8') as f:
+        f.write("TABLE = [1, 2, 3]\nTABLE.append(5)\nPAIRS = (1.5, 2.5)\nRAW = (7, 8, 9)\n")
+    SIDECAR_CONTEXT.path.insert(0, directory)
+    previous = set_loader_mode('streaming', sidecar=True, sidecar_threshold=1, zero_copy_names=('RAW',))
+
+    def cleanup():
+        set_loader_mode(previous['name'], **previous['options'])
+        SIDECAR_CONTEXT.path.remove(directory)
+        SIDECAR_CONTEXT.modules.clear()
+        SIDECAR_CONTEXT.invalidate_caches()
+        shutil.rmtree(directory)
+    return cleanup
+
+def validate_literal_sidecar(module):
+    def reimport():
+        SIDECAR_CONTEXT.modules.clear()
+        return SIDECAR_CONTEXT.import_module('sidecar_table_module')
+
+    assert streaming_loader.MEMORY_REPORTS[-1].sidecar == 'built'
+    for current in (module, reimport()):
+        # 默认还原成源码中的类型，模块代码可以修改它们；只有RAW是零拷贝的memoryview。
+        assert current.TABLE == [1, 2, 3, 5] and current.PAIRS == (1.5, 2.5)
+        assert isinstance(current.RAW, memoryview) and current.RAW.tolist() == [7, 8, 9]
+    assert streaming_loader.MEMORY_REPORTS[-1].sidecar == 'hit'
+    # 换成不要求零拷贝的配置后，旁路文件失效并重新生成。
+    set_loader_mode('streaming', sidecar=True, sidecar_threshold=1)
+    current = reimport()
+    assert streaming_loader.MEMORY_REPORTS[-1].sidecar == 'built' and current.RAW == (7, 8, 9)
+    print(f"  旁路文件: {streaming_loader.MEMORY_REPORTS[-1]}")
+
+CONSTANT_CACHE_CONTEXT = ImportContext(name='run_tests-constant-cache')
+CONSTANT_CACHE_SOURCE = (
+    "from __future__ import annotations\n"
+    "TABLE = [1, 2, 3]\n"
+    "CONFIG = {'name': 'demo', 'ports': (80, 443)}\n"
+    "def port(index: UndefinedType):\n"   # 注解在__future__下不求值
+    "    return CONFIG['ports'][index]\n"
+)
+
+def use_constant_cache():
+    directory = tempfile.mkdtemp(prefix='run_tests-constcache-')
+    with open(os.path.join(directory, 'constant_table_module.py'), 'w', encoding='utf-8') as f:
+        f.write(CONSTANT_CACHE_SOURCE)
+    CONSTANT_CACHE_CONTEXT.path.insert(0, directory)
+    previous = set_loader_mode('constant_cache', ratio_threshold=0.1, min_constant_bytes=0)
+
+    def cleanup():
+        set_loader_mode(previous['name'], **previous['options'])
+        CONSTANT_CACHE_CONTEXT.path.remove(directory)
+        CONSTANT_CACHE_CONTEXT.modules.clear()
+        CONSTANT_CACHE_CONTEXT.invalidate_caches()
+        shutil.rmtree(directory)
+    return cleanup
+
+def validate_constant_cache(module):
+    def reimport():
+        CONSTANT_CACHE_CONTEXT.modules.clear()
+        current = CONSTANT_CACHE_CONTEXT.import_module('constant_table_module')
+        return current, current.__spec__.loader.last_status
+
+    assert module.__spec__.loader.last_status == 'built'
+    current, status = reimport()
+    assert status == 'hit' and current.TABLE == [1, 2, 3] and current.port(1) == 443
+    # 常量表之后单独编译的代码段仍然继承`from __future__ import annotations`。
+    assert current.port.__annotations__ == {'index': 'UndefinedType'}
+
+    # 选项不同的加载器不复用缓存。
+    set_loader_mode('constant_cache', ratio_threshold=0.1, min_constant_bytes=0, numeric_arrays=True)
+    current, status = reimport()
+    assert status == 'built' and isinstance(current.TABLE, array.array)
+    current, status = reimport()
+    assert status == 'hit' and current.TABLE.tolist() == [1, 2, 3]
+
+    # 不是常量密集型的模块只分析一次，之后从共享的编译结果缓存中取代码对象。
+    set_loader_mode('constant_cache', ratio_threshold=1.0, min_constant_bytes=0)
+    current, status = reimport()
+    assert status == 'plain' and current.TABLE == [1, 2, 3]
+    lookups = SHARED_BYTECODE_CACHE.stats['hits'] + SHARED_BYTECODE_CACHE.stats['misses']
+    current, status = reimport()
+    assert status == 'plain' and current.port(1) == 443
+    assert SHARED_BYTECODE_CACHE.stats['hits'] + SHARED_BYTECODE_CACHE.stats['misses'] == lookups + 1
+    set_loader_mode('constant_cache', ratio_threshold=0.1, min_constant_bytes=0, numeric_arrays=True)
+
+    # 源文件修改后缓存失效。
+    source_file = current.__file__
+    with open(source_file, 'w', encoding='utf-8') as f:
+        f.write(CONSTANT_CACHE_SOURCE.replace('[1, 2, 3]', '[4, 5, 6, 7]'))
+    current, status = reimport()
+    assert status == 'built' and current.TABLE.tolist() == [4, 5, 6, 7]
+    assert os.path.exists(constant_cache.cache_path(source_file))
+    print(f"  常量缓存: {constant_cache.cache_path(source_file)}")
+
+SHADOW_CONTEXT = ImportContext(name='run_tests-shadow')
+
+def write_module_later(directory, name, source):
+    # 目录mtime的精度可能只有几毫秒；把它往后拨，保证基于mtime的校验一定能看到这次变化。
+    with open(os.path.join(directory, name + '.py'), 'w', encoding='utf-8') as f:
+        f.write(source)
+    st = os.stat(directory)
+    os.utime(directory, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+def use_shadow_paths():
+    # 两个搜索路径条目，一开始只有靠后的条目提供shadow_module。
+    directories = [tempfile.mkdtemp(prefix='run_tests-shadow-') for _ in range(2)]
+    with open(os.path.join(directories[1], 'shadow_module.py'), 'w', encoding='utf-8') as f:
+        f.write("SOURCE = 'later'\n")
+    SHADOW_CONTEXT.path[:0] = directories
+
+    def cleanup():
+        del SHADOW_CONTEXT.path[:2]
+        SHADOW_CONTEXT.modules.clear()
+        SHADOW_CONTEXT.invalidate_caches()
+        for directory in directories:
+            shutil.rmtree(directory)
+    return cleanup
+
+def validate_shadowed_spec_cache(module):
+    assert module.SOURCE == 'later'
+    SHADOW_CONTEXT.modules.clear()
+    assert SHADOW_CONTEXT.import_module('shadow_module') is not module  # Spec缓存命中，模块重新执行
+    # 靠前的条目中出现同名模块后，缓存的Spec失效，新模块遮住旧模块。
+    write_module_later(SHADOW_CONTEXT.path[0], 'shadow_module', "SOURCE = 'earlier'\n")
+    SHADOW_CONTEXT.modules.clear()
+    assert SHADOW_CONTEXT.import_module('shadow_module').SOURCE == 'earlier'
+    print(f"  Spec缓存: {len(SHADOW_CONTEXT.spec_cache)} 项")
+
+INDEXED_SHADOW_CONTEXT = ImportContext(name='run_tests-indexed-shadow')
+
+def use_indexed_shadow_paths():
+    directories = [tempfile.mkdtemp(prefix='run_tests-indexed-') for _ in range(2)]
+    with open(os.path.join(directories[1], 'indexed_shadow_module.py'), 'w', encoding='utf-8') as f:
+        f.write("SOURCE = 'later'\n")
+    INDEXED_SHADOW_CONTEXT.path[:0] = directories
+    name_index.install_name_index(INDEXED_SHADOW_CONTEXT)
+
+    def cleanup():
+        name_index.uninstall_name_index(INDEXED_SHADOW_CONTEXT)
+        del INDEXED_SHADOW_CONTEXT.path[:2]
+        INDEXED_SHADOW_CONTEXT.modules.clear()
+        INDEXED_SHADOW_CONTEXT.invalidate_caches()
+        for directory in directories:
+            shutil.rmtree(directory)
+    return cleanup
+
+def validate_indexed_shadowing(module):
+    # 没有监视器时，索引靠mtime发现之后新增的模块: 靠前条目中的同名模块，以及原来不存在的名称。
+    assert cache_watcher.get_installed_watcher() is None
+    context, index = INDEXED_SHADOW_CONTEXT, INDEXED_SHADOW_CONTEXT.name_index
+    earlier, later = context.path[:2]
+    assert module.SOURCE == 'later' and index.lookup('indexed_new_module') is None
+    write_module_later(earlier, 'indexed_shadow_module', "SOURCE = 'earlier'\n")
+    write_module_later(later, 'indexed_new_module', "VALUE = 1\n")
+    assert index.lookup('indexed_shadow_module') == (earlier, 'module')
+    context.modules.clear()
+    assert context.import_module('indexed_shadow_module').SOURCE == 'earlier'
+    assert context.import_module('indexed_new_module').VALUE == 1
+    # 一次导入及其触发的嵌套导入只校验一遍mtime，而不是每次查找都stat全部条目。
+    write_module_later(later, 'indexed_fanout_module',
+                       "import indexed_shadow_module\nimport indexed_new_module\nimport indexed_missing_a\n")
+    context.modules.clear()
+    mtime_checks = index.stats['mtime_checks']
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            context.import_module('indexed_fanout_module')
+        except ImportError:
+            pass
+    assert index.stats['mtime_checks'] - mtime_checks == len(context.path)
+    print(f"  名称索引: {index.stats}")
+
+BUDGET_REPORT_FILE = os.path.join(tempfile.gettempdir(), f'import_budget_{os.getpid()}.jsonl')
+
+def use_zero_budget_for_test_a():
+    # 预算为0，`test_a`一定超时；它由`import test_a.b.c`触发，应被记录到报告文件。
+    set_import_budget(per_module={'test_a': 0.0}, action='record', report_file=BUDGET_REPORT_FILE)
+    def cleanup():
+        set_import_budget()
+        if os.path.exists(BUDGET_REPORT_FILE):
+            os.remove(BUDGET_REPORT_FILE)
+    return cleanup
+
+def validate_budget_report(top_package):
+    assert top_package.__name__ == 'test_a'
+    with open(BUDGET_REPORT_FILE, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [r['module'] for r in records] == ['test_a']
+    assert records[0]['parent'] == 'test_a.b.c'
+    # 耗时记录有上限；用标记取出之后新增的记录，与已被挤出的旧记录无关。
+    assert IMPORT_TIMINGS.maxlen == MAX_IMPORT_TIMINGS
+    mark = import_timings_mark()
+    with contextlib.redirect_stdout(io.StringIO()):
+        python_import_simulation('test_simple_module')
+    assert [r['module'] for r in import_timings_since(mark)] == ['test_simple_module']
+    # 'warn'动作发出的警告指向调用模拟器的代码，而不是模拟器内部。
+    set_import_budget(per_module={'test_simple_module': 0.0}, action='warn')
+    del sys.modules['test_simple_module']
+    with warnings.catch_warnings(record=True) as caught, contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('always')
+        python_import_simulation('test_simple_module')
+    assert [w.filename for w in caught if w.category is python_import_mechanism.SlowImportWarning] == [__file__]
+    print(f"  超时记录: {records[0]['module']} (由 {records[0]['parent']} 触发)")
+
+STAR_IMPORT_GLOBALS = {'__name__': '__star_import_caller__'}
+
+def validate_star_import_binding(module):
+    # `__all__`中的名称被真正绑定到了调用方的命名空间，其他名称没有。
+    assert STAR_IMPORT_GLOBALS['package_function'] is module.package_function
+    assert STAR_IMPORT_GLOBALS['package_version'] == module.package_version
+    assert '__all__' not in STAR_IMPORT_GLOBALS
+    STAR_IMPORT_GLOBALS.pop('package_function')
+    STAR_IMPORT_GLOBALS.pop('package_version')
+    # 原地把`__all__`改成长度相同的另一组名称，缓存的导出表不能再被使用。
+    exports = module.__all__
+    original = list(exports)
+    try:
+        exports[:] = ['package_version'] * len(original)
+        assert set(python_import_mechanism.get_export_table(module)) == {'package_version'}
+    finally:
+        exports[:] = original
+    assert python_import_mechanism.get_export_table(module) == tuple(original)
+
+STAR_SOURCELESS_CONTEXT = ImportContext(name='run_tests-star-sourceless')
+STAR_SOURCELESS_GLOBALS = {'__name__': '__star_import_caller__'}
+
+def use_star_sourceless_package():
+    # 包里的子模块只有.pyc；另有一个与`__all__`中名称同名、但没有`__init__`的数据目录。
+    directory = tempfile.mkdtemp(prefix='run_tests-star-')
+    package_dir = os.path.join(directory, 'star_sourceless_pkg')
+    os.makedirs(os.path.join(package_dir, 'assets'))
+    with open(os.path.join(package_dir, '__init__.py'), 'w', encoding='utf-8') as f:
+        f.write("__all__ = ['compiled', 'VALUE']\nVALUE = 1\n")
+    source = os.path.join(directory, 'compiled_source.py')
+    with open(source, 'w', encoding='utf-8') as f:
+        f.write("ANSWER = 42\n")
+    py_compile.compile(source, cfile=os.path.join(package_dir, 'compiled.pyc'), doraise=True)
+    os.remove(source)
+    STAR_SOURCELESS_CONTEXT.path.insert(0, directory)
+
+    def cleanup():
+        STAR_SOURCELESS_CONTEXT.path.remove(directory)
+        STAR_SOURCELESS_CONTEXT.modules.clear()
+        STAR_SOURCELESS_CONTEXT.invalidate_caches()
+        STAR_SOURCELESS_GLOBALS.clear()
+        STAR_SOURCELESS_GLOBALS['__name__'] = '__star_import_caller__'
+        shutil.rmtree(directory)
+    return cleanup
+
+def validate_star_sourceless(package):
+    # 只有.pyc的子模块被当作子模块批量导入；没有`__init__`的目录不算子模块。
+    assert STAR_SOURCELESS_GLOBALS['compiled'].ANSWER == 42 and STAR_SOURCELESS_GLOBALS['VALUE'] == 1
+    assert 'star_sourceless_pkg.compiled' in STAR_SOURCELESS_CONTEXT.modules
+    python_import_mechanism._import_listed_submodules(package, ['assets'], STAR_SOURCELESS_CONTEXT)
+    assert 'star_sourceless_pkg.assets' not in STAR_SOURCELESS_CONTEXT.modules
+
+def use_cache_watcher():
+    cache_watcher.install_cache_watcher()
+    return cache_watcher.uninstall_cache_watcher
+
+def validate_watched_lookup(top_package):
+    # 包目录在查找时被自动纳入监视，之后对它的查找不再需要stat。
+    watcher = cache_watcher.get_installed_watcher()
+    package_dir = top_package.__path__[0]
+    assert watcher.is_watching(package_dir)
+    stat_calls = SHARED_DIRECTORY_CACHE.stats['stat_calls']
+    assert 'submodule.py' in SHARED_DIRECTORY_CACHE.listing(package_dir)
+    assert SHARED_DIRECTORY_CACHE.stats['stat_calls'] == stat_calls
+    print(f"  监视器: {type(watcher).__name__} {watcher.stats}")
+
+WATCH_LATE_CONTEXT = ImportContext(name='run_tests-watch-late')
+
+def use_watcher_after_cached_import():
+    # 先在没有监视器时导入一次，编译结果进入缓存；修改源文件之后才安装监视器。
+    directory = tempfile.mkdtemp(prefix='run_tests-watch-late-')
+    write_module_later(directory, 'watch_late_module', "VERSION = 1\n")
+    WATCH_LATE_CONTEXT.path.insert(0, directory)
+    with contextlib.redirect_stdout(io.StringIO()):
+        WATCH_LATE_CONTEXT.import_module('watch_late_module')
+    WATCH_LATE_CONTEXT.modules.clear()
+    write_module_later(directory, 'watch_late_module', "VERSION = 2  # edited before watching\n")
+    cache_watcher.install_cache_watcher()
+
+    def cleanup():
+        cache_watcher.uninstall_cache_watcher()
+        WATCH_LATE_CONTEXT.path.remove(directory)
+        WATCH_LATE_CONTEXT.modules.clear()
+        WATCH_LATE_CONTEXT.invalidate_caches()
+        shutil.rmtree(directory)
+    return cleanup
+
+def validate_watcher_after_cached_import(module):
+    # 监视开始前的修改没有事件推送；目录开始被监视时丢弃了旧的编译结果。
+    watcher = cache_watcher.get_installed_watcher()
+    assert watcher.is_watching(os.path.dirname(module.__file__))
+    assert module.VERSION == 2
+    print(f"  监视前修改的模块: VERSION={module.VERSION}, {type(watcher).__name__}")
+
+def use_adaptive_finder_order():
+    set_adaptive_finder_order(True)
+    def cleanup():
+        set_adaptive_finder_order(False)
+        GLOBAL_IMPORT_CONTEXT.finder_memory.clear()
+    return cleanup
+
+def validate_adaptive_finder_order(module):
+    # 第一次导入按标准顺序找到并记住查找器；再次导入时只问记住的那个查找器。
+    finder = GLOBAL_IMPORT_CONTEXT.finder_memory['test_simple_module']
+    assert finder.__name__ == 'PathFinder'
+    del sys.modules['test_simple_module']
+    reset_finder_stats()
+    python_import_simulation('test_simple_module')
+    stats = get_finder_stats()
+    assert [label for label, entry in stats.items() if entry['calls']] == [finder.__name__]
+    assert stats[finder.__name__]['hit_rate'] == 1.0
+    print(f"  记住的查找器: {finder.__name__}, 统计: {stats}")
+
+def use_lazy_submodules():
+    previous = set_lazy_submodules(True, packages=['test_package'])
+    return lambda: set_lazy_submodules(**previous)
+
+def validate_lazy_submodule(package):
+    # 子模块在第一次属性访问时才被导入；`__dir__`能列出尚未导入的子模块。
+    assert 'test_package.submodule' not in sys.modules
+    assert 'submodule' in dir(package)
+    assert package.submodule.submodule_function() == "这是子模块的函数"
+    assert sys.modules['test_package.submodule'] is package.submodule
+    assert not hasattr(package, 'no_such_submodule')
+    print(f"  延迟导入的子模块: {package.submodule.__name__}")
+
+def use_access_tracking():
+    set_access_tracking(True, report_at_exit=False)
+    def cleanup():
+        set_access_tracking(False)
+        MODULE_ACCESS.clear()
+    return cleanup
+
+def validate_access_tracking(module):
+    # 导入后尚未读取任何属性，模块出现在未使用列表中；读取一次后就不再出现。
+    assert 'test_simple_module' in [r['module'] for r in get_unused_imports()]
+    assert module.simple_function()
+    assert 'test_simple_module' not in [r['module'] for r in get_unused_imports()]
+    assert type(module) is type(sys)
+    print(f"  访问跟踪记录: {MODULE_ACCESS[('global', 'test_simple_module')]}")
+
+IMPORT_SESSION = {}
+
+def use_import_session():
+    IMPORT_SESSION['session'] = ImportSession(gc_mode='pause').start()
+    def cleanup():
+        IMPORT_SESSION.pop('session').close()
+        gc.unfreeze()
+    return cleanup
+
+def validate_import_session(top_package):
+    # 会话期间GC被暂停；结束时恢复GC并把导入的对象冻结到永久代。
+    session = IMPORT_SESSION['session']
+    assert not gc.isenabled()
+    report = session.close()
+    assert gc.isenabled()
+    assert report.imports >= 3 and report.frozen > 0
+    assert top_package.b.c.__name__ == 'test_a.b.c'
+    print(f"  导入会话: {report}")
+
+def use_dedup_loader_with_strip():
+    previous = set_loader_mode('dedup', strip={'test_simple_module'})
+    return lambda: set_loader_mode(previous['name'], **previous['options'])
+
+def validate_dedup_and_strip(module):
+    # 按模块去掉了文档字符串；模块中的常量与共享常量表中的是同一个对象。
+    assert module.__doc__ is None and module.simple_function.__doc__ is None
+    table = constant_dedup.SHARED_CONSTANT_TABLE
+    assert module.module_version is table.intern_constant('1.0')
+    assert table.stats['code_objects'] > 0
+    print(f"  共享常量表: {len(table)} 个常量, {table.stats}")
+
+def validate_startup_plan(top_package):
+    # `import test_a.b.c`先串行导入父包，关键路径就是整条包链。
+    records = [r for r in IMPORT_TIMINGS if r['module'].partition('.')[0] == 'test_a']
+    plan = startup_optimizer.analyze(records, min_saving=0)
+    assert plan['critical_path'] == ['test_a', 'test_a.b', 'test_a.b.c']
+    assert plan['defer'] == [] and plan['parallel'] == []
+    # 合成记录: app 执行期间导入了互不依赖的 db(10ms) 和 web(30ms)。
+    synthetic = [
+        {'module': 'db', 'context': 'global', 'parent': 'app', 'start': 1.0, 'exec_time': 0.010},
+        {'module': 'web', 'context': 'global', 'parent': 'app', 'start': 1.02, 'exec_time': 0.030},
+        {'module': 'app', 'context': 'global', 'parent': None, 'start': 0.999, 'exec_time': 0.052},
+    ]
+    plan = startup_optimizer.analyze(synthetic, min_saving=0)
+    assert plan['critical_path'] == ['app', 'web']
+    assert [item['module'] for item in plan['defer']] == ['web', 'db']
+    assert abs(plan['parallel'][0]['saving'] - 0.010) < 1e-9
+    assert abs(plan['critical_time'] - 0.042) < 1e-9
+    # 现场记录: 应用代码里的`import`语句同样被计时，并记到触发它们的应用模块名下。
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = {
+            'so_app': "import so_child_db\nimport so_child_web\nimport colorsys\n",
+            'so_child_db': "import time\ntime.sleep(0.01)\n",
+            'so_child_web': "import time\ntime.sleep(0.02)\n",
+        }
+        for name, source in sources.items():
+            with open(os.path.join(tmp, name + '.py'), 'w', encoding='utf-8') as f:
+                f.write(source)
+        recorded = startup_optimizer.record_imports(['so_app'], paths=[tmp])
+    # 标准库与全局解释器共享，也作为叶子记到导入它的模块名下。
+    assert {r['module']: r['parent'] for r in recorded} == {
+        'so_app': None, 'so_child_db': 'so_app', 'so_child_web': 'so_app',
+        'time': 'so_child_db', 'colorsys': 'so_app'}
+    plan = startup_optimizer.analyze(recorded, min_saving=0)
+    assert plan['critical_path'] == ['so_app', 'so_child_web']
+    assert {item['module'] for item in plan['defer']} >= {'so_child_db', 'so_child_web'}
+    assert 'so_app' not in sys.modules
+    print(f"  启动优化建议: 关键路径 {plan['critical_path']}, 并行节省 {plan['parallel'][0]['saving'] * 1000:.1f}ms")
+
+EVICTION = {}
+
+def use_module_eviction():
+    # 预算为0、无需空闲时间: 除了被固定的包，所有模块一旦空闲就可以被淘汰。
+    EVICTION['manager'] = ModuleEvictionManager(memory_budget=0, min_idle=0,
+                                                pinned={'test_package'}).install()
+    return lambda: EVICTION.pop('manager').uninstall()
+
+def validate_module_eviction(top_package):
+    manager = EVICTION['manager']
+    stale = sys.modules['test_package.submodule']
+    assert manager.enforce_budget() == ['test_package.submodule']
+    # 模块表和父包上都不再有它，字典已清空。
+    assert 'test_package.submodule' not in sys.modules
+    assert 'submodule' not in top_package.__dict__
+    assert 'submodule_function' not in stale.__dict__
+    # 通过旧引用或父包访问时，都会重新加载。
+    assert stale.submodule_function() == "这是子模块的函数"
+    assert top_package.submodule is sys.modules['test_package.submodule']
+    # 只有被淘汰的子模块会被重新导入，探测包上的其他名称不会导入别的子模块。
+    assert not hasattr(top_package, 'utils') and 'test_package.utils' not in sys.modules
+    assert manager.stats['evictions'] == 1 and manager.stats['reloads'] == 1
+    print(f"  模块淘汰: {manager.stats}")
+
+EVICT_TRACKED_CONTEXT = ImportContext(name='run_tests-evict-tracked')
+EVICT_TRACKED = {}
+
+def use_eviction_with_access_tracking():
+    # 同时开启访问跟踪和模块淘汰；时钟由用例手动拨动。先导入的模块之后会被反复访问。
+    directory = tempfile.mkdtemp(prefix='run_tests-evict-tracked-')
+    for name in ('evict_hot_module', 'evict_cold_module'):
+        with open(os.path.join(directory, name + '.py'), 'w', encoding='utf-8') as f:
+            f.write("VALUE = 1\n")
+    EVICT_TRACKED_CONTEXT.path.insert(0, directory)
+    set_access_tracking(True, report_at_exit=False)
+    clock = EVICT_TRACKED['clock'] = [0.0]
+    EVICT_TRACKED['manager'] = ModuleEvictionManager(
+        memory_budget=float('inf'), context=EVICT_TRACKED_CONTEXT, min_idle=0,
+        clock=lambda: clock[0]).install()
+
+    def cleanup():
+        EVICT_TRACKED.pop('manager').uninstall()
+        set_access_tracking(False)
+        MODULE_ACCESS.clear()
+        EVICT_TRACKED_CONTEXT.path.remove(directory)
+        EVICT_TRACKED_CONTEXT.modules.clear()
+        EVICT_TRACKED_CONTEXT.invalidate_caches()
+        shutil.rmtree(directory)
+    return cleanup
+
+def validate_eviction_with_access_tracking(hot):
+    manager, clock = EVICT_TRACKED['manager'], EVICT_TRACKED['clock']
+    cold = EVICT_TRACKED_CONTEXT.import_module('evict_cold_module')
+    # 第一次读取由访问跟踪处理，之后淘汰管理器接手，继续记录访问时间。
+    clock[0] = 10.0
+    assert hot.VALUE == 1 and type(hot) is manager._module_class
+    assert MODULE_ACCESS[(EVICT_TRACKED_CONTEXT.name, 'evict_hot_module')]['accessed']
+    clock[0] = 20.0
+    assert hot.VALUE == 1
+    # 只需淘汰一个模块时，淘汰的是从未访问过的那个，而不是刚刚访问过的模块。
+    manager.memory_budget = manager.stats['resident_bytes'] - 1
+    assert manager.enforce_budget() == ['evict_cold_module']
+    assert 'evict_hot_module' in EVICT_TRACKED_CONTEXT.modules
+    assert cold.VALUE == 1  # 通过旧引用访问时重新加载
+    print(f"  访问跟踪与模块淘汰: {manager.stats}")
+
+def validate_package_resources(package):
+    # 目录中的资源直接映射，返回的memoryview背后是mmap，没有拷贝。
+    reader = resource_reader.get_resource_reader(package)
+    assert 'utils.py' in reader.contents()
+    view = reader.read_resource('__init__.py')
+    with open(package.__file__, 'rb') as f:
+        assert view == f.read()
+    assert isinstance(view.obj, mmap.mmap)
+    # 快照和zip中未压缩的条目同样是映射上的切片。
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'table.bin'), 'wb') as f:
+            f.write(bytes(range(256)))
+        resource_reader.build_snapshot(tmp)
+        archive = os.path.join(tmp, 'bundle.zip')
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('data/table.bin', bytes(range(256)))
+        for location in (tmp, os.path.join(archive, 'data')):
+            view = resource_reader.PackageResourceReader([location]).read_resource('table.bin')
+            assert view == bytes(range(256)) and isinstance(view.obj, mmap.mmap)
+            view.release()
+        # 快照生成后被修改的文件改由目录读取(同样大小，只有mtime不同)；文件删除后快照仍可用。
+        snapshot_reader = resource_reader.PackageResourceReader([tmp])
+        table_path = os.path.join(tmp, 'table.bin')
+        with open(table_path, 'wb') as f:
+            f.write(bytes(reversed(range(256))))
+        st = os.stat(table_path)
+        os.utime(table_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert snapshot_reader.read_resource('table.bin') == bytes(reversed(range(256)))
+        os.remove(table_path)
+        assert snapshot_reader.read_resource('table.bin') == bytes(range(256))
+        resource_reader.SHARED_MAPPING_CACHE.clear()
+    print(f"  资源读取: {reader.contents()}, 映射缓存 {resource_reader.SHARED_MAPPING_CACHE.stats}")
+
+def use_metrics_server():
+    import_metrics.IMPORT_METRICS.reset()
+    import_metrics.start_metrics_server()
+    return import_metrics.stop_metrics_server
+
+def validate_metrics_endpoint(top_package):
+    python_import_simulation('test_a.b.c')  # 再导入一次，命中模块表
+    port = import_metrics._server['server'].server_address[1]
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        text = response.read().decode('utf-8')
+    assert 'simulator_imports_total{outcome="loaded"} 3' in text
+    assert 'simulator_cache_lookups_total{level="module_table",result="hit"}' in text
+    assert 'simulator_filesystem_calls_total{cache="directory",call="stat"}' in text
+    for phase in '123456':
+        assert import_metrics.PHASE_SECONDS.count(phase) > 0, phase
+        assert f'simulator_import_phase_seconds_bucket{{phase="{phase}",le="+Inf"}}' in text
+    print(f"  指标端点: {len(text.splitlines())} 行, "
+          f"已加载 {import_metrics.IMPORTS_TOTAL.value('loaded')} 个模块")
+
+def validate_import_regression(module):
+    # head比base多导入一个耗时约20ms的子模块，回归对比应报告新增模块并让门禁失败；
+    # 同样约20ms的增加，在--min-change之下就不算显著，即使超过上限也不应让门禁失败。
+    with tempfile.TemporaryDirectory() as tmp:
+        for side, extra in (('base', ''), ('head', ', heavy')):
+            package = os.path.join(tmp, side, 'regress_app')
+            os.makedirs(package)
+            with open(os.path.join(package, '__init__.py'), 'w') as f:
+                f.write(f"from regress_app import core{extra}\n")
+            with open(os.path.join(package, 'core.py'), 'w') as f:
+                f.write("VALUE = 1\n")
+            with open(os.path.join(package, 'heavy.py'), 'w') as f:
+                f.write("import time\ntime.sleep(0.02)\n")
+        output, errors = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+            code = import_regression.main(['--base', os.path.join(tmp, 'base'),
+                                           '--head', os.path.join(tmp, 'head'),
+                                           '--import', 'regress_app', '--repeat', '3',
+                                           '--fail-above', '5', '--json'])
+        with contextlib.redirect_stdout(io.StringIO()) as quiet_output, contextlib.redirect_stderr(io.StringIO()):
+            quiet_code = import_regression.main(['--base', os.path.join(tmp, 'base'),
+                                                 '--head', os.path.join(tmp, 'head'),
+                                                 '--import', 'regress_app', '--repeat', '3',
+                                                 '--min-change', '1000', '--fail-above', '5', '--json'])
+    report = json.loads(output.getvalue())
+    quiet_report = json.loads(quiet_output.getvalue())
+    assert quiet_code == 0 and not quiet_report['total_significant'] and quiet_report['total_delta'] > 0.005
+    assert code == 1 and '超过上限' in errors.getvalue()
+    assert [item['module'] for item in report['added']] == ['regress_app.heavy']
+    assert report['removed'] == [] and report['total_delta'] > 0.015
+    print(f"  回归对比: 冷启动 {report['base_total'] * 1000:.2f}ms -> {report['head_total'] * 1000:.2f}ms")
+
+FORK_CONTEXT = ImportContext(name='run_tests-fork')
+
+def use_fork_under_load():
+    cache_watcher.install_cache_watcher()
+    import_metrics.start_metrics_server()
+
+    def cleanup():
+        import_metrics.stop_metrics_server()
+        cache_watcher.uninstall_cache_watcher()
+        FORK_CONTEXT.modules.clear()
+    return cleanup
+
+def _check_forked_child(forks_before):
+    """在子进程中运行，返回退出码。"""
+    listdir_calls = SHARED_DIRECTORY_CACHE.stats['listdir_calls']
+    with contextlib.redirect_stdout(io.StringIO()):
+        # 父进程中另一个线程持有这个模块的导入锁和编译结果缓存的锁。
+        module = FORK_CONTEXT.import_module('test_simple_module')
+    if not callable(getattr(module, 'simple_function', None)):
+        return 2
+    if SHARED_DIRECTORY_CACHE.stats['listdir_calls'] != listdir_calls:
+        return 3  # 目录列表缓存应当是热的
+    if SHARED_DIRECTORY_CACHE.watcher is not None or cache_watcher.get_installed_watcher() is not None:
+        return 4
+    if import_metrics._server['server'] is not None or fork_safety.stats['forks'] != forks_before + 1:
+        return 5
+    return 0
+
+def validate_fork_under_load(module):
+    # 父进程在压力下fork: 几个线程不停地导入(共享缓存的锁被反复获取)，另一个线程持有模块锁和两个缓存的锁。
+    stop, held, release = threading.Event(), threading.Event(), threading.Event()
+
+    def importer(index):
+        context = ImportContext(name=f'run_tests-fork-load-{index}')
+        while not stop.is_set():
+            context.import_module('test_a.b.c')
+            forget_test_modules(context.modules)
+
+    def holder():
+        with FORK_CONTEXT.module_lock('test_simple_module'), SHARED_BYTECODE_CACHE._lock, \
+                SHARED_DIRECTORY_CACHE._lock:
+            held.set()
+            release.wait()
+
+    FORK_CONTEXT.import_module('test_a.b.c')  # 预热目录列表缓存
+    threads = [threading.Thread(target=importer, args=(i,)) for i in range(4)] + [threading.Thread(target=holder)]
+    for thread in threads:
+        thread.start()
+    held.wait()
+    forks_before = fork_safety.stats['forks']
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)  # 3.12起多线程进程fork会发出警告
+            pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = _check_forked_child(forks_before)
+            finally:
+                os._exit(code)
+        deadline = time.monotonic() + 10
+        while True:
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                break
+            if time.monotonic() > deadline:
+                os.kill(pid, 9)
+                os.waitpid(pid, 0)
+                raise AssertionError("子进程在fork后死锁")
+            time.sleep(0.01)
+        assert os.waitstatus_to_exitcode(status) == 0, f"子进程检查失败: {os.waitstatus_to_exitcode(status)}"
+    finally:
+        release.set()
+        stop.set()
+        for thread in threads:
+            thread.join()
+    # 父进程中的监视器和指标端点不受子进程影响。
+    assert cache_watcher.get_installed_watcher() is not None and import_metrics._server['server'] is not None
+    print(f"  fork安全: 子进程正常导入，登记了 {len(fork_safety._registered_objects)} 个需要重新初始化的对象")
+
+WARMER_CONTEXT = ImportContext(name='run_tests-warmer')
+
+def validate_module_warmer(module):
+    # 优先级列表来自上次运行保存的耗时记录，外加一个访问日志式的模块名。
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, 'timings.jsonl')
+        startup_optimizer.save_timings(trace, [{'module': 'test_a.b.c'}, {'module': 'test_a'}])
+        with open(trace, 'a', encoding='utf-8') as f:
+            f.write("test_package.submodule\nno_such_warm_module\ntest_simple_module\n")
+        priorities = load_priorities(trace)
+    assert priorities == ['test_a.b.c', 'test_a', 'test_package.submodule',
+                          'no_such_warm_module', 'test_simple_module']
+
+    warmer = ModuleWarmer(priorities, context=WARMER_CONTEXT, idle_delay=0.02, poll_interval=0.005)
+    request_holds_lock, release_lock = threading.Event(), threading.Event()
+
+    def request_thread():
+        # 一个"请求"正在导入test_simple_module，预热器不应去抢它的锁。
+        with WARMER_CONTEXT.module_lock('test_simple_module'):
+            request_holds_lock.set()
+            release_lock.wait()
+
+    request = threading.Thread(target=request_thread)
+    request.start()
+    request_holds_lock.wait()
+    try:
+        with warmer.busy():
+            warmer.start()
+            time.sleep(0.1)
+            assert warmer.stats['warmed'] == 0 and warmer.stats['pauses'] == 1  # 繁忙时不导入
+        # 其余模块预热完之后，只剩test_simple_module在等锁。
+        deadline = time.monotonic() + 10
+        while warmer.stats['deferred'] < 2:
+            assert time.monotonic() < deadline, warmer.pending
+            time.sleep(0.005)
+        assert 'test_simple_module' not in WARMER_CONTEXT.modules and warmer.stats['warmed'] == 2
+        release_lock.set()
+        assert warmer.wait(10)
+        assert {'test_a.b.c', 'test_package.submodule', 'test_simple_module'} <= WARMER_CONTEXT.modules.keys()
+        assert warmer.stats['warmed'] == 3 and warmer.stats['already_loaded'] == 1
+        assert list(warmer.failures) == ['no_such_warm_module']
+    finally:
+        release_lock.set()
+        request.join()
+        warmer.stop()
+        WARMER_CONTEXT.modules.clear()
+    print(f"  预热器: {warmer.stats}")
+
+SOURCELESS_CONTEXT = ImportContext(name='run_tests-sourceless')
+_sourceless_build = {}
+
+def use_sourceless_build():
+    # 把测试包编译成无源码的目录树(两个编译进程)，放在搜索路径最前面，遮住源码目录。
+    directory = tempfile.mkdtemp(prefix='run_tests-sourceless-')
+    _sourceless_build['directory'] = directory
+    _sourceless_build['report'] = build_sourceless(
+        current_dir, directory, packages=['test_package', 'test_a'], optimize=2, workers=2)
+    SOURCELESS_CONTEXT.path.insert(0, directory)
+
+    def cleanup():
+        SOURCELESS_CONTEXT.path.remove(directory)
+        SOURCELESS_CONTEXT.modules.clear()
+        SOURCELESS_CONTEXT.invalidate_caches()
+        shutil.rmtree(directory)
+    return cleanup
+
+def validate_sourceless_build(package):
+    directory, report = _sourceless_build['directory'], _sourceless_build['report']
+    assert report['modules'] == 6 and not report['errors'] and not report['failures'], report
+    assert not any(name.endswith('.py') for _, _, names in os.walk(directory) for name in names)
+    module = SOURCELESS_CONTEXT.modules['test_package.submodule']
+    assert module.__file__ == os.path.join(directory, 'test_package', 'submodule.pyc')
+    assert package.__file__ == os.path.join(directory, 'test_package', '__init__.pyc')
+    assert module.__doc__ is None and package.__doc__ is None  # optimize=2 去掉了文档字符串
+    # 合并名称索引同样能找到只有`.pyc`的模块和包
+    index = name_index.MergedNameIndex([directory])
+    assert index.lookup('test_package') == (directory, 'package')
+    # 子模块延迟导入同样认得`.pyc`模块和只有`__init__.pyc`的包
+    top_package = SOURCELESS_CONTEXT.import_module('test_a')
+    python_import_mechanism.install_lazy_submodules(top_package, SOURCELESS_CONTEXT)
+    assert 'b' in dir(top_package)
+    assert python_import_mechanism.list_submodules(top_package.b, SOURCELESS_CONTEXT) == {'c'}
+    assert top_package.b.__file__ == os.path.join(directory, 'test_a', 'b', '__init__.pyc')
+    assert not hasattr(top_package, 'no_such_submodule')
+    print(f"  无源码构建: {report['modules']} 个模块, {report['modules_per_second']:.0f} 模块/秒")
+
+ENCODED_CONTEXT = ImportContext(name='run_tests-encoded')
+
+def use_encoded_sources():
+    # 一个带latin-1编码声明的模块和一个带UTF-8 BOM的模块，都以字节交给编译器。
+    directory = tempfile.mkdtemp(prefix='run_tests-encoded-')
+    with open(os.path.join(directory, 'latin1_cookie_module.py'), 'wb') as f:
+        f.write('# -*- coding: latin-1 -*-\nGREETING = "café"\n'.encode('latin-1'))
+    with open(os.path.join(directory, 'bom_module.py'), 'wb') as f:
+        f.write('\ufeffGREETING = "你好"\n'.encode('utf-8'))
+    ENCODED_CONTEXT.path.insert(0, directory)
+
+    def cleanup():
+        ENCODED_CONTEXT.path.remove(directory)
+        ENCODED_CONTEXT.modules.clear()
+        ENCODED_CONTEXT.invalidate_caches()
+        shutil.rmtree(directory)
+    return cleanup
+
+def validate_encoded_sources(module):
+    assert module.GREETING == "café"
+    bom_module = ENCODED_CONTEXT.import_module('bom_module')
+    assert bom_module.GREETING == "你好"
+    assert SHARED_BYTECODE_CACHE.stats['opens'] >= 2
+    print(f"  字节读取: {SHARED_BYTECODE_CACHE.stats}")
+
+INDEXED_CONTEXT = ImportContext(name='run_tests-indexed')
+
+def use_name_index():
+    name_index.install_name_index(INDEXED_CONTEXT)
+    return lambda: name_index.uninstall_name_index(INDEXED_CONTEXT)
+
+def validate_indexed_lookup(module):
+    # 顶层查找走合并索引；不存在的名称也只需一次字典读取就能确定。
+    index = INDEXED_CONTEXT.name_index
+    assert module is INDEXED_CONTEXT.modules['test_simple_module']
+    assert index.lookup('test_simple_module') == (current_dir, 'module')
+    assert index.lookup('test_package') == (current_dir, 'package')
+    assert index.lookup('no_such_top_level_module') is None
+    print(f"  名称索引: {len(index)} 个名称, {index.stats}")
+
+ISOLATED_CONTEXT = ImportContext(name='run_tests-isolated')
+
+def validate_isolated_context(top_package):
+    # 模块只登记在独立上下文中，全局的 sys.modules 不受影响。
+    assert top_package is ISOLATED_CONTEXT.modules['test_package']
+    assert 'test_package' not in sys.modules
+    submodule = ISOLATED_CONTEXT.modules['test_package.submodule']
+    assert 'test_package.submodule' not in sys.modules
+    # 子模块代码中的 `from . import package_function` 也在同一上下文中完成。
+    assert submodule.package_function is top_package.package_function
+    print(f"  独立上下文: {ISOLATED_CONTEXT}")
+
 TEST_CASES = [
     {
         'desc': '1. 简单模块导入: import test_simple_module',
@@ -100,48 +951,279 @@ TEST_CASES = [
     },
     {
         'desc': '10. 星号导入: from test_package import *',
-        'params': {'module_name': 'test_package', 'fromlist': ['*']},
-        'validator': lambda m: m.__name__ == 'test_package'
+        'params': {'module_name': 'test_package', 'fromlist': ['*'], 'globals_dict': STAR_IMPORT_GLOBALS},
+        'validator': validate_star_import_binding
+    },
+    {
+        'desc': '11. 流式加载: import test_package.submodule (逐条顶层语句编译执行)',
+        'params': {'module_name': 'test_package.submodule'},
+        'setup': use_streaming_loader,
+        'validator': validate_streaming_submodule
+    },
+    {
+        'desc': '12. 导入耗时预算: import test_a.b.c (记录超时的父包及其触发者)',
+        'params': {'module_name': 'test_a.b.c'},
+        'setup': use_zero_budget_for_test_a,
+        'validator': validate_budget_report
+    },
+    {
+        'desc': '13. 独立导入上下文: import test_package.submodule (不影响 sys.modules)',
+        'params': {'module_name': 'test_package.submodule', 'context': ISOLATED_CONTEXT},
+        'validator': validate_isolated_context
+    },
+    {
+        'desc': '14. 缓存监视器: import test_package.submodule (被监视目录的查找无需stat)',
+        'params': {'module_name': 'test_package.submodule'},
+        'setup': use_cache_watcher,
+        'validator': validate_watched_lookup
+    },
+    {
+        'desc': '15. 合并名称索引: import test_simple_module (顶层查找只读一次索引)',
+        'params': {'module_name': 'test_simple_module', 'context': INDEXED_CONTEXT},
+        'setup': use_name_index,
+        'validator': validate_indexed_lookup
+    },
+    {
+        'desc': '16. 自适应查找器顺序: import test_simple_module (再次导入只问记住的查找器)',
+        'params': {'module_name': 'test_simple_module'},
+        'setup': use_adaptive_finder_order,
+        'validator': validate_adaptive_finder_order
+    },
+    {
+        'desc': '17. 子模块延迟导入: import test_package; test_package.submodule (PEP 562)',
+        'params': {'module_name': 'test_package'},
+        'setup': use_lazy_submodules,
+        'validator': validate_lazy_submodule
+    },
+    {
+        'desc': '18. 未使用导入检测: import test_simple_module (记录模块是否被访问过)',
+        'params': {'module_name': 'test_simple_module'},
+        'setup': use_access_tracking,
+        'validator': validate_access_tracking
+    },
+    {
+        'desc': '19. GC感知导入会话: import test_a.b.c (暂停GC，结束时gc.freeze)',
+        'params': {'module_name': 'test_a.b.c'},
+        'setup': use_import_session,
+        'validator': validate_import_session
+    },
+    {
+        'desc': '20. 常量去重: import test_simple_module (共享常量表，按模块去掉文档字符串)',
+        'params': {'module_name': 'test_simple_module'},
+        'setup': use_dedup_loader_with_strip,
+        'validator': validate_dedup_and_strip
+    },
+    {
+        'desc': '21. 启动关键路径: import test_a.b.c (由耗时记录计算关键路径和优化建议)',
+        'params': {'module_name': 'test_a.b.c'},
+        'validator': validate_startup_plan
+    },
+    {
+        'desc': '22. 模块淘汰: import test_package.submodule (淘汰空闲叶子模块，访问时重新加载)',
+        'params': {'module_name': 'test_package.submodule'},
+        'setup': use_module_eviction,
+        'validator': validate_module_eviction
+    },
+    {
+        'desc': '23. 包资源读取: import test_package (目录、快照、zip条目的零拷贝读取)',
+        'params': {'module_name': 'test_package'},
+        'validator': validate_package_resources
+    },
+    {
+        'desc': '24. 导入指标: import test_a.b.c (通过本机HTTP端点导出Prometheus格式的指标)',
+        'params': {'module_name': 'test_a.b.c'},
+        'setup': use_metrics_server,
+        'validator': validate_metrics_endpoint
+    },
+    {
+        'desc': '25. 字节读取源文件: import latin1_cookie_module (按编码声明和BOM编译，不在Python中解码)',
+        'params': {'module_name': 'latin1_cookie_module', 'context': ENCODED_CONTEXT},
+        'setup': use_encoded_sources,
+        'validator': validate_encoded_sources
+    },
+    {
+        'desc': '26. 导入开销回归对比: 两套代码冷启动同一入口 (报告新增模块，超出上限时门禁失败)',
+        'params': {'module_name': 'test_simple_module'},
+        'validator': validate_import_regression
+    },
+    {
+        'desc': '27. fork安全: 多线程导入时fork (子进程中重建锁、卸下监视器和指标端点，缓存保持预热)',
+        'params': {'module_name': 'test_simple_module'},
+        'setup': use_fork_under_load,
+        'validator': validate_fork_under_load
+    },
+    {
+        'desc': '28. 空闲时预热: 按优先级在后台导入 (繁忙时暂停，不抢请求线程持有的模块锁)',
+        'params': {'module_name': 'test_simple_module'},
+        'validator': validate_module_warmer
+    },
+    {
+        'desc': '29. 无源码部署: 并行预编译成.pyc目录树，并在全新上下文中直接导入',
+        'params': {'module_name': 'test_package.submodule', 'context': SOURCELESS_CONTEXT},
+        'setup': use_sourceless_build,
+        'validator': validate_sourceless_build
+    },
+    {
+        'desc': '30. 流式加载旁路文件: import sidecar_table_module (字面量还原原类型，指定名称零拷贝)',
+        'params': {'module_name': 'sidecar_table_module', 'context': SIDECAR_CONTEXT},
+        'setup': use_literal_sidecar,
+        'validator': validate_literal_sidecar
+    },
+    {
+        'desc': '31. 常量表缓存: import constant_table_module (缓存命中、选项变化和源文件修改后重建)',
+        'params': {'module_name': 'constant_table_module', 'context': CONSTANT_CACHE_CONTEXT},
+        'setup': use_constant_cache,
+        'validator': validate_constant_cache
+    },
+    {
+        'desc': '32. Spec缓存与路径顺序: import shadow_module (靠前的条目新增同名模块后不再复用旧Spec)',
+        'params': {'module_name': 'shadow_module', 'context': SHADOW_CONTEXT},
+        'setup': use_shadow_paths,
+        'validator': validate_shadowed_spec_cache
+    },
+    {
+        'desc': '33. 星号导入无源码子模块: from star_sourceless_pkg import * (与find_in_paths相同的子模块判断)',
+        'params': {'module_name': 'star_sourceless_pkg', 'fromlist': ['*'], 'globals_dict': STAR_SOURCELESS_GLOBALS,
+                   'context': STAR_SOURCELESS_CONTEXT},
+        'setup': use_star_sourceless_package,
+        'validator': validate_star_sourceless
+    },
+    {
+        'desc': '34. 名称索引与新增模块: import indexed_shadow_module (无监视器时按mtime发现遮盖和新名称)',
+        'params': {'module_name': 'indexed_shadow_module', 'context': INDEXED_SHADOW_CONTEXT},
+        'setup': use_indexed_shadow_paths,
+        'validator': validate_indexed_shadowing
+    },
+    {
+        'desc': '35. 访问跟踪与模块淘汰同时开启: import evict_hot_module (淘汰最久未访问的模块)',
+        'params': {'module_name': 'evict_hot_module', 'context': EVICT_TRACKED_CONTEXT},
+        'setup': use_eviction_with_access_tracking,
+        'validator': validate_eviction_with_access_tracking
+    },
+    {
+        'desc': '36. 缓存监视器晚于导入安装: import watch_late_module (监视开始前的修改不会被当作缓存命中)',
+        'params': {'module_name': 'watch_late_module', 'context': WATCH_LATE_CONTEXT},
+        'setup': use_watcher_after_cached_import,
+        'validator': validate_watcher_after_cached_import
     }
 ]
 
 # --- 测试运行器 ---
 
-if __name__ == "__main__":
+# 测试用例会导入的顶层包。每次运行结束后把它们从模块表中移除，
+# 下一次运行就会重新执行模块代码，而不是直接命中缓存。
+TEST_PACKAGES = ('test_simple_module', 'test_package', 'test_a')
+
+def forget_test_modules(modules):
+    for name in [name for name in modules if name.partition('.')[0] in TEST_PACKAGES]:
+        del modules[name]
+
+def run_case_once(case):
+    """
+    执行一次用例。
+
+    Returns:
+        tuple: `(passed, message, elapsed_seconds)`。
+    """
+    # `setup`返回一个清理函数，用于在用例结束后恢复全局设置(例如加载模式)。
+    cleanup = case['setup']() if case.get('setup') else None
+    started = time.perf_counter()
+    try:
+        result = python_import_simulation(**case['params'])
+        elapsed = time.perf_counter() - started
+        if case.get('should_fail'):
+            return False, "预期失败但成功了", elapsed
+        if case.get('validator'):
+            case['validator'](result)
+        return True, "成功", elapsed
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        if case.get('should_fail'):
+            return True, f"预期失败: {e}", elapsed
+        return False, f"意外失败: {e}\n{traceback.format_exc()}", elapsed
+    finally:
+        if cleanup:
+            cleanup()
+        forget_test_modules(sys.modules)
+        context = case['params'].get('context')
+        if context is not None:
+            forget_test_modules(context.modules)
+
+def run_case_in_worker(index):
+    """
+    在工作进程中运行第`index`个用例: 先冷运行一次，再热运行一次。
+
+    冷运行时进程刚启动，目录列表缓存、编译结果缓存都是空的；
+    热运行时这些查找缓存已经预热，但模块表中的测试模块已被移除，模块代码会重新执行。
+    """
+    case = TEST_CASES[index]
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        cold_passed, cold_message, cold_time = run_case_once(case)
+        warm_passed, warm_message, warm_time = run_case_once(case)
+    passed = cold_passed and warm_passed
+    return {
+        'index': index,
+        'desc': case['desc'],
+        'passed': passed,
+        'message': cold_message if not cold_passed or passed else f"热运行: {warm_message}",
+        'cold_time': cold_time,
+        'warm_time': warm_time,
+        'output': output.getvalue(),
+    }
+
+def run_all(jobs=None, serial=False):
+    """
+    运行全部用例，按用例顺序返回结果。
+
+    默认每个用例在进程池中一个全新的工作进程里运行(`max_tasks_per_child=1`)，
+    各用例拥有独立的模块表和查找缓存，互不影响，结果与执行顺序无关。
+    `serial=True`时在当前进程中依次运行，便于调试。
+    """
+    indexes = range(len(TEST_CASES))
+    if serial:
+        return [run_case_in_worker(i) for i in indexes]
+    with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1) as pool:
+        return list(pool.map(run_case_in_worker, indexes))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="运行 python_import_mechanism 的测试用例")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="并行的工作进程数，默认等于CPU核数")
+    parser.add_argument('--serial', action='store_true',
+                        help="在当前进程中依次运行所有用例")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="打印每个用例的完整导入日志(默认只打印失败用例的日志)")
+    args = parser.parse_args(argv)
+
     print("Python Import 机制模拟实现测试")
     print("="*60)
 
-    all_passed = True
-    for i, case in enumerate(TEST_CASES, 1):
-        print(f"\n--- {case['desc']} ---")
+    started = time.perf_counter()
+    results = run_all(jobs=args.jobs, serial=args.serial)
+    wall_time = time.perf_counter() - started
 
-        try:
-            # 清理缓存，确保每次测试都是独立的
-            if 'test_simple_module' in sys.modules: del sys.modules['test_simple_module']
-            if 'test_package.submodule' in sys.modules: del sys.modules['test_package.submodule']
-            if 'test_package' in sys.modules: del sys.modules['test_package']
-
-            result = python_import_simulation(**case['params'])
-
-            if case.get('should_fail'):
-                print(f"  [FAIL] 预期失败但成功了")
-                all_passed = False
-            else:
-                if case.get('validator'):
-                    case['validator'](result)
-                print(f"  [PASS] 成功")
-
-        except Exception as e:
-            if case.get('should_fail'):
-                print(f"  [PASS] 预期失败: {e}")
-            else:
-                print(f"  [FAIL] 意外失败: {e}")
-                traceback.print_exc()
-                all_passed = False
+    for result in results:
+        print(f"\n--- {result['desc']} ---")
+        if args.verbose or not result['passed']:
+            print(result['output'].rstrip())
+        status = 'PASS' if result['passed'] else 'FAIL'
+        print(f"  [{status}] {result['message']}")
+        print(f"  耗时: 冷运行 {result['cold_time'] * 1000:.2f}ms, "
+              f"热运行 {result['warm_time'] * 1000:.2f}ms")
 
+    all_passed = all(result['passed'] for result in results)
+    cold_total = sum(result['cold_time'] for result in results)
+    warm_total = sum(result['warm_time'] for result in results)
     print("\n" + "="*60)
+    print(f"{len(results)} 个用例, 冷运行合计 {cold_total * 1000:.1f}ms, "
+          f"热运行合计 {warm_total * 1000:.1f}ms, 总耗时 {wall_time:.2f}s")
     if all_passed:
         print("✅ 所有测试用例通过!")
     else:
         print("❌ 部分测试用例失败")
     print("="*60)
+    return 0 if all_passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
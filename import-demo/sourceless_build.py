@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+无源码部署构建 (Sourceless Build)
+===============================
+
+部署到生产环境的代码不会再修改，每个进程启动时重新解析源码纯属浪费。
+`build_sourceless()`把一个搜索路径条目下的模块和包预先编译成`.pyc`文件，
+生成一棵不含源码的目录树，模拟器的查找器和加载器可以直接从中导入:
+
+- 遍历方式与`find_in_paths`一致: 顶层的`name.py`和含`__init__.py`的包目录，
+  包内递归处理子模块和子包；不含`__init__.py`的子目录和其他文件作为数据文件原样复制，
+  `resource_reader`仍能读到它们。
+- 在进程池中并行编译，优化级别由`optimize`指定(`2`会去掉`assert`和文档字符串)。
+  输出的`.pyc`与源文件放在同一位置(`pkg/mod.pyc`)，而不是`__pycache__`中。
+- 代码对象中记录的文件名是相对路径(`pkg/mod.py`)，不泄露构建机器上的目录结构。
+- 构建完成后在全新的`ImportContext`中逐个导入所有模块，确认产物可用，
+  并且每个模块确实来自输出目录中的`.pyc`。
+
+如何使用:
+    python sourceless_build.py src/ build/ --package myapp -O 2 -j 8
+    python sourceless_build.py src/ build/ --no-validate
+
+    from sourceless_build import build_sourceless
+    report = build_sourceless('src', 'build', packages=['myapp'], optimize=2)
+
+`.pyc`文件与编译它的Python版本绑定，加载时会校验魔数。
+
+"""
+
+import argparse
+import contextlib
+import io
+import marshal
+import os
+import shutil
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import MAGIC_NUMBER
+
+from import_caches import SHARED_DIRECTORY_CACHE
+
+DEFAULT_OPTIMIZE = 2
+
+
+# --- 遍历 ---
+
+def discover(source_root, packages=None):
+    """
+    找出`source_root`下可导入的模块和需要复制的数据文件。
+
+    Args:
+        source_root (str): 一个搜索路径条目。
+        packages (list, optional): 要包含的顶层名称，默认是该条目下的全部模块和包。
+
+    Returns:
+        tuple: `(modules, data)`。`modules`是`[(模块名, 源文件相对路径)]`，
+        `data`是数据文件和数据目录的相对路径列表。
+    """
+    listing = SHARED_DIRECTORY_CACHE.listing(source_root)
+    if packages is None:
+        packages = sorted({entry[:-3] for entry in listing if entry.endswith('.py')} |
+                          {entry for entry in listing if _is_package(os.path.join(source_root, entry))})
+    modules, data = [], []
+    for name in packages:
+        # 同一条目中`.py`文件优先于包目录，与`find_in_paths`相同
+        if name + '.py' in listing:
+            modules.append((name, name + '.py'))
+        elif name in listing and _is_package(os.path.join(source_root, name)):
+            _walk_package(source_root, name, name, modules, data)
+        else:
+            raise FileNotFoundError(f"在 {source_root} 中找不到模块或包: {name}")
+    return modules, data
+
+
+def _is_package(directory):
+    return '__init__.py' in SHARED_DIRECTORY_CACHE.listing(directory)
+
+
+def _walk_package(source_root, package_name, relative_dir, modules, data):
+    directory = os.path.join(source_root, relative_dir)
+    for entry in sorted(SHARED_DIRECTORY_CACHE.listing(directory)):
+        relative = os.path.join(relative_dir, entry)
+        if entry == '__pycache__' or entry.endswith('.pyc'):
+            continue
+        if entry.endswith('.py'):
+            name = package_name if entry == '__init__.py' else f"{package_name}.{entry[:-3]}"
+            modules.append((name, relative))
+        elif _is_package(os.path.join(source_root, relative)):
+            _walk_package(source_root, f"{package_name}.{entry}", relative, modules, data)
+        else:
+            data.append(relative)
+
+
+# --- 编译 ---
+
+def _compile_one(source_root, output_root, relative, optimize):
+    """编译一个源文件并写出`.pyc`。在进程池的工作进程中运行。"""
+    started = time.perf_counter()
+    source_path = os.path.join(source_root, relative)
+    with open(source_path, 'rb') as f:
+        source = f.read()
+    try:
+        code = compile(source, relative, 'exec', dont_inherit=True, optimize=optimize)
+    except SyntaxError as e:
+        return relative, len(source), 0, time.perf_counter() - started, f"{e.__class__.__name__}: {e}"
+    # 与`__pycache__`中的文件格式相同(PEP 552，基于时间戳)，只是多数字段在部署后不再被使用。
+    st = os.stat(source_path)
+    header = MAGIC_NUMBER + struct.pack('<III', 0, int(st.st_mtime) & 0xFFFFFFFF, st.st_size & 0xFFFFFFFF)
+    payload = header + marshal.dumps(code)
+    target = os.path.join(output_root, relative[:-3] + '.pyc')
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    with open(target + '.tmp', 'wb') as f:
+        f.write(payload)
+    os.replace(target + '.tmp', target)
+    return relative, len(source), len(payload), time.perf_counter() - started, None
+
+
+def _compile_all(source_root, output_root, sources, optimize, workers):
+    if workers == 1 or len(sources) <= 1:
+        return [_compile_one(source_root, output_root, relative, optimize) for relative in sources]
+    # 每个任务只编译一个文件，分块提交以摊薄进程间通信的开销。
+    chunksize = max(1, len(sources) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_compile_one, [source_root] * len(sources), [output_root] * len(sources),
+                             sources, [optimize] * len(sources), chunksize=chunksize))
+
+
+def _copy_data(source_root, output_root, data):
+    for relative in data:
+        source, target = os.path.join(source_root, relative), os.path.join(output_root, relative)
+        if os.path.isdir(source):
+            shutil.copytree(source, target, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns('__pycache__', '*.py', '*.pyc'))
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+
+
+# --- 验证 ---
+
+def validate_build(output_root, module_names, source_root=None):
+    """
+    在全新的导入上下文中逐个导入模块，返回`{模块名: 错误信息}`，全部成功时为空。
+
+    搜索路径是输出目录加上`sys.path`(去掉`source_root`)，构建遗漏的模块不会悄悄从源码目录导入。
+    """
+    from python_import_mechanism import ImportContext
+
+    excluded = os.path.abspath(source_root) if source_root is not None else None
+    path = [output_root] + [entry for entry in sys.path if os.path.abspath(entry or '.') != excluded]
+    context = ImportContext(path=path, name='sourceless-validate')
+    output_root = os.path.abspath(output_root)
+    failures = {}
+    for name in module_names:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                module = context.import_module(name)
+        except Exception as e:
+            failures[name] = f"{e.__class__.__name__}: {e}"
+            continue
+        origin = os.path.abspath(getattr(module, '__file__', None) or '')
+        if not origin.endswith('.pyc') or not origin.startswith(output_root + os.sep):
+            failures[name] = f"没有从构建产物中导入: {origin}"
+    return failures
+
+
+# --- 构建 ---
+
+def build_sourceless(source_root, output_root, packages=None, optimize=DEFAULT_OPTIMIZE,
+                     workers=None, validate=True):
+    """
+    把`source_root`下的模块编译成无源码的目录树，写到`output_root`。
+
+    Args:
+        source_root (str): 源码所在的搜索路径条目。
+        output_root (str): 输出目录，已有的同名文件会被覆盖。
+        packages (list, optional): 要构建的顶层模块和包，默认是全部。
+        optimize (int): 编译优化级别，同`compile()`的`optimize`参数。
+        workers (int, optional): 编译进程数，默认是CPU数；为1时在当前进程中编译。
+        validate (bool): 构建后是否在全新的导入上下文中验证。
+
+    Returns:
+        dict: 模块数、字节数、耗时、吞吐量，以及`errors`(编译失败)和`failures`(验证失败)。
+    """
+    workers = workers or os.cpu_count() or 1
+    modules, data = discover(source_root, packages)
+    started = time.perf_counter()
+    results = _compile_all(source_root, output_root, [relative for _, relative in modules], optimize, workers)
+    wall_time = time.perf_counter() - started
+    _copy_data(source_root, output_root, data)
+
+    errors = {relative: error for relative, _, _, _, error in results if error is not None}
+    source_bytes = sum(result[1] for result in results)
+    report = {
+        'modules': len(modules) - len(errors),
+        'data_files': len(data),
+        'optimize': optimize,
+        'workers': workers,
+        'source_bytes': source_bytes,
+        'output_bytes': sum(result[2] for result in results),
+        'wall_time': wall_time,
+        'cpu_time': sum(result[3] for result in results),
+        'modules_per_second': len(results) / wall_time if wall_time else 0.0,
+        'bytes_per_second': source_bytes / wall_time if wall_time else 0.0,
+        'errors': errors,
+        'failures': {},
+    }
+    print(f"   [SOURCELESS] 编译 {len(results)} 个模块(optimize={optimize}, {workers} 个进程): "
+          f"{wall_time * 1000:.1f}ms，{report['modules_per_second']:.0f} 模块/秒，"
+          f"{report['bytes_per_second'] / 1024 / 1024:.2f} MiB/秒")
+    if validate:
+        built = [name for name, relative in modules if relative not in errors]
+        report['failures'] = validate_build(output_root, built, source_root)
+        print(f"   [SOURCELESS] 验证导入 {len(built)} 个模块，失败 {len(report['failures'])} 个")
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"模块: {report['modules']} 个，数据文件: {report['data_files']} 个",
+        f"源码 {report['source_bytes'] / 1024:.1f}KiB -> 字节码 {report['output_bytes'] / 1024:.1f}KiB",
+        f"编译耗时: {report['wall_time'] * 1000:.1f}ms(各进程合计 {report['cpu_time'] * 1000:.1f}ms)，"
+        f"{report['modules_per_second']:.0f} 模块/秒，{report['bytes_per_second'] / 1024 / 1024:.2f} MiB/秒",
+    ]
+    for relative, error in report['errors'].items():
+        lines.append(f"[编译失败] {relative}: {error}")
+    for name, error in report['failures'].items():
+        lines.append(f"[验证失败] {name}: {error}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把源码树预编译成无源码的.pyc部署目录")
+    parser.add_argument('source', help="源码所在的搜索路径条目")
+    parser.add_argument('output', help="输出目录")
+    parser.add_argument('--package', dest='packages', action='append', metavar='NAME',
+                        help="要构建的顶层模块或包，可重复指定；默认是全部")
+    parser.add_argument('-O', '--optimize', type=int, choices=(0, 1, 2), default=DEFAULT_OPTIMIZE,
+                        help="编译优化级别")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="编译进程数，默认是CPU数")
+    parser.add_argument('--no-validate', dest='validate', action='store_false',
+                        help="构建后不做导入验证")
+    args = parser.parse_args(argv)
+
+    report = build_sourceless(args.source, args.output, args.packages, optimize=args.optimize,
+                              workers=args.workers, validate=args.validate)
+    print(format_report(report))
+    return 1 if report['errors'] or report['failures'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+启动关键路径优化器 (Startup Optimizer)
+====================================
+
+`python_import_simulation`在阶段5为每个模块记录一条`IMPORT_TIMINGS`:
+执行耗时、开始时间，以及触发它的父导入。本工具把这些记录还原成导入树，
+计算启动的关键路径，并给出带预计收益的优化建议:
+
+- 延迟导入: 把某个子导入挪出启动路径(改为函数内导入或`set_lazy_submodules`)，
+  预计节省它整棵子树的耗时。导入后从未被访问的模块(见`set_access_tracking`)会被特别标出。
+- 并行预编译: 同一个父模块下的几棵子树互不依赖，可以在多个进程中并行预编译，
+  预计节省"子树耗时之和 - 最长子树耗时"。这是上限估计，实际收益取决于编译占执行时间的比例。
+
+耗时的计算:
+- 子导入发生在父模块执行期间时，父模块的执行耗时已经包含了它；`import a.b.c`中
+  先于`a.b.c`执行的父包`a`、`a.b`则不包含在`a.b.c`的执行耗时中。
+  因此按时间区间区分两种子节点: 子树耗时 = 执行耗时 + 不被包含的子节点的子树耗时，
+  自身耗时 = 执行耗时 - 被包含的子节点的子树耗时。
+- 不被包含的子节点是必须先完成的父包，它们之间也有先后依赖，只能串行；
+  被包含的子节点(真正的子导入)假设可以并行:
+  关键路径耗时 = 父包的关键路径耗时之和 + 自身耗时 + 最长子导入的关键路径耗时。
+
+如何使用:
+    python startup_optimizer.py --import test_a.b.c json      # 现场导入并分析
+    python startup_optimizer.py --trace timings.jsonl         # 分析保存下来的记录
+    python startup_optimizer.py --trace timings.jsonl --json  # 以JSON输出
+
+记录可以用`save_timings(path)`保存，格式与导入预算的报告文件相同(JSON Lines)。
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+
+from python_import_mechanism import (IMPORT_TIMINGS, MODULE_ACCESS, ImportContext, import_timings_mark,
+                                     import_timings_since)
+
+DEFAULT_TOP = 10
+DEFAULT_MIN_SAVING = 0.0005  # 秒
+
+
+class ImportNode:
+    """导入树中的一个模块。"""
+
+    def __init__(self, record):
+        self.module = record['module']
+        self.context = record['context']
+        self.parent = record['parent']
+        self.start = record['start']
+        self.exec_time = record['exec_time']
+        self.children = []
+        # 以下由`analyze`填充
+        self.nested = False     # 是否在父模块的执行期间完成(即包含在父模块的执行耗时中)
+        self.inclusive = 0.0    # 子树耗时
+        self.self_time = 0.0    # 自身耗时
+        self.critical = 0.0     # 以它为起点的关键路径耗时
+
+    @property
+    def end(self):
+        return self.start + self.exec_time
+
+    def __repr__(self):
+        return f"<ImportNode {self.module} {self.inclusive * 1000:.2f}ms>"
+
+
+def save_timings(path, records=None):
+    """把导入耗时记录保存为JSON Lines文件。"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in IMPORT_TIMINGS if records is None else records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def load_timings(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_import_tree(records):
+    """
+    按(上下文, 模块名)建立导入树。
+
+    Returns:
+        list: 根节点(没有父导入，或父导入不在记录中的模块)。
+    """
+    nodes = {}
+    for record in records:
+        # 同一个模块出现多次时(例如被移出模块表后重新导入)，以最后一次为准。
+        nodes[(record['context'], record['module'])] = ImportNode(record)
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get((node.context, node.parent)) if node.parent else None
+        if parent is None or parent is node:
+            roots.append(node)
+        else:
+            parent.children.append(node)
+            node.nested = parent.start <= node.start and node.end <= parent.end
+    return sorted(roots, key=lambda node: node.start)
+
+
+def _compute(node):
+    for child in node.children:
+        _compute(child)
+    nested = [child for child in node.children if child.nested]
+    before = [child for child in node.children if not child.nested]
+    node.inclusive = node.exec_time + sum(child.inclusive for child in before)
+    node.self_time = max(node.exec_time - sum(child.inclusive for child in nested), 0.0)
+    node.critical = (sum(child.critical for child in before) + node.self_time
+                     + max((child.critical for child in nested), default=0.0))
+
+
+def _walk(nodes):
+    for node in nodes:
+        yield node
+        yield from _walk(node.children)
+
+
+def critical_path(node):
+    """按执行顺序返回关键路径: 先完成的父包，模块自身，再沿最慢的子导入走到叶子。"""
+    path = []
+    for child in sorted(node.children, key=lambda child: child.start):
+        if not child.nested:
+            path.extend(critical_path(child))
+    path.append(node)
+    nested = [child for child in node.children if child.nested]
+    if nested:
+        path.extend(critical_path(max(nested, key=lambda child: child.critical)))
+    return path
+
+
+def compute_times(records):
+    """
+    建立导入树并计算每个节点的子树耗时、自身耗时和关键路径耗时。
+
+    Returns:
+        tuple: `(roots, nodes)`，`nodes`是按深度优先顺序排列的全部节点。
+    """
+    roots = build_import_tree(records)
+    for root in roots:
+        _compute(root)
+    return roots, list(_walk(roots))
+
+
+def _is_parent_package(child, parent):
+    """`import a.b.c`先导入的`a`、`a.b`不能被推迟。"""
+    return parent.module.startswith(child.module + '.')
+
+
+def analyze(records, top=DEFAULT_TOP, min_saving=DEFAULT_MIN_SAVING):
+    """
+    分析导入耗时记录。
+
+    Returns:
+        dict: `serial_time`(串行总耗时)、`critical_time`(完全并行时的下限)、
+        `critical_path`(模块名列表)、`defer`和`parallel`(建议列表，按预计收益排序)。
+    """
+    roots, nodes = compute_times(records)
+    unused = {(record['context'], record['module'])
+              for record in MODULE_ACCESS.values() if not record['accessed']}
+
+    defer = []
+    for node in nodes:
+        for child in node.children:
+            if _is_parent_package(child, node) or child.inclusive < min_saving:
+                continue
+            defer.append({
+                'module': child.module,
+                'imported_by': node.module,
+                'saving': child.inclusive,
+                'subtree_modules': sum(1 for _ in _walk([child])),
+                'unused': (child.context, child.module) in unused,
+            })
+    # 从未被访问的模块排在前面，它们可以直接删除或改为延迟导入。
+    defer.sort(key=lambda item: (not item['unused'], -item['saving']))
+
+    parallel = []
+    for node in nodes:
+        # 只有在同一个父模块执行期间导入的兄弟子树才互不依赖。
+        siblings = [child for child in node.children if child.nested]
+        if len(siblings) < 2:
+            continue
+        subtrees = [child.inclusive for child in siblings]
+        saving = sum(subtrees) - max(subtrees)
+        if saving >= min_saving:
+            parallel.append({
+                'module': node.module,
+                'subtrees': [child.module for child in siblings],
+                'saving': saving,
+            })
+    parallel.sort(key=lambda item: -item['saving'])
+
+    slowest_root = max(roots, key=lambda root: root.critical, default=None)
+    return {
+        'modules': len(nodes),
+        'serial_time': sum(root.inclusive for root in roots),
+        'critical_time': max((root.critical for root in roots), default=0.0),
+        'critical_path': [node.module for node in critical_path(slowest_root)] if slowest_root else [],
+        'defer': defer[:top],
+        'parallel': parallel[:top],
+    }
+
+
+def format_plan(plan):
+    lines = [
+        f"已分析 {plan['modules']} 个模块",
+        f"串行启动耗时: {plan['serial_time'] * 1000:.2f}ms，"
+        f"子树完全并行时的下限: {plan['critical_time'] * 1000:.2f}ms",
+        f"关键路径: {' -> '.join(plan['critical_path']) or '(无)'}",
+        "",
+        "[延迟导入] 挪出启动路径后预计节省:",
+    ]
+    for item in plan['defer']:
+        mark = "  [从未访问]" if item['unused'] else ""
+        lines.append(f"   {item['saving'] * 1000:>8.2f}ms  {item['module']} "
+                     f"(由 {item['imported_by']} 导入，子树 {item['subtree_modules']} 个模块){mark}")
+    if not plan['defer']:
+        lines.append("   (无)")
+    lines += ["", "[并行预编译] 兄弟子树并行预计最多节省:"]
+    for item in plan['parallel']:
+        lines.append(f"   {item['saving'] * 1000:>8.2f}ms  {item['module']}: {', '.join(item['subtrees'])}")
+    if not plan['parallel']:
+        lines.append("   (无)")
+    return '\n'.join(lines)
+
+
+def record_imports(module_names, paths=()):
+    """
+    现场导入一组模块(不打印导入日志)，返回这次导入产生的耗时记录。
+
+    在全新的独立上下文中导入: 模块代码里的`import`语句同样经过模拟器，
+    子导入也被计时并记到触发它的父模块名下。`paths`排在`sys.path`前面。
+    标准库与全局解释器共享，不在上下文中执行；它们的全局导入耗时作为叶子记录，
+    标准库内部的子导入不再展开，本进程中已经加载过的标准库模块耗时接近0。
+    """
+    context = ImportContext(path=list(paths) + sys.path, name='startup-optimizer',
+                            time_shared_modules=True)
+    mark = import_timings_mark()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in module_names:
+            context.import_module(name)
+    return import_timings_since(mark)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="根据导入耗时记录给出启动优化建议")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--trace', help="JSON Lines格式的导入耗时记录文件")
+    source.add_argument('--import', dest='modules', nargs='+', metavar='MODULE',
+                        help="现场导入这些模块并分析")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="每类建议最多显示几条")
+    parser.add_argument('--min-saving', type=float, default=DEFAULT_MIN_SAVING * 1000,
+                        help="预计收益低于该值(毫秒)的建议不显示")
+    parser.add_argument('--save', help="把现场导入的记录保存到该文件")
+    parser.add_argument('--json', action='store_true', help="以JSON输出")
+    args = parser.parse_args(argv)
+
+    records = load_timings(args.trace) if args.trace else record_imports(args.modules)
+    if args.save:
+        save_timings(args.save, records)
+    plan = analyze(records, top=args.top, min_saving=args.min_saving / 1000)
+    print(json.dumps(plan, ensure_ascii=False, indent=2) if args.json else format_plan(plan))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,539 @@
+"""
+流式源码加载器 (Streaming Source Loader)
+======================================
+
+`python_import_mechanism.py`中的默认加载器会用`f.read()`一次性读入整个文件，
+再`exec`一个大字符串。对于几十到几百MB的生成模块(例如protobuf表、查找字典)，
+源码文本、AST和代码对象会同时驻留内存，峰值往往是文件大小的数倍。
+
+本模块提供一种"流式"加载模式:
+- 用`mmap`映射源文件，不把整份源码读成一个字符串。
+- 借助`tokenize`找出顶层语句的边界，按"若干条顶层语句"为一块(chunk)，
+  逐块`compile`并在模块命名空间中执行。任一时刻只有一块源码的AST和代码对象在内存中。
+- 可选的数据字面量旁路文件(sidecar): 把形如`NAME = <大字面量>`的顶层赋值
+  存成紧凑的二进制格式。再次导入时直接从映射的文件中取值，默认还原成原来的类型；
+  `zero_copy_names`中列出的数值列表/元组和bytes以只读`memoryview`的形式零拷贝返回(会改变对象类型)。
+- 用`tracemalloc`统计导入期间的峰值内存，并按内存预算给出警告或拒绝导入。
+
+如何使用:
+    import streaming_loader
+    from python_import_mechanism import set_loader_mode, python_import_simulation
+
+    set_loader_mode('streaming', chunk_bytes=1 << 20, memory_budget=64 << 20, sidecar=True)
+    module = python_import_simulation('huge_generated_table')
+    print(streaming_loader.MEMORY_REPORTS[-1])
+
+"""
+
+import ast
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+import tokenize
+import tracemalloc
+import __future__
+
+from python_import_mechanism import register_loader_mode
+
+# 每块源码的目标大小(字节)。一块总是包含完整的顶层语句，因此实际大小可能更大。
+DEFAULT_CHUNK_BYTES = 1 << 20
+
+# 编译一块源码时，AST和代码对象大约是源码大小的若干倍。
+# 设置内存预算时，块大小会被限制为预算的1/16，给这部分开销留出余量。
+BUDGET_CHUNK_RATIO = 16
+
+# 旁路文件只收录不小于该大小的顶层字面量赋值语句。
+DEFAULT_SIDECAR_THRESHOLD = 64 * 1024
+
+SIDECAR_SUFFIX = '.literals'
+SIDECAR_MAGIC = b'PYLITSC2'
+# 头部: 魔数 | 源文件mtime_ns | 源文件大小 | 执行计划长度
+SIDECAR_HEADER = struct.Struct('<8sqqQ')
+
+# 这些关键字开头的语句属于上一条复合语句，不能在它们前面切块。
+CONTINUATION_KEYWORDS = frozenset({'else', 'elif', 'except', 'finally'})
+
+# 所有`from __future__ import ...`对应的编译标志，后续块需要继承它们。
+FUTURE_FLAGS_MASK = 0
+for _feature_name in __future__.all_feature_names:
+    FUTURE_FLAGS_MASK |= getattr(__future__, _feature_name).compiler_flag
+
+# 每次流式导入的内存报告，按导入顺序追加。
+MEMORY_REPORTS = []
+
+
+class ImportMemoryReport:
+    """一次流式导入的统计信息。"""
+
+    def __init__(self, module_name, filepath, source_bytes, memory_budget):
+        self.module_name = module_name
+        self.filepath = filepath
+        self.source_bytes = source_bytes
+        self.memory_budget = memory_budget
+        self.chunks = 0
+        self.peak_bytes = None
+        self.sidecar = None  # None / 'built' / 'hit'
+        self.elapsed = 0.0
+
+    @property
+    def over_budget(self):
+        if self.memory_budget is None or self.peak_bytes is None:
+            return False
+        return self.peak_bytes > self.memory_budget
+
+    def __repr__(self):
+        peak = 'n/a' if self.peak_bytes is None else f"{self.peak_bytes / 1024:.1f}KiB"
+        return (f"<ImportMemoryReport {self.module_name!r}: source={self.source_bytes}B "
+                f"chunks={self.chunks} peak={peak} budget={self.memory_budget} "
+                f"sidecar={self.sidecar} elapsed={self.elapsed * 1000:.1f}ms>")
+
+
+# --- 源码切块 ---
+
+class _MappedLineReader:
+    """为`tokenize`提供`readline`，并记录已读到的字节偏移。"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+
+    def readline(self):
+        end = self.buffer.find(b'\n', self.offset)
+        end = len(self.buffer) if end == -1 else end + 1
+        line = self.buffer[self.offset:end]
+        self.offset = end
+        return line
+
+
+def iter_top_level_statements(buffer):
+    """
+    逐条产出顶层语句在`buffer`中的位置。
+
+    只保留当前语句的边界信息，不会为整个文件建立行号表，
+    因此内存占用与文件大小无关。
+
+    Yields:
+        tuple: `(start_offset, end_offset, start_lineno)`。语句之间的空行和注释
+        归入后一条语句；装饰器与被装饰的定义、`if`与其`else`等总在同一条语句中。
+    """
+    reader = _MappedLineReader(buffer)
+    depth = 0
+    start, start_line = 0, 1
+    candidate = None
+    candidate_line = None
+    at_line_start = True
+    prev_was_decorator = False
+
+    for tok in tokenize.tokenize(reader.readline):
+        if tok.type == tokenize.INDENT:
+            depth += 1
+        elif tok.type == tokenize.DEDENT:
+            depth -= 1
+        elif tok.type == tokenize.NEWLINE:
+            # NEWLINE 是逻辑行的最后一个记号，此时读取位置正好在该行末尾。
+            candidate, candidate_line = reader.offset, tok.end[0] + 1
+            at_line_start = True
+        elif tok.type in (tokenize.NL, tokenize.COMMENT, tokenize.ENCODING, tokenize.ENDMARKER):
+            continue
+        elif at_line_start:
+            at_line_start = False
+            is_continuation = tok.type == tokenize.NAME and tok.string in CONTINUATION_KEYWORDS
+            if (candidate is not None and candidate > start and depth == 0
+                    and not prev_was_decorator and not is_continuation):
+                yield start, candidate, start_line
+                start, start_line = candidate, candidate_line
+            prev_was_decorator = tok.type == tokenize.OP and tok.string == '@'
+
+    if start < len(buffer):
+        yield start, len(buffer), start_line
+
+
+def iter_source_chunks(buffer, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """把相邻的顶层语句合并成大约`chunk_bytes`大小的块，产出`(start, end, lineno)`。"""
+    chunk_start = chunk_line = None
+    chunk_end = None
+    for start, end, lineno in iter_top_level_statements(buffer):
+        if chunk_start is None:
+            chunk_start, chunk_line = start, lineno
+        chunk_end = end
+        if chunk_end - chunk_start >= chunk_bytes:
+            yield chunk_start, chunk_end, chunk_line
+            chunk_start = None
+    if chunk_start is not None:
+        yield chunk_start, chunk_end, chunk_line
+
+
+class _ChunkCompiler:
+    """把源码块编译成代码对象，保持正确的行号、编码和`__future__`标志。"""
+
+    def __init__(self, buffer, filepath):
+        self.buffer = buffer
+        self.filepath = filepath
+        self.flags = 0
+        encoding, _ = tokenize.detect_encoding(_MappedLineReader(buffer).readline)
+        self.encoding = encoding
+
+    def compile(self, start, end, lineno):
+        # BOM只会出现在文件开头，由detect_encoding识别后在此跳过。
+        if start == 0 and self.buffer[:3] == b'\xef\xbb\xbf':
+            start = 3
+        chunk = self.buffer[start:end]
+        if self.encoding not in ('utf-8', 'utf-8-sig'):
+            # 编码声明只在第一块里，后续块需要先按声明的编码解码。
+            chunk = chunk.decode(self.encoding)
+            padding = '\n' * (lineno - 1)
+        else:
+            padding = b'\n' * (lineno - 1)
+        # 用空行补齐前面的行数，使回溯信息中的行号与源文件一致。
+        code = compile(padding + chunk, self.filepath, 'exec',
+                       flags=self.flags, dont_inherit=True)
+        self.flags |= code.co_flags & FUTURE_FLAGS_MASK
+        return code
+
+
+# --- 数据字面量旁路文件 ---
+
+def sidecar_path(filepath):
+    """旁路文件与模块放在同一目录: `table.py` -> `table.literals`。"""
+    return os.path.splitext(filepath)[0] + SIDECAR_SUFFIX
+
+
+def _literal_assignment(source_bytes, encoding='utf-8'):
+    """如果一段源码是`NAME = <字面量>`，返回`(name, value)`，否则返回None。"""
+    try:
+        if encoding not in ('utf-8', 'utf-8-sig'):
+            source_bytes = source_bytes.decode(encoding)
+        tree = ast.parse(source_bytes)
+    except SyntaxError:
+        return None
+    if len(tree.body) != 1 or not isinstance(tree.body[0], ast.Assign):
+        return None
+    node = tree.body[0]
+    if len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+        return None
+    try:
+        value = ast.literal_eval(node.value)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return node.targets[0].id, value
+
+
+def encode_literal(value, zero_copy=False):
+    """
+    把字面量编码成`(kind, typecode, payload)`。
+
+    `zero_copy`为True时:
+    - 全部是64位范围内整数或全部是浮点数的列表/元组 -> `'array'`，按机器字节序存原始数据。
+    - bytes -> `'bytes'`。
+    其他情况 -> `'marshal'`，读取时得到与源码中相同类型的对象。
+    """
+    if not zero_copy:
+        return 'marshal', '', marshal.dumps(value)
+    if isinstance(value, bytes):
+        return 'bytes', '', value
+    if isinstance(value, (list, tuple)) and value:
+        if all(type(item) is int for item in value):
+            if all(-(1 << 63) <= item < (1 << 63) for item in value):
+                return 'array', 'q', struct.pack(f'{len(value)}q', *value)
+        elif all(type(item) is float for item in value):
+            return 'array', 'd', struct.pack(f'{len(value)}d', *value)
+    return 'marshal', '', marshal.dumps(value)
+
+
+def decode_literal(buffer, kind, typecode, offset, length):
+    """从映射的旁路文件中取出字面量；`array`和`bytes`返回零拷贝的只读memoryview。"""
+    view = memoryview(buffer)[offset:offset + length]
+    if kind == 'array':
+        return view.cast(typecode)
+    if kind == 'bytes':
+        return view
+    value = marshal.loads(view)
+    view.release()
+    return value
+
+
+def write_sidecar(filepath, stat_result, plan, payloads, zero_copy_names=()):
+    """
+    写出旁路文件。`plan`是按源码顺序排列的执行计划:
+    `('code', start, end, lineno)`或`('literal', name, kind, typecode, index)`，
+    其中`index`指向`payloads`中的数据。数据区按8字节对齐，便于直接`cast`。
+    `zero_copy_names`随计划一起保存，配置不同的加载器不会读到类型不同的字面量。
+    """
+    offsets = []
+    position = 0
+    for payload in payloads:
+        position = (position + 7) & ~7
+        offsets.append((position, len(payload)))
+        position += len(payload)
+
+    resolved_plan = []
+    for step in plan:
+        if step[0] == 'literal':
+            _, name, kind, typecode, index = step
+            offset, length = offsets[index]
+            step = ('literal', name, kind, typecode, offset, length)
+        resolved_plan.append(step)
+    plan_blob = marshal.dumps((tuple(sorted(zero_copy_names)), resolved_plan))
+    data_start = (SIDECAR_HEADER.size + len(plan_blob) + 7) & ~7
+
+    target = sidecar_path(filepath)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, stat_result.st_mtime_ns,
+                                    stat_result.st_size, len(plan_blob)))
+        f.write(plan_blob)
+        for payload, (offset, _) in zip(payloads, offsets):
+            f.seek(data_start + offset)
+            f.write(payload)
+    # 先写临时文件再原子替换，其他进程不会读到写了一半的旁路文件。
+    os.replace(tmp_path, target)
+    return target
+
+
+def load_sidecar(filepath, stat_result, zero_copy_names=()):
+    """
+    读取并校验旁路文件。源文件的mtime或大小与记录不一致，
+    或生成时的`zero_copy_names`与当前配置不同时视为失效。
+
+    Returns:
+        tuple: `(plan, data_buffer)`，失效或不存在时返回`(None, None)`。
+    """
+    path = sidecar_path(filepath)
+    try:
+        with open(path, 'rb') as f:
+            buffer = _map_file(f)
+    except OSError:
+        return None, None
+    if len(buffer) < SIDECAR_HEADER.size:
+        return None, None
+    magic, mtime_ns, size, plan_len = SIDECAR_HEADER.unpack_from(buffer)
+    if (magic != SIDECAR_MAGIC or mtime_ns != stat_result.st_mtime_ns
+            or size != stat_result.st_size):
+        return None, None
+    recorded_names, plan = marshal.loads(buffer[SIDECAR_HEADER.size:SIDECAR_HEADER.size + plan_len])
+    if recorded_names != tuple(sorted(zero_copy_names)):
+        return None, None
+    data_start = (SIDECAR_HEADER.size + plan_len + 7) & ~7
+    return plan, memoryview(buffer)[data_start:]
+
+
+def _map_file(f, size=None):
+    """只读映射一个文件。空文件无法mmap，返回空bytes。"""
+    if size is None:
+        size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# --- 内存统计 ---
+
+class _PeakMemoryTracker:
+    """
+    用`tracemalloc`统计一段代码相对进入时的峰值内存。
+
+    已经在追踪时复用现有的追踪，但不重置全局峰值(它属于开启追踪的一方)。
+    进入之后全局峰值被刷新，说明新的峰值出现在这段代码中；否则只能取采样到的最大用量。
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.started_here = False
+        self.baseline = 0
+        self.baseline_peak = 0
+        self.sampled = 0
+        self.peak = None
+
+    def __enter__(self):
+        if self.enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_here = True
+            self.baseline, self.baseline_peak = tracemalloc.get_traced_memory()
+        return self
+
+    def current_peak(self):
+        """采样一次当前用量，返回目前为止的峰值。"""
+        current, peak = tracemalloc.get_traced_memory()
+        self.sampled = max(self.sampled, current - self.baseline)
+        if peak > self.baseline_peak:
+            return max(self.sampled, peak - self.baseline)
+        return self.sampled
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            self.peak = self.current_peak()
+            if self.started_here:
+                tracemalloc.stop()
+        return False
+
+
+# --- 加载器 ---
+
+class StreamingSourceLoader:
+    """
+    按顶层语句分块编译执行源码的加载器。
+
+    Args:
+        filepath (str): 源文件路径。
+        chunk_bytes (int): 每块源码的目标大小。
+        memory_budget (int, optional): 导入期间允许的峰值内存(字节)。
+            设置后会限制块大小并统计峰值。
+        strict_budget (bool): 超出预算时抛出ImportError，而不只是警告。
+        sidecar (bool): 启用数据字面量旁路文件。
+        sidecar_threshold (int): 收录进旁路文件的字面量语句的最小字节数。
+        zero_copy_names (iterable): 以零拷贝`memoryview`返回的字面量名称，
+            只对数值列表/元组和bytes生效；其余字面量总是还原成原来的类型。
+        measure_memory (bool): 没有预算时也统计峰值内存。
+    """
+
+    def __init__(self, filepath, chunk_bytes=DEFAULT_CHUNK_BYTES, memory_budget=None,
+                 strict_budget=False, sidecar=False,
+                 sidecar_threshold=DEFAULT_SIDECAR_THRESHOLD, zero_copy_names=(),
+                 measure_memory=False):
+        self.filepath = filepath
+        if memory_budget is not None:
+            chunk_bytes = max(1, min(chunk_bytes, memory_budget // BUDGET_CHUNK_RATIO))
+        self.chunk_bytes = chunk_bytes
+        self.memory_budget = memory_budget
+        self.strict_budget = strict_budget
+        self.sidecar = sidecar
+        self.sidecar_threshold = sidecar_threshold
+        self.zero_copy_names = frozenset(zero_copy_names)
+        self.measure_memory = measure_memory or memory_budget is not None
+        self.last_report = None
+
+    def create_module(self, spec):
+        return None  # 使用默认创建
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        with open(self.filepath, 'rb') as f:
+            stat_result = os.fstat(f.fileno())
+            buffer = _map_file(f, stat_result.st_size)
+        report = ImportMemoryReport(module.__name__, self.filepath,
+                                    stat_result.st_size, self.memory_budget)
+
+        with _PeakMemoryTracker(self.measure_memory) as tracker:
+            compiler = _ChunkCompiler(buffer, self.filepath)
+            plan, data = (None, None)
+            if self.sidecar:
+                plan, data = load_sidecar(self.filepath, stat_result, self.zero_copy_names)
+                if plan is not None:
+                    report.sidecar = 'hit'
+                else:
+                    plan, data = self._build_sidecar(buffer, stat_result, compiler.encoding)
+                    report.sidecar = 'built' if plan is not None else None
+
+            if plan is None:
+                steps = (('code', start, end, lineno)
+                         for start, end, lineno in iter_source_chunks(buffer, self.chunk_bytes))
+            else:
+                steps = plan
+
+            namespace = module.__dict__
+            for step in steps:
+                if step[0] == 'code':
+                    code = compiler.compile(*step[1:])
+                    exec(code, namespace)
+                    del code
+                else:
+                    _, name, kind, typecode, offset, length = step
+                    namespace[name] = decode_literal(data, kind, typecode, offset, length)
+                report.chunks += 1
+                # 每块之后采样一次: 追踪由别处开启时，峰值只能靠采样得到。
+                if tracker.enabled:
+                    peak = tracker.current_peak()
+                    if self.strict_budget and peak > self.memory_budget:
+                        break
+
+        report.peak_bytes = tracker.peak
+        report.elapsed = time.perf_counter() - started
+        self.last_report = report
+        MEMORY_REPORTS.append(report)
+        print(f"   [MEM] 流式执行 {report.chunks} 块, 峰值内存: "
+              f"{'未统计' if report.peak_bytes is None else f'{report.peak_bytes / 1024:.1f}KiB'}")
+
+        if report.over_budget:
+            message = (f"导入 '{module.__name__}' 的峰值内存 {report.peak_bytes}B "
+                       f"超出预算 {self.memory_budget}B")
+            if self.strict_budget:
+                raise ImportError(message)
+            print(f"   [WARN] {message}")
+
+    def _build_sidecar(self, buffer, stat_result, encoding):
+        """
+        第一次导入时生成旁路文件，并返回从新文件读出的执行计划。
+        大字面量语句逐条解析，其余语句仍按块合并。
+        """
+        plan = []
+        payloads = []
+        for start, end, lineno in iter_top_level_statements(buffer):
+            literal = None
+            if end - start >= self.sidecar_threshold:
+                literal = _literal_assignment(buffer[start:end], encoding)
+            if literal is not None:
+                name, value = literal
+                kind, typecode, payload = encode_literal(value, name in self.zero_copy_names)
+                del value
+                plan.append(('literal', name, kind, typecode, len(payloads)))
+                payloads.append(payload)
+                continue
+            last = plan[-1] if plan else None
+            if last and last[0] == 'code' and last[2] - last[1] < self.chunk_bytes:
+                plan[-1] = ('code', last[1], end, last[3])
+            else:
+                plan.append(('code', start, end, lineno))
+
+        if not payloads:
+            return None, None
+        try:
+            path = write_sidecar(self.filepath, stat_result, plan, payloads, self.zero_copy_names)
+        except OSError as e:
+            print(f"   [WARN] 无法写入旁路文件: {e}")
+            return None, None
+        del payloads
+        print(f"   [SIDECAR] 已生成数据字面量旁路文件: {path}")
+        return load_sidecar(self.filepath, stat_result, self.zero_copy_names)
+
+
+def _streaming_loader_factory(filepath, min_size=0, **options):
+    """加载模式工厂: 小于`min_size`字节的文件仍交给默认加载器。"""
+    if min_size and os.path.getsize(filepath) < min_size:
+        return None
+    return StreamingSourceLoader(filepath, **options)
+
+
+register_loader_mode('streaming', _streaming_loader_factory)
+
+
+# --- 演示区 ---
+
+if __name__ == "__main__":
+    import tempfile
+    from python_import_mechanism import set_loader_mode, python_import_simulation
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'generated_table.py'), 'w', encoding='utf-8') as f:
+            f.write('"""自动生成的查找表"""\n')
+            f.write('TABLE = [' + ', '.join(str(i) for i in range(50000)) + ']\n')
+            f.write('NAMES = {' + ', '.join(f"'k{i}': {i}" for i in range(20000)) + '}\n')
+            f.write('def lookup(i):\n    return TABLE[i]\n')
+        sys.path.insert(0, tmp)
+        # TABLE只读不改，以零拷贝的memoryview返回；NAMES仍是普通的dict。
+        previous = set_loader_mode('streaming', chunk_bytes=64 * 1024, sidecar=True,
+                                   zero_copy_names=('TABLE',), measure_memory=True)
+        try:
+            for round_name in ('首次导入(生成旁路文件)', '再次导入(读取旁路文件)'):
+                print(f"\n【{round_name}】")
+                sys.modules.pop('generated_table', None)
+                module = python_import_simulation('generated_table')
+                print(f"   lookup(12345) = {module.lookup(12345)}")
+                print(f"   {MEMORY_REPORTS[-1]}")
+        finally:
+            set_loader_mode(previous['name'], **previous['options'])
+            sys.path.remove(tmp)
+            sys.modules.pop('generated_table', None)
@@ -19,7 +19,15 @@ print("欢迎来到Python的世界！")
 # ============================================================================
 
 import sys
+import os
+import json
+import time
+import hashlib
 import platform
+import tempfile
+import importlib.util
+import importlib.machinery
+from concurrent.futures import ThreadPoolExecutor
 
 print("\n" + "="*50)
 print("Python环境信息")
@@ -81,8 +89,117 @@ import this  # 这会打印Python之禅
 # 6. 环境检查函数
 # ============================================================================
 
-def check_python_environment():
-    """检查Python环境的基本信息"""
+# 探测结果的缓存文件。同一台机器上解释器和sys.path不变时，下次启动直接复用。
+PROBE_CACHE_FILE = os.path.join(tempfile.gettempdir(), "python_env_probe_cache.json")
+
+
+def _probe_cache_key():
+    """缓存键: 解释器路径 + 版本 + sys.path，任何一项变化都会得到新的键。"""
+    raw = json.dumps([sys.executable, sys.version, sys.path])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def find_spec_without_import(module_name):
+    """
+    只查找模块规范(Spec)，不执行任何模块代码。
+
+    `importlib.util.find_spec('a.b')`会先导入父包`a`，这里改为逐级查找:
+    顶层名称交给`find_spec`，子模块在父包的搜索路径中用`PathFinder`查找。
+    """
+    parts = module_name.split(".")
+    spec = importlib.util.find_spec(parts[0])
+    for index in range(1, len(parts)):
+        if spec is None or spec.submodule_search_locations is None:
+            return None
+        fullname = ".".join(parts[:index + 1])
+        spec = importlib.machinery.PathFinder.find_spec(fullname, spec.submodule_search_locations)
+    return spec
+
+
+def _probe_module(module_name):
+    """探测单个模块，返回 (模块名, 结果)。"""
+    started = time.perf_counter()
+    try:
+        spec = find_spec_without_import(module_name)
+    except (ImportError, ValueError):
+        spec = None
+    return module_name, {
+        "available": spec is not None,
+        "origin": spec.origin if spec is not None else None,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _load_probe_cache():
+    try:
+        with open(PROBE_CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _cached_result_is_valid(result):
+    # "不可用"的结果不缓存: 安装新包不会改变缓存键，缓存它会让新装的模块一直显示为不可用。
+    if not result["available"]:
+        return False
+    # 文件被删除或移动后缓存作废；内置模块(origin为'built-in'等)没有文件可检查。
+    origin = result["origin"]
+    if origin is None or not os.path.isabs(origin):
+        return True
+    return os.path.exists(origin)
+
+
+def probe_modules(module_names, max_workers=8, use_cache=True):
+    """
+    并发探测一组模块是否可用，不执行任何模块代码。
+
+    Returns:
+        dict: 模块名 -> {"available", "origin", "seconds", "cached"}
+    """
+    key = _probe_cache_key()
+    cache = _load_probe_cache() if use_cache else {}
+    cached = cache.get(key, {})
+
+    results = {}
+    pending = []
+    for name in module_names:
+        if name in cached and _cached_result_is_valid(cached[name]):
+            results[name] = dict(cached[name], cached=True)
+        else:
+            pending.append(name)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for name, result in executor.map(_probe_module, pending):
+                results[name] = dict(result, cached=False)
+                if result["available"]:
+                    cached[name] = result
+                else:
+                    cached.pop(name, None)
+
+    if use_cache and pending:
+        # 只保留当前解释器的结果，先写临时文件再替换，避免多个进程同时写坏缓存。
+        tmp_path = f"{PROBE_CACHE_FILE}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({key: cached}, f)
+            os.replace(tmp_path, PROBE_CACHE_FILE)
+        except OSError:
+            pass
+    return results
+
+
+def check_python_environment(modules_to_check=None, probe=True, max_workers=8, use_cache=True):
+    """
+    检查Python环境的基本信息
+
+    Args:
+        modules_to_check: 要检查的模块列表，默认检查几个常用模块。
+        probe: 为True时只查找模块而不执行(快，适合大量模块)；
+            为False时用`__import__`真正导入每个模块。
+        max_workers: 探测模式下的并发线程数。
+        use_cache: 探测模式下是否复用按解释器和sys.path缓存的结果。
+    """
     print("\n" + "="*50)
     print("Python环境检查")
     print("="*50)
@@ -94,15 +211,29 @@ def check_python_environment():
         print("❌ Python版本过低，建议升级到3.6以上")
     
     # 检查常用模块
-    modules_to_check = ['os', 'sys', 'datetime', 'json', 'math']
+    if modules_to_check is None:
+        modules_to_check = ['os', 'sys', 'datetime', 'json', 'math']
     
     print("\n检查常用模块:")
-    for module_name in modules_to_check:
-        try:
-            __import__(module_name)
-            print(f"✅ {module_name} - 可用")
-        except ImportError:
-            print(f"❌ {module_name} - 不可用")
+    started = time.perf_counter()
+    if probe:
+        results = probe_modules(modules_to_check, max_workers=max_workers, use_cache=use_cache)
+        for module_name in modules_to_check:
+            result = results[module_name]
+            source = "缓存" if result["cached"] else f"{result['seconds'] * 1000:.2f}ms"
+            if result["available"]:
+                print(f"✅ {module_name} - 可用 ({source})")
+            else:
+                print(f"❌ {module_name} - 不可用 ({source})")
+    else:
+        for module_name in modules_to_check:
+            module_started = time.perf_counter()
+            try:
+                __import__(module_name)
+                print(f"✅ {module_name} - 可用 ({(time.perf_counter() - module_started) * 1000:.2f}ms)")
+            except ImportError:
+                print(f"❌ {module_name} - 不可用")
+    print(f"共检查 {len(modules_to_check)} 个模块，耗时 {(time.perf_counter() - started) * 1000:.2f}ms")
     
     print("\n🎉 环境检查完成!")
 